@@ -1,7 +1,145 @@
-from fastapi import APIRouter
+# app/api/v1/endpoints/leads.py
+import logging
+import secrets
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+
+from app.core.config import settings
+from app.core.json_codec import dumps
+from app.models.lead import LeadStatus
+from app.services.database.repository import LEAD_FIELDS, LeadPage, LeadQuery, LeadRepository
+from app.services.database.writer import lead_writer
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.get("/")
-def list_leads():
-    return [{"name": "Lead Teste", "status": "Quente"}]
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def require_api_key(authorization: Optional[str] = Header(None)):
+    # Lê e grava dados de clientes: só com "Authorization: Bearer <LEADS_API_KEY>". Sem chave
+    # configurada as rotas ficam fechadas, a não ser que LEADS_API_AUTH_DISABLED=true (desenvolvimento)
+    if settings.LEADS_API_AUTH_DISABLED:
+        return
+    if not settings.LEADS_API_KEY:
+        logger.error("❌ LEADS_API_KEY não configurada: API de leads bloqueada.")
+        raise HTTPException(status_code=503, detail="API de leads não configurada")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token, settings.LEADS_API_KEY):
+        raise HTTPException(status_code=401, detail="Não autorizado")
+
+
+async def get_lead_repository() -> LeadRepository:
+    """O mesmo repositório (cliente/pool já aberto) do LeadWriter do worker."""
+    if lead_writer.repository is None:
+        await lead_writer.start()
+    if lead_writer.repository is None:
+        raise HTTPException(status_code=503, detail=f"Banco de leads indisponível ({settings.LEADS_BACKEND})")
+    return lead_writer.repository
+
+
+def _split(values: List[str]) -> List[str]:
+    # Aceita ?status=quente&status=agendado e ?status=quente,agendado
+    return [item.strip() for value in values for item in value.split(",") if item.strip()]
+
+
+def build_query(
+    status: List[str] = Query(default=[], description="quente, agendado, morno, frio, em_atendimento"),
+    updated_after: Optional[datetime] = Query(None, description="UpdatedAt >= (ISO 8601; sem fuso = UTC)"),
+    updated_before: Optional[datetime] = Query(None, description="UpdatedAt < (ISO 8601; sem fuso = UTC)"),
+    fields: List[str] = Query(default=[], description=f"colunas: {', '.join(LEAD_FIELDS)} (padrão: todas)"),
+) -> LeadQuery:
+    try:
+        statuses = [LeadStatus.parse(value).value for value in _split(status)]
+        return LeadQuery(
+            statuses=statuses,
+            updated_after=updated_after,
+            updated_before=updated_before,
+            fields=_split(fields) or LEAD_FIELDS,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _fetch_page(repository: LeadRepository, query: LeadQuery, limit: int, cursor: Optional[str]) -> LeadPage:
+    try:
+        return await repository.list_leads(query, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ConnectionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+async def _ndjson_lines(repository: LeadRepository, query: LeadQuery, page_size: int, page: LeadPage) -> AsyncIterator[bytes]:
+    """Uma linha JSON por lead, página a página: memória limitada a uma página, qualquer que seja o total."""
+    sent = 0
+    try:
+        while True:
+            if page.items:
+                yield b"".join(dumps(item) + b"\n" for item in page.items)
+                sent += len(page.items)
+            if not page.next_cursor:
+                return
+            page = await repository.list_leads(query, page_size, page.next_cursor)
+    except Exception as e:
+        # O status 200 já foi enviado: a última linha avisa o cliente que a exportação parou no meio
+        logger.error(f"❌ Exportação de leads interrompida depois de {sent} linha(s): {e}")
+        yield dumps({"error": "exportação interrompida", "exported": sent}) + b"\n"
+
+
+@router.get("/", dependencies=[Depends(require_api_key)])
+async def list_leads(
+    query: LeadQuery = Depends(build_query),
+    limit: int = Query(settings.LEADS_PAGE_SIZE, ge=1, le=settings.LEADS_PAGE_MAX),
+    cursor: Optional[str] = Query(None, description="next_cursor da página anterior"),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="ndjson = todas as páginas em stream"),
+    accept: Optional[str] = Header(None),
+    repository: LeadRepository = Depends(get_lead_repository),
+):
+    """
+    Leads filtrados no banco por status e faixa de UpdatedAt, só com as colunas pedidas.
+    JSON: uma página ({"items", "next_cursor"}); a próxima vem com ?cursor=<next_cursor>.
+    NDJSON (?format=ndjson ou Accept: application/x-ndjson): todas as páginas (a partir do cursor,
+    se houver) em stream, um lead por linha, para exportações grandes.
+    """
+    # A primeira página sai antes da resposta: cursor inválido ou banco fora ainda viram 400/503
+    page = await _fetch_page(repository, query, limit, cursor)
+    if format == "ndjson" or NDJSON_MEDIA_TYPE in (accept or ""):
+        return StreamingResponse(_ndjson_lines(repository, query, limit, page), media_type=NDJSON_MEDIA_TYPE)
+    return Response(content=dumps({"items": page.items, "next_cursor": page.next_cursor}), media_type="application/json")
+
+
+def _field(data: Dict[str, Any], *names: str) -> Optional[str]:
+    # A ferramenta da Vapi manda os nomes em português ou inglês, conforme o prompt do assistente
+    for name in names:
+        value = data.get(name)
+        if value not in (None, ""):
+            return str(value)
+    return None
+
+
+@router.post("/", dependencies=[Depends(require_api_key), Depends(get_lead_repository)])
+async def receive_lead(data: Dict[str, Any] = Body(...)):
+    """
+    Dados do lead enviados pela ferramenta enviar_agendamento da Vapi. Entram na fila do
+    LeadWriter (mesma gravação em lote dos turnos de voz); sem telefone não há o que gravar.
+    """
+    phone = _field(data, "phone", "telefone")
+    if not phone:
+        raise HTTPException(status_code=422, detail="Campo 'phone' obrigatório")
+    status = _field(data, "status") or "Agendado"
+    try:
+        LeadStatus.parse(status)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Status inválido: {status!r}")
+    await lead_writer.submit(
+        phone=phone,
+        name=_field(data, "name", "nome"),
+        status=status,
+        summary=_field(data, "summary", "resumo"),
+    )
+    return {"status": "success", "message": "Lead guardado com sucesso"}
@@ -1,11 +1,12 @@
 # app/api/v1/endpoints/webhook.py
 from fastapi import APIRouter, BackgroundTasks, Request
-from app.services.orchestrator import ConversationOrchestrator
-# Importação protegida: Se o banco não existir, não quebra o código
-try:
-    from app.services.database.storage import LeadsRepository
-except ImportError:
-    LeadsRepository = None
+from fastapi.responses import StreamingResponse
+from app.core.telemetry import observe_stage, span, start_turn, traced_stream
+from app.api.v1.openai_compat import FALLBACK_MESSAGE, completion_response, iter_text, sse_completion_stream
+from app.api.v1.schemas import DEFAULT_MODEL, VapiTurn
+from app.services.registry import engine_registry
+# Gravador de leads do worker; sem SDK/driver do LEADS_BACKEND ele só descarta (não quebra o código)
+from app.services.database.writer import lead_writer
 
 import time
 import logging
@@ -17,120 +18,119 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def save_lead_background(phone: str, message: str, response: str):
+async def save_lead_background(phone: str, message: str, response: str, call_id: str = None):
     """
     Função BLINDADA para salvar dados.
-    Se o banco falhar, ela morre silenciosamente sem derrubar a API.
+    Só enfileira no LeadWriter do worker (gravação em lote); se o banco falhar,
+    ela morre silenciosamente sem derrubar a API.
     """
-    try:
-        # Verifica se o repositório foi importado corretamente
-        if LeadsRepository is None:
-            logger.warning("⚠️ LeadsRepository não encontrado. Pulando salvamento.")
-            return
+    with span("persist", call_id=call_id):
+        try:
+            # Verifica se o repositório foi importado corretamente
+            if lead_writer is None:
+                logger.warning("⚠️ LeadWriter não encontrado. Pulando salvamento.")
+                return
 
-        if not phone or phone == "unknown":
-            return
+            if not phone or phone == "unknown":
+                return
 
-        # Tenta conectar e salvar
-        print(f"💾 Tentando salvar lead: {phone}...")
-        repo = LeadsRepository()
-        
-        repo.save_lead(
-            phone=phone,
-            name="Lead Vapi",
-            status="Em Atendimento",
-            summary=f"User: {message[:50]}... | IA: {response[:50]}..."
-        )
-        print("✅ Lead salvo com sucesso!")
+            await lead_writer.submit(
+                phone=phone,
+                name="Lead Vapi",
+                status="Em Atendimento",
+                summary=f"User: {message[:50]}... | IA: {response[:50]}..."
+            )
 
-    except Exception as e:
-        # Se der erro aqui, APENAS loga. Não deixa subir erro pra API.
-        logger.error(f"⚠️ Erro SILENCIOSO no banco de dados (Ignorado): {e}")
+        except Exception as e:
+            # Se der erro aqui, APENAS loga. Não deixa subir erro pra API.
+            logger.error(f"⚠️ Erro SILENCIOSO no banco de dados (Ignorado): {e}")
 
 
 @router.post("/vapi/chat/completions")
 async def vapi_webhook(request: Request, background_tasks: BackgroundTasks):
     """
-    Endpoint compatível com Vapi Custom LLM.
+    Endpoint compatível com Vapi Custom LLM (único ponto de entrada dos turnos de voz).
+    O corpo é lido como bytes e decodificado uma vez (VapiTurn): só os campos usados são validados.
     Agora com resposta de erro 100% compatível com a Vapi.
     """
     # Prepara IDs para garantir resposta válida mesmo no erro
     request_id = f"chatcmpl-{uuid.uuid4()}"
     timestamp = int(time.time())
+    parse_started = time.perf_counter()
+    trace = None
+    model = DEFAULT_MODEL
 
     try:
-        payload = await request.json()
-        
-        # 1. Extração de Dados (Com proteção extra)
-        messages = payload.get("messages", [])
-        user_message = ""
-        # Pega a última mensagem válida do usuário
-        for msg in reversed(messages):
-            if msg.get("role") == "user":
-                user_message = msg.get("content", "")
-                break
-        
-        call_data = payload.get("call", {})
-        call_id = call_data.get("id", "unknown")
-        
-        customer_phone = "unknown"
-        if "customer" in call_data and "number" in call_data["customer"]:
-            customer_phone = call_data["customer"]["number"]
-            
+        turn = VapiTurn.from_bytes(await request.body())
+
+        # 1. Extração de Dados (só o que o turno usa: última fala, call.id, telefone)
+        user_message = turn.user_message
+        call_id = turn.call_id
+        customer_phone = turn.customer_phone
+        model = turn.model
+
+        # Cronometragem do turno (histogramas no /metrics + uma linha JSON por turno)
+        trace = start_turn(call_id, route="webhook", stream=turn.stream, started=parse_started)
+        observe_stage("parse", time.perf_counter() - parse_started, parse_started)
         logger.info(f"📞 Chamada {call_id} | Tel: {customer_phone} | Msg: {user_message}")
 
         # 2. Proteção contra silêncio
+        greeting = None
         if not user_message:
-            ai_response = "Olá, aqui é da Barcelona Partners. Com quem eu falo?"
+            greeting = "Olá, aqui é da Barcelona Partners. Com quem eu falo?"
+
+        # 2.1 Modo stream=true: tokens saem como SSE enquanto o agente ainda gera
+        if turn.stream:
+            orchestrator = engine_registry.get_orchestrator()
+            # O histórico da Vapi (turn.transcript) só é montado se a memória não tiver a ligação
+            tokens = iter_text(greeting) if greeting else orchestrator.stream_response(user_message, call_id, turn.transcript)
+            spoken = {}
+
+            # Roda depois que o stream termina (BackgroundTasks do FastAPI)
+            async def save_after_stream():
+                await save_lead_background(
+                    phone=customer_phone,
+                    message=user_message,
+                    response=spoken.get("text", ""),
+                    call_id=call_id
+                )
+
+            background_tasks.add_task(save_after_stream)
+            return StreamingResponse(
+                sse_completion_stream(
+                    traced_stream(trace, tokens),
+                    model=model,
+                    request_id=request_id,
+                    on_complete=lambda text: spoken.update(text=text),
+                ),
+                media_type="text/event-stream",
+            )
+
+        if greeting:
+            ai_response = greeting
         else:
             # 3. O Cérebro Trabalha
-            orchestrator = ConversationOrchestrator()
-            ai_response = await orchestrator.get_response(user_message, call_id)
+            orchestrator = engine_registry.get_orchestrator()
+            ai_response = await orchestrator.get_response(user_message, call_id, turn.transcript)
 
         # 4. Salva no Banco (Sem risco de travar)
         background_tasks.add_task(
             save_lead_background, 
             phone=customer_phone, 
             message=user_message, 
-            response=ai_response
+            response=ai_response,
+            call_id=call_id
         )
 
         # 5. Resposta OFICIAL (Sucesso)
-        return {
-            "id": request_id,
-            "object": "chat.completion",
-            "created": timestamp,
-            "model": "gpt-4o",
-            "choices": [
-                {
-                    "index": 0,
-                    "message": {
-                        "role": "assistant",
-                        "content": ai_response
-                    },
-                    "finish_reason": "stop"
-                }
-            ]
-        }
+        trace.finish()
+        return completion_response(ai_response, model=model, request_id=request_id, created=timestamp)
         
     except Exception as e:
         logger.error(f"❌ ERRO CRÍTICO NO WEBHOOK: {str(e)}")
+        if trace is not None:
+            trace.finish("error")
         
         # 🚨 FALLBACK DE EMERGÊNCIA (CORRIGIDO) 🚨
         # Agora devolvemos um JSON completo. Antes faltavam campos e a Vapi dava 500.
-        return {
-            "id": request_id,  # Essencial
-            "object": "chat.completion", # Essencial
-            "created": timestamp, # Essencial
-            "model": "gpt-4o",
-            "choices": [
-                {
-                    "index": 0,
-                    "message": {
-                        "role": "assistant",
-                        "content": "Desculpe, a ligação cortou um pouquinho. Poderia repetir?"
-                    },
-                    "finish_reason": "stop"
-                }
-            ]
-        }
\ No newline at end of file
+        return completion_response(FALLBACK_MESSAGE, model=model, request_id=request_id, created=timestamp)
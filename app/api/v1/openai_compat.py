@@ -0,0 +1,105 @@
+# app/api/v1/openai_compat.py
+import logging
+import time
+import uuid
+from typing import AsyncIterator, Callable, Optional
+
+from fastapi.responses import Response
+
+from app.core.json_codec import dumps
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_MESSAGE = "Desculpe, a ligação cortou um pouquinho. Poderia repetir?"
+
+
+def new_completion_id() -> str:
+    return f"chatcmpl-{uuid.uuid4().hex}"
+
+
+def build_completion(content: str, model: str, request_id: str = None, created: int = None) -> dict:
+    """Resposta completa no formato `chat.completion` (padrão OpenAI) que a Vapi espera."""
+    return {
+        "id": request_id or new_completion_id(),
+        "object": "chat.completion",
+        "created": created or int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": content
+                },
+                "finish_reason": "stop",
+            }
+        ]
+    }
+
+
+def completion_response(content: str, model: str, request_id: str = None, created: int = None) -> Response:
+    """build_completion já serializado (orjson), sem passar pelo jsonable_encoder do FastAPI."""
+    return Response(content=dumps(build_completion(content, model, request_id, created)), media_type="application/json")
+
+
+def build_chunk(request_id: str, created: int, model: str, delta: dict, finish_reason: Optional[str] = None) -> dict:
+    """Um pedaço `chat.completion.chunk` do modo stream=true."""
+    return {
+        "id": request_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "delta": delta,
+                "finish_reason": finish_reason,
+            }
+        ]
+    }
+
+
+async def iter_text(text: str) -> AsyncIterator[str]:
+    """Embrulha um texto pronto como stream de um único token (ex.: saudação fixa)."""
+    yield text
+
+
+def _sse(data: dict) -> bytes:
+    return b"data: " + dumps(data) + b"\n\n"
+
+
+async def sse_completion_stream(
+    tokens: AsyncIterator[str],
+    model: str,
+    request_id: str = None,
+    on_complete: Callable[[str], None] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Converte os tokens do LLMEngine em server-sent events compatíveis com a OpenAI.
+    O primeiro evento (role) sai imediatamente, para a Vapi já abrir o canal de TTS.
+    Se o agente falhar no meio, fecha o stream com a frase de fallback em vez de cortar a ligação.
+    """
+    request_id = request_id or new_completion_id()
+    created = int(time.time())
+    parts = []
+
+    yield _sse(build_chunk(request_id, created, model, {"role": "assistant", "content": ""}))
+
+    try:
+        async for token in tokens:
+            if not token:
+                continue
+            parts.append(token)
+            yield _sse(build_chunk(request_id, created, model, {"content": token}))
+    except Exception as e:
+        logger.error(f"❌ ERRO NO STREAM: {e}")
+        # Só fala o fallback se nada foi dito ainda; senão apenas encerra a frase
+        if not parts:
+            parts.append(FALLBACK_MESSAGE)
+            yield _sse(build_chunk(request_id, created, model, {"content": FALLBACK_MESSAGE}))
+
+    yield _sse(build_chunk(request_id, created, model, {}, finish_reason="stop"))
+    yield b"data: [DONE]\n\n"
+
+    if on_complete is not None:
+        on_complete("".join(parts))
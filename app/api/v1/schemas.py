@@ -0,0 +1,92 @@
+# app/api/v1/schemas.py
+from typing import List
+
+from app.core.json_codec import loads
+from app.services.memory import history_from_openai_messages
+
+DEFAULT_MODEL = "gpt-4o"
+UNKNOWN = "unknown"
+
+_UNSET = object()
+
+
+class PayloadError(ValueError):
+    """Payload da Vapi fora do formato esperado (JSON inválido ou campo usado com tipo errado)."""
+
+
+class VapiTurn:
+    """
+    Um turno do Custom LLM da Vapi, só com o que o webhook usa: última fala do cliente,
+    call.id, telefone do cliente, stream e model.
+    A Vapi manda o histórico inteiro e o objeto `call` completo a cada turno; o corpo é
+    decodificado uma vez (orjson) e cada campo só é validado quando alguém o lê.
+    O histórico só vira lista de mensagens se a memória não tiver a sessão da ligação.
+    """
+
+    __slots__ = ("_data", "_user_message", "_transcript")
+
+    def __init__(self, data: dict):
+        if not isinstance(data, dict):
+            raise PayloadError("o corpo precisa ser um objeto JSON")
+        self._data = data
+        self._user_message = _UNSET
+        self._transcript = _UNSET
+
+    @classmethod
+    def from_bytes(cls, body: bytes) -> "VapiTurn":
+        try:
+            data = loads(body)
+        except ValueError as e:
+            raise PayloadError(f"JSON inválido: {e}") from e
+        return cls(data)
+
+    @property
+    def messages(self) -> list:
+        messages = self._data.get("messages") or []
+        if not isinstance(messages, list):
+            raise PayloadError("`messages` precisa ser uma lista")
+        return messages
+
+    @property
+    def user_message(self) -> str:
+        # Varre de trás para frente e para na última fala do cliente
+        if self._user_message is _UNSET:
+            text = ""
+            for message in reversed(self.messages):
+                if isinstance(message, dict) and message.get("role") == "user":
+                    content = message.get("content")
+                    text = content if isinstance(content, str) else ""
+                    break
+            self._user_message = text
+        return self._user_message
+
+    @property
+    def _call(self) -> dict:
+        call = self._data.get("call")
+        return call if isinstance(call, dict) else {}
+
+    @property
+    def call_id(self) -> str:
+        call_id = self._call.get("id")
+        return call_id if isinstance(call_id, str) and call_id else UNKNOWN
+
+    @property
+    def customer_phone(self) -> str:
+        customer = self._call.get("customer")
+        number = customer.get("number") if isinstance(customer, dict) else None
+        return number if isinstance(number, str) and number else UNKNOWN
+
+    @property
+    def stream(self) -> bool:
+        return self._data.get("stream") is True
+
+    @property
+    def model(self) -> str:
+        model = self._data.get("model")
+        return model if isinstance(model, str) and model else DEFAULT_MODEL
+
+    def transcript(self) -> List[dict]:
+        """Histórico no formato da ConversationMemory (montado na primeira chamada)."""
+        if self._transcript is _UNSET:
+            self._transcript = history_from_openai_messages(self.messages)
+        return self._transcript
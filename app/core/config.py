@@ -12,13 +12,119 @@ class Settings(BaseSettings):
     # --- Chaves de API ---
     OPENAI_API_KEY: str
     VAPI_API_KEY: str
+
+    # --- LLM / Conexões com a OpenAI ---
+    OPENAI_MODEL: str = "gpt-4o-mini"
+    OPENAI_BASE_URL: Optional[str] = None  # None = endpoint oficial da OpenAI
+    OPENAI_HTTP_MAX_CONNECTIONS: int = 20
+    OPENAI_HTTP_KEEPALIVE_SECONDS: float = 60.0
+    WARMUP_ON_STARTUP: bool = True
+    # Modelo menor usado quando o agente estoura o orçamento de latência (sem ferramentas)
+    DEGRADED_OPENAI_MODEL: str = "gpt-4.1-nano"
+    AGENT_VERBOSE: bool = False  # True = AgentExecutor imprime as chains inteiras (só para debug local)
     
     # --- Banco de Dados Vetorial ---
     PINECONE_API_KEY: str
     PINECONE_ENV: str = "us-east-1"
+    PINECONE_INDEX_NAME: str = "barcelona-index"
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    RAG_TOP_K: int = 3
+    # Busca na base começa junto com o planejamento do LLM (resultado entregue à ferramenta)
+    RAG_SPECULATIVE_PREFETCH: bool = True
+    # Perguntas de regras/funcionamento: trechos direto no prompt, sem o loop de ferramentas
+    RAG_SINGLE_SHOT: bool = False
+    VECTOR_BACKEND: str = "pinecone"  # "pinecone" ou "local" (NumPy em memória, sem rede)
+    LOCAL_INDEX_DIR: str = "data/local_index"
+    INGEST_MANIFEST_FILE: str = "data/ingest_manifest.json"
+    INGEST_EMBED_BATCH_SIZE: int = 128
+    INGEST_EMBED_CONCURRENCY: int = 4
+    PRICE_TABLES_DIR: str = "data/price_tables"  # grade crédito x prazo extraída dos PDFs de Tabelas
+    LEXICAL_INDEX_DIR: str = "data/lexical_index"  # BM25 dos mesmos trechos (gerado pelo scripts/ingest.py)
+    # Busca híbrida: vetorial + BM25 fundidos por reciprocal-rank fusion (códigos como PSE/SUE/TPF batem exato)
+    RAG_HYBRID_ENABLED: bool = True
+    # Administradora/tipo do bem citados na pergunta viram filtro de metadados antes da busca
+    RAG_ENTITY_FILTERS: bool = True
+    RAG_HYBRID_CANDIDATES: int = 10  # candidatos de cada lista antes da fusão
+    RAG_RRF_K: int = 60
+
+    # --- Cache da Base de Conhecimento (embeddings + resultados) ---
+    RAG_CACHE_ENABLED: bool = True
+    RAG_CACHE_MAX_ENTRIES: int = 2048
+    RAG_CACHE_TTL_SECONDS: int = 3600
+    REDIS_URL: Optional[str] = None  # ex.: redis://redis:6379/0 (docker-compose)
+    INDEX_VERSION_FILE: str = "data/index_version"
+    INDEX_VERSION_CHECK_SECONDS: float = 30.0
+
+    # --- Fast path (respostas sem LLM para intents conhecidas) ---
+    INTENT_ROUTER_ENABLED: bool = True
+    INTENT_CLASSIFIER_ENABLED: bool = True  # similaridade local com frases de exemplo, além das regras
+    INTENT_CLASSIFIER_THRESHOLD: float = 0.8
+
+    # --- Cache semântico de respostas (FAQ repetida não passa pelo agente) ---
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_THRESHOLD: float = 0.93  # similaridade de cosseno mínima entre as perguntas
+    ANSWER_CACHE_MAX_ENTRIES: int = 512
+    ANSWER_CACHE_TTL_SECONDS: int = 86400
+
+    # --- Orçamento de latência do turno (silêncio máximo que o cliente ouve) ---
+    TURN_LATENCY_BUDGET_SECONDS: float = 4.0
+    RAG_TIMEOUT_SECONDS: float = 1.5  # busca na base; estourou = agente responde sem o manual
+    MEMORY_TIMEOUT_SECONDS: float = 0.3  # leitura/gravação da sessão (Redis); estourou = usa o histórico da Vapi
+    ANSWER_CACHE_TIMEOUT_SECONDS: float = 0.5  # embedding da pergunta para o cache; estourou = miss
+    DEGRADED_RESERVE_SECONDS: float = 1.2  # tempo guardado para o modelo menor se o agente atrasar
+    LLM_HEDGE_ENABLED: bool = True
+    LLM_HEDGE_AFTER_SECONDS: float = 1.0  # hedge de cada requisição ao LLM antes de haver amostras para o p95
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    BRIDGE_MESSAGE: str = "Só um instante, estou conferindo essa informação para você."
+
+    # --- Orçamento de tokens do prompt (o prefixo fixo vai primeiro, para o cache de prompt da OpenAI) ---
+    PROMPT_KNOWLEDGE_TOKEN_BUDGET: int = 900  # soma dos trechos da base num turno
+    PROMPT_CHUNK_TOKEN_LIMIT: int = 350  # cada trecho
+    PROMPT_HISTORY_TOKEN_BUDGET: int = 1500  # teto do histórico (resumo + falas) enviado ao LLM
+    PROMPT_CACHE_KEY: Optional[str] = None  # ex.: "barcelona-tina"; agrupa as chamadas no mesmo cache da OpenAI
+
+    # --- Memória da Ligação (histórico por call.id da Vapi) ---
+    MEMORY_TOKEN_BUDGET: int = 1500  # teto do histórico no prompt (resumo + janela recente)
+    MEMORY_SUMMARY_TOKENS: int = 200
+    MEMORY_SUMMARIZE: bool = True  # resume por LLM em segundo plano; False = só janela + resumo simples
+    MEMORY_TTL_SECONDS: int = 7200
+    MEMORY_MAX_SESSIONS: int = 2000
 
     # --- Banco de Dados de Leads ---
+    LEADS_BACKEND: str = "table_storage"  # "table_storage" (Azure) ou "postgres" (DATABASE_URL)
     AZURE_STORAGE_CONNECTION_STRING: str = "UseDevelopmentStorage=true"
+    DATABASE_URL: Optional[str] = None  # ex.: postgresql+asyncpg://postgres:postgres@db:5432/barcelona_db
+    # Pool do asyncpg por worker: 4 workers x (5 + 5) fica abaixo do max_connections=100 do Postgres
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 5
+    DB_POOL_TIMEOUT_SECONDS: float = 5.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_STATEMENT_TIMEOUT_MS: int = 5000
+    # Listagem GET /api/v1/leads/ (página padrão/máxima) e chave exigida no Authorization: Bearer
+    LEADS_PAGE_SIZE: int = 100
+    LEADS_PAGE_MAX: int = 1000
+    LEADS_API_KEY: Optional[str] = None  # sem chave a listagem responde 503 (fechada por padrão)
+    LEADS_API_AUTH_DISABLED: bool = False  # só desenvolvimento: libera a listagem sem chave, explicitamente
+    LEADS_WRITER_FLUSH_SECONDS: float = 0.5  # janela para juntar turnos do mesmo telefone
+    LEADS_WRITER_QUEUE_SIZE: int = 1000
+    LEADS_WRITER_MAX_ATTEMPTS: int = 4  # flushes que um lead tenta antes de contar como "failed"
+    LEADS_WRITER_RETRY_SECONDS: float = 1.0  # espera antes de regravar um lote que falhou (dobra a cada tentativa)
+
+    # --- Outbox de notificações do CRM (alerta de lead quente para a closer) ---
+    OUTBOX_BACKEND: str = "sqlite"  # "sqlite" (arquivo local, padrão) ou "postgres" (DATABASE_URL)
+    OUTBOX_SQLITE_PATH: str = "data/outbox.db"  # no backend postgres, vira o spool local do append
+    OUTBOX_FLUSH_SECONDS: float = 1.0  # janela para juntar eventos num lote depois de um append
+    OUTBOX_POLL_SECONDS: float = 5.0  # varredura de retries vencidos e eventos de outros workers
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_DEDUPE_WINDOW_SECONDS: float = 1800.0  # no máximo um alerta por telefone nessa janela
+    OUTBOX_MAX_ATTEMPTS: int = 8  # depois disso o evento fica "failed"
+    OUTBOX_BACKOFF_BASE_SECONDS: float = 5.0  # 5s, 10s, 20s... com jitter
+    OUTBOX_BACKOFF_MAX_SECONDS: float = 600.0
+    OUTBOX_LEASE_SECONDS: float = 60.0  # evento pego por um worker que morreu volta a ficar pendente
+    OUTBOX_RETENTION_DAYS: int = 7  # eventos entregues/descartados mais velhos que isso são apagados
+    CRM_WEBHOOK_URL: Optional[str] = None  # POST com o lote de alertas; None = só registra no log
+    CRM_WEBHOOK_TOKEN: Optional[str] = None  # enviado como Authorization: Bearer
+    CRM_WEBHOOK_TIMEOUT_SECONDS: float = 5.0
 
     # --- Negócio ---
     DEFAULT_CLOSER_NAME: str = "Fernanda Aro"
@@ -0,0 +1,22 @@
+# app/core/json_codec.py
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """JSON -> objetos Python (orjson quando instalado: várias vezes mais rápido que o json)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Objetos Python -> JSON em UTF-8 (acentos sem escape, como o ensure_ascii=False)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
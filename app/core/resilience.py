@@ -0,0 +1,167 @@
+# app/core/resilience.py
+import asyncio
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+from app.core.config import settings
+from app.core.telemetry import count_hedge
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_current_budget: ContextVar[Optional["TurnBudget"]] = ContextVar("barcelona_budget", default=None)
+
+
+class TurnBudget:
+    """
+    Orçamento de latência do turno: quanto silêncio o cliente ainda pode ouvir.
+    Cada etapa (LLM, busca na base) pede seu timeout aqui e nunca passa do que sobrou.
+    """
+
+    def __init__(self, seconds: float = None, started: float = None):
+        self.seconds = seconds if seconds is not None else settings.TURN_LATENCY_BUDGET_SECONDS
+        self.started = started if started is not None else time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def remaining(self, reserve: float = 0.0) -> float:
+        """Tempo que sobra, guardando `reserve` segundos para as etapas seguintes."""
+        return max(self.seconds - self.elapsed() - reserve, 0.0)
+
+    def stage_timeout(self, limit: float, reserve: float = 0.0) -> float:
+        return min(limit, self.remaining(reserve))
+
+
+def start_budget(seconds: float = None, started: float = None) -> TurnBudget:
+    """Abre o orçamento no contexto atual; `started` = chegada da requisição (mesmo relógio do TurnTrace)."""
+    budget = TurnBudget(seconds, started)
+    _current_budget.set(budget)
+    return budget
+
+
+def current_budget() -> TurnBudget:
+    # Fora de um turno (scripts, testes manuais) cada chamada ganha o orçamento inteiro
+    return _current_budget.get() or TurnBudget()
+
+
+class HedgePolicy:
+    """
+    Quando disparar a requisição duplicada: no p95 das últimas execuções bem-sucedidas.
+    Até juntar amostras suficientes usa o valor fixo do Settings.
+    """
+
+    def __init__(self, default_after: float = None, min_samples: int = None, window: int = 200):
+        self.default_after = default_after if default_after is not None else settings.LLM_HEDGE_AFTER_SECONDS
+        self.min_samples = min_samples or settings.LLM_HEDGE_MIN_SAMPLES
+        self._samples = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def delay(self) -> Optional[float]:
+        """Segundos até o hedge (None = hedge desligado)."""
+        if not settings.LLM_HEDGE_ENABLED:
+            return None
+        if len(self._samples) < self.min_samples:
+            return self.default_after
+        ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+
+async def _cancel(tasks):
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def hedged_call(factory: Callable[[], Awaitable[T]], policy: HedgePolicy) -> T:
+    """
+    Roda `factory()`; se passar do p95 sem responder, dispara uma cópia e fica com a primeira
+    que terminar bem. A outra é cancelada (o httpx fecha a requisição em andamento).
+    """
+    started = time.perf_counter()
+    pending = {asyncio.ensure_future(factory())}
+    hedge_after = policy.delay()
+    error: Optional[BaseException] = None
+    try:
+        done, _ = await asyncio.wait(pending, timeout=hedge_after)
+        if not done:
+            pending.add(asyncio.ensure_future(factory()))
+            count_hedge("launched")
+        hedged = len(pending) > 1
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if hedged:
+                        count_hedge("completed")
+                    policy.observe(time.perf_counter() - started)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        await _cancel(pending)
+
+
+async def hedged_stream(factory: Callable[[], AsyncIterator[str]], policy: HedgePolicy) -> AsyncIterator[str]:
+    """
+    Versão em streaming do hedged_call: a corrida é pelo primeiro token (o que o cliente ouve).
+    O stream que falar primeiro segue até o fim; o outro é cancelado e fechado.
+    """
+    started = time.perf_counter()
+    streams = {}
+
+    def launch():
+        stream = factory().__aiter__()
+        streams[asyncio.ensure_future(stream.__anext__())] = stream
+
+    launch()
+    winner, first = None, None
+    error: Optional[BaseException] = None
+    try:
+        done, _ = await asyncio.wait(set(streams), timeout=policy.delay())
+        if not done:
+            launch()
+            count_hedge("launched")
+        hedged = len(streams) > 1
+        while streams and winner is None:
+            done, _ = await asyncio.wait(set(streams), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                stream = streams.pop(task)
+                if task.exception() is None:
+                    winner, first = stream, task.result()
+                    break
+                error = task.exception()
+                if isinstance(error, StopAsyncIteration):
+                    winner = stream  # stream vazio: nada a falar, mas terminou bem
+                    break
+        if winner is None:
+            raise error
+        if hedged and first is not None:
+            count_hedge("completed")
+        policy.observe(time.perf_counter() - started)
+    finally:
+        losers = list(streams.items())
+        await _cancel([task for task, _stream in losers])
+        for _task, stream in losers:
+            try:
+                await stream.aclose()
+            except Exception:
+                pass
+
+    if first is None:
+        return
+    yield first
+    async for token in winner:
+        yield token
+
+
+async def first_token(stream: AsyncIterator[str], timeout: float) -> str:
+    """Primeiro token do stream em até `timeout` segundos (TimeoutError se o cliente ficaria no silêncio)."""
+    return await asyncio.wait_for(stream.__anext__(), timeout)
@@ -0,0 +1,220 @@
+# app/core/telemetry.py
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        CollectorRegistry,
+        Counter,
+        Histogram,
+        generate_latest,
+        multiprocess,
+    )
+except ImportError:
+    Histogram = None
+
+# Tamanho das seções do prompt (tokens): de uma fala curta até o prompt inteiro com trechos da base
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 1536, 2048, 3072, 4096, 6144, 8192)
+
+# Buckets pensados para voz: de cache hit (ms) até turnos que já estouraram o tempo do usuário
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 8.0, 13.0)
+
+if Histogram is not None:
+    TURN_SECONDS = Histogram(
+        "barcelona_turn_seconds", "Duração total de um turno de voz", ["route", "stream", "status"],
+        buckets=LATENCY_BUCKETS,
+    )
+    STAGE_SECONDS = Histogram(
+        "barcelona_turn_stage_seconds", "Duração de cada etapa do turno (parse, LLM, ferramentas, banco...)", ["stage"],
+        buckets=LATENCY_BUCKETS,
+    )
+    TOOL_CALLS = Counter("barcelona_tool_calls_total", "Chamadas de ferramentas do agente", ["tool", "status"])
+    INTENT_TURNS = Counter(
+        "barcelona_intent_turns_total", "Turnos por intent: respondidos no fast path ou enviados ao agente",
+        ["intent", "path"],
+    )
+    ANSWER_CACHE = Counter(
+        "barcelona_answer_cache_total", "Consultas ao cache semântico de respostas", ["result"],
+    )
+    DEGRADED_TURNS = Counter(
+        "barcelona_degraded_total", "Degradações por estouro do orçamento de latência", ["tier"],
+    )
+    LLM_HEDGES = Counter("barcelona_llm_hedges_total", "Requisições duplicadas (hedge) ao LLM", ["outcome"])
+    PROMPT_TOKENS = Histogram(
+        "barcelona_prompt_tokens", "Tokens por seção do prompt (system, tools, history, input, knowledge...)",
+        ["section"], buckets=TOKEN_BUCKETS,
+    )
+else:
+    TURN_SECONDS = STAGE_SECONDS = TOOL_CALLS = INTENT_TURNS = ANSWER_CACHE = None
+    DEGRADED_TURNS = LLM_HEDGES = PROMPT_TOKENS = None
+
+# Logs estruturados (uma linha JSON por turno) separados do log de texto da aplicação
+telemetry_logger = logging.getLogger("barcelona.telemetry")
+if not telemetry_logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    telemetry_logger.addHandler(_handler)
+    telemetry_logger.setLevel(logging.INFO)
+    telemetry_logger.propagate = False
+
+_current_turn: ContextVar[Optional["TurnTrace"]] = ContextVar("barcelona_turn", default=None)
+
+
+def _log(event: dict):
+    telemetry_logger.info(json.dumps(event, ensure_ascii=False, default=str))
+
+
+class TurnTrace:
+    """Etapas cronometradas de um turno de voz, identificadas pelo call.id da Vapi."""
+
+    def __init__(self, call_id: str, route: str, stream: bool = False, started: float = None):
+        self.call_id = call_id
+        self.route = route
+        self.stream = stream
+        self.started = started if started is not None else time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []  # (etapa, início relativo, duração)
+        self.degraded: List[str] = []
+        self.tokens: Dict[str, int] = {}  # seção do prompt -> tokens (somados entre as chamadas do turno)
+        self.finished = False
+
+    def record(self, stage: str, seconds: float, started: float = None):
+        offset = (started if started is not None else time.perf_counter() - seconds) - self.started
+        self.spans.append((stage, offset, seconds))
+
+    def finish(self, status: str = "ok"):
+        if self.finished:
+            return
+        self.finished = True
+        total = time.perf_counter() - self.started
+        if TURN_SECONDS is not None:
+            TURN_SECONDS.labels(self.route, str(self.stream).lower(), status).observe(total)
+
+        stages: Dict[str, float] = {}
+        for stage, _offset, seconds in self.spans:
+            stages[stage] = stages.get(stage, 0.0) + seconds
+        _log({
+            "event": "turn",
+            "call_id": self.call_id,
+            "route": self.route,
+            "stream": self.stream,
+            "status": status,
+            "total_ms": round(total * 1000, 1),
+            "degraded": self.degraded,
+            "tokens": self.tokens,
+            "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in stages.items()},
+            "spans": [
+                {"stage": stage, "start_ms": round(offset * 1000, 1), "ms": round(seconds * 1000, 1)}
+                for stage, offset, seconds in self.spans
+            ],
+        })
+
+
+def current_turn() -> Optional[TurnTrace]:
+    return _current_turn.get()
+
+
+def start_turn(call_id: str, route: str, stream: bool = False, started: float = None) -> TurnTrace:
+    """
+    Abre o turno no contexto atual (as etapas registradas daqui em diante entram nele).
+    `started` permite contar desde a chegada da requisição, antes de saber o call.id.
+    """
+    trace = TurnTrace(call_id, route, stream, started)
+    _current_turn.set(trace)
+    return trace
+
+
+def observe_stage(stage: str, seconds: float, started: float = None, call_id: str = None):
+    """Registra uma etapa no histograma e no turno atual (ou num log avulso, se o turno já fechou)."""
+    if STAGE_SECONDS is not None:
+        STAGE_SECONDS.labels(stage).observe(seconds)
+    trace = current_turn()
+    if trace is not None and not trace.finished:
+        trace.record(stage, seconds, started)
+    else:
+        # Ex.: gravação do lead em BackgroundTasks, depois da resposta já ter saído
+        _log({
+            "event": "stage",
+            "call_id": call_id or (trace.call_id if trace else None),
+            "stage": stage,
+            "ms": round(seconds * 1000, 1),
+        })
+
+
+def count_intent(intent: str, fast_path: bool):
+    """Conta o turno por intent (fast_path=True = respondido sem LLM)."""
+    if INTENT_TURNS is not None:
+        INTENT_TURNS.labels(intent, "fast" if fast_path else "agent").inc()
+
+
+def count_answer_cache(result: str):
+    """result: hit, miss, skipped (turno com dado pessoal) ou stored."""
+    if ANSWER_CACHE is not None:
+        ANSWER_CACHE.labels(result).inc()
+
+
+def count_degradation(tier: str):
+    """tier: skip_rag (busca na base estourou), small_model ou bridge (frase de espera)."""
+    if DEGRADED_TURNS is not None:
+        DEGRADED_TURNS.labels(tier).inc()
+    trace = current_turn()
+    if trace is not None and not trace.finished:
+        trace.degraded.append(tier)
+
+
+def record_tokens(section: str, tokens: int):
+    """Tokens de uma seção do prompt no turno atual (e no histograma do /metrics)."""
+    if PROMPT_TOKENS is not None:
+        PROMPT_TOKENS.labels(section).observe(tokens)
+    trace = current_turn()
+    if trace is not None and not trace.finished:
+        trace.tokens[section] = trace.tokens.get(section, 0) + tokens
+
+
+def count_hedge(outcome: str):
+    """outcome: launched (cópia disparada) ou completed (turno que teve hedge terminou bem)."""
+    if LLM_HEDGES is not None:
+        LLM_HEDGES.labels(outcome).inc()
+
+
+@contextmanager
+def span(stage: str, call_id: str = None):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started, started, call_id)
+
+
+async def traced_stream(trace: TurnTrace, tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Mantém o turno aberto enquanto o stream SSE é consumido e fecha quando ele termina."""
+    _current_turn.set(trace)
+    status = "ok"
+    try:
+        async for token in tokens:
+            yield token
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        trace.finish(status)
+
+
+def metrics_payload() -> Tuple[bytes, str]:
+    """
+    Texto do /metrics. Com PROMETHEUS_MULTIPROC_DIR definido, soma os workers do gunicorn
+    (senão cada scrape veria só o worker que atendeu a requisição).
+    """
+    if Histogram is None:
+        return b"# prometheus_client nao instalado\n", "text/plain; charset=utf-8"
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,6 +1,62 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+# app/db/session.py
+from typing import Optional
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+
 from app.core.config import settings
 
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Criados no primeiro uso, dentro do worker: o pool do asyncpg fica preso ao event loop de quem
+# o abriu, então nada disso pode ser montado no master do gunicorn (preload) antes do fork
+_engine: Optional[AsyncEngine] = None
+_sessionmaker: Optional[async_sessionmaker] = None
+
+
+def async_database_url(url: str) -> str:
+    """postgres:// e postgresql:// (como vêm do docker-compose/Azure) viram postgresql+asyncpg://."""
+    parsed = make_url(url)
+    if parsed.drivername in ("postgres", "postgresql", "postgresql+psycopg2"):
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+    return parsed.render_as_string(hide_password=False)
+
+
+def get_engine() -> AsyncEngine:
+    global _engine
+    if _engine is None:
+        if not settings.DATABASE_URL:
+            raise RuntimeError("DATABASE_URL não configurada (necessária para LEADS_BACKEND=postgres).")
+        _engine = create_async_engine(
+            async_database_url(settings.DATABASE_URL),
+            # Pool por worker: DB_POOL_SIZE conexões abertas + DB_MAX_OVERFLOW em pico
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+            # Recicla antes de firewalls/proxies derrubarem conexões ociosas; pre_ping descarta as mortas
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=True,
+            connect_args={
+                "timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+                "command_timeout": settings.DB_STATEMENT_TIMEOUT_MS / 1000,
+                "server_settings": {
+                    "application_name": settings.PROJECT_NAME,
+                    "statement_timeout": str(settings.DB_STATEMENT_TIMEOUT_MS),
+                },
+            },
+        )
+    return _engine
+
+
+def get_sessionmaker() -> async_sessionmaker:
+    global _sessionmaker
+    if _sessionmaker is None:
+        _sessionmaker = async_sessionmaker(get_engine(), expire_on_commit=False)
+    return _sessionmaker
+
+
+async def dispose_engine():
+    """Fecha o pool (shutdown do worker)."""
+    global _engine, _sessionmaker
+    if _engine is not None:
+        await _engine.dispose()
+    _engine = None
+    _sessionmaker = None
@@ -1,67 +1,39 @@
 # main.py
-from fastapi import FastAPI, Request
-from pydantic import BaseModel
-from typing import List, Literal, Optional, Any, Dict
-import time
-import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response
 
-# IMPORTANTE: Importar o seu orquestrador
-from app.services.orchestrator import ConversationOrchestrator
+from app.api.v1.router import api_router
+from app.core.telemetry import metrics_payload
+# IMPORTANTE: O registry guarda o orquestrador (engine + ferramentas) do worker
+from app.services.registry import engine_registry
 
-app = FastAPI(title="Barcelona Vapi Gateway", version="1.0.0")
 
-# Inicializa o orquestrador (que carrega o engine e as ferramentas)
-orchestrator = ConversationOrchestrator()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Roda uma vez por worker do gunicorn: monta o agente e aquece as conexões
+    await engine_registry.startup()
+    yield
+    await engine_registry.shutdown()
+
+
+app = FastAPI(title="Barcelona Vapi Gateway", version="1.0.0", lifespan=lifespan)
 
 @app.get("/")
 def health():
     return {"status": "ok", "app": "barcelona"}
 
-class ChatMessage(BaseModel):
-    role: Literal["system", "user", "assistant", "tool"]
-    content: Optional[str] = None
-    tool_calls: Optional[List[Any]] = None
-
-class ChatCompletionsRequest(BaseModel):
-    model: str
-    messages: List[ChatMessage]
-    temperature: Optional[float] = 0.2
-
-@app.post("/api/v1/webhook/vapi/chat/completions")
-async def vapi_chat_completions(payload: ChatCompletionsRequest) -> Dict[str, Any]:
-    """
-    Este endpoint substitui o cérebro da Vapi pelo seu código na Azure.
-    Ele consulta o Pinecone e decide o que responder.
-    """
-    # 1. Pega a última mensagem do utilizador
-    user_messages = [m for m in payload.messages if m.role == "user"]
-    last_input = user_messages[-1].content if user_messages else ""
-
-    # 2. Chama o seu orquestrador que usa o engine.py + Pinecone
-    # Usamos o call_id fixo ou extraído se necessário para histórico
-    response_text = await orchestrator.get_response(last_input, "vapi_call")
+@app.get("/health/ready")
+def readiness():
+    # Só fica verde (200) depois que o warm-up do worker terminou
+    status = engine_registry.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
 
-    # 3. Retorna no formato que a Vapi espera (padrão OpenAI)
-    return {
-        "id": f"chatcmpl-{uuid.uuid4().hex}",
-        "object": "chat.completion",
-        "created": int(time.time()),
-        "model": payload.model,
-        "choices": [
-            {
-                "index": 0,
-                "message": {
-                    "role": "assistant", 
-                    "content": response_text
-                },
-                "finish_reason": "stop",
-            }
-        ]
-    }
+@app.get("/metrics")
+def metrics():
+    # Prometheus: latência por turno e por etapa (parse, LLM, ferramentas, memória, banco)
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
 
-# Endpoint para receber os dados do lead (ferramenta enviar_agendamento)
-@app.post("/api/v1/leads/")
-async def receive_lead(data: Dict[str, Any]):
-    # Aqui você pode salvar no seu banco de dados (Supabase/Postgres)
-    print(f"Lead recebido: {data}")
-    return {"status": "success", "message": "Lead guardado com sucesso"}
\ No newline at end of file
+# Turnos de voz (Vapi Custom LLM) e leads: um único endpoint por caminho, definido nos routers da v1
+app.include_router(api_router, prefix="/api/v1")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Enum, Index
 from app.db.base import Base
 import enum
 from datetime import datetime
@@ -8,9 +8,22 @@ class LeadStatus(str, enum.Enum):
     MORNO = "morno"
     QUENTE = "quente"
     AGENDADO = "agendado"
+    EM_ATENDIMENTO = "em_atendimento"
+
+    @classmethod
+    def parse(cls, value) -> "LeadStatus":
+        # Aceita o texto livre que o webhook grava no Table Storage ("Em Atendimento")
+        if isinstance(value, cls):
+            return value
+        return cls(str(value).strip().lower().replace(" ", "_"))
 
 class Lead(Base):
     __tablename__ = "leads"
+    # Listagem paginada por keyset (updated_at, id), com e sem filtro de status
+    __table_args__ = (
+        Index("ix_leads_status_updated_at_id", "status", "updated_at", "id"),
+        Index("ix_leads_updated_at_id", "updated_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=True)
@@ -18,3 +31,4 @@ class Lead(Base):
     status = Column(Enum(LeadStatus), default=LeadStatus.FRIO)
     summary = Column(String, nullable=True) # Resumo da conversa
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
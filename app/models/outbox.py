@@ -0,0 +1,28 @@
+# app/models/outbox.py
+from datetime import datetime
+
+from sqlalchemy import JSON, BigInteger, Column, DateTime, Index, Integer, String
+
+from app.db.base import Base
+
+
+class OutboxEntry(Base):
+    """Evento do outbox do CRM (OUTBOX_BACKEND=postgres); mesmas colunas do arquivo SQLite."""
+
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # Claim do dispatcher (status + vencimento) e dedupe por telefone (último envio)
+        Index("ix_outbox_events_due", "status", "next_attempt_at"),
+        Index("ix_outbox_events_sent", "kind", "phone", "sent_at"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String, nullable=False)
+    phone = Column(String, nullable=True)
+    payload = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
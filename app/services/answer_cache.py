@@ -0,0 +1,264 @@
+# app/services/answer_cache.py
+import asyncio
+import contextvars
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.telemetry import count_answer_cache, span
+from app.services.llm.prompts import SYSTEM_PROMPT
+from app.services.rag.cache import normalize_query
+from app.services.rag.hybrid import analyze_query
+from app.services.rag.price_tables import infer_subcategoria
+
+logger = logging.getLogger(__name__)
+
+# Turnos com dado da ligação (nome, números, telefone, e-mail) nunca entram no cache
+DIGITS_RE = re.compile(r"\d")
+EMAIL_RE = re.compile(r"\S+@\S+")
+PERSONAL_RE = re.compile(
+    r"\b(?:meu nome|me chamo|eu sou [oa]|sou [oa] |minha renda|meu salario|meu telefone|meu numero|"
+    r"meu email|meu cpf|minha esposa|meu marido|minha empresa)\b"
+)
+QUESTION_RE = re.compile(
+    r"^(?:o que|oque|que|qual|quais|como|quando|onde|por que|porque|quanto|quantos|quantas|pode|posso|tem|"
+    r"existe|e possivel|da para|consorcio)\b"
+)
+MAX_QUESTION_WORDS = 25
+# Apresentação no começo da fala ("É o Ricardo. Quem fala?", "Paulo. Consórcio tem juros?"): sai da chave
+SENTENCE_RE = re.compile(r"[^.!?;]+[.!?;]*")
+INTRO_RE = re.compile(
+    r"^(?:(?:oi|ola|alo|bom dia|boa tarde|boa noite)\s+)*"
+    r"(?:(?:aqui|quem fala)\s+)?(?:e|sou|eu sou|fala)\s+(?:o|a)\s+\w+(?: \w+){0,2}$"
+)
+MAX_NAME_WORDS = 3
+# Palavras soltas e com maiúscula que não são nome ("Sim. Qual o prazo?")
+NOT_NAMES = {"sim", "nao", "claro", "certo", "entendi", "ok", "beleza", "isso", "olha", "bom", "tudo", "consorcio", "uns", "umas"}
+# Resposta com sequência longa de dígitos (telefone, CPF) também fica de fora
+LONG_NUMBER_RE = re.compile(r"\d[\d\s.\-]{7,}\d")
+
+
+def prompt_fingerprint() -> str:
+    """Hash do SYSTEM_PROMPT: mudou o prompt, as respostas antigas deixam de valer."""
+    return hashlib.sha1(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+def _is_introduction(sentence: str) -> bool:
+    """'É o Ricardo.' / 'Aqui é a Juliana.' / 'Paulo.' (nome solto, com maiúscula, que não é tipo do bem)."""
+    text = normalize_query(sentence)
+    if not text:
+        return False
+    if INTRO_RE.match(text):
+        return True
+    words = sentence.strip(" .!?;,").split()
+    return (
+        0 < len(words) <= MAX_NAME_WORDS
+        and all(word[:1].isupper() for word in words)
+        and not infer_subcategoria(text)
+        and not set(text.split()) & NOT_NAMES
+    )
+
+
+def cache_question(message: str) -> Optional[str]:
+    """
+    Pergunta que vira chave do cache, sem a apresentação do cliente no começo da fala. None se o
+    turno não for uma pergunta genérica de FAQ ("consórcio tem juros?") ou tiver dado do cliente.
+    """
+    if not message or DIGITS_RE.search(message) or EMAIL_RE.search(message):
+        return None
+    sentences = [sentence.strip() for sentence in SENTENCE_RE.findall(message) if sentence.strip()]
+    while len(sentences) > 1 and _is_introduction(sentences[0]):
+        sentences.pop(0)
+    question = " ".join(sentences)
+    text = normalize_query(question)
+    if not text or len(text.split()) > MAX_QUESTION_WORDS or PERSONAL_RE.search(text) or INTRO_RE.match(text):
+        return None
+    if question.endswith("?") or QUESTION_RE.match(text):
+        return question
+    return None
+
+
+def is_cacheable_question(message: str) -> bool:
+    return cache_question(message) is not None
+
+
+def is_cacheable_answer(answer: str) -> bool:
+    return bool(answer) and not LONG_NUMBER_RE.search(answer) and not EMAIL_RE.search(answer)
+
+
+def is_cacheable_history(history: List[dict]) -> bool:
+    """
+    Só guarda respostas geradas sem nada dito pelo cliente (no máximo a abertura da assistente):
+    com o histórico da ligação no prompt, a resposta pode levar o nome ou os dados de quem ligou.
+    """
+    return all(m.get("role") == "assistant" for m in history or [])
+
+
+class SemanticAnswerCache:
+    """
+    Cache de respostas do agente por similaridade da pergunta.
+    Chave = embedding da pergunta + administradora/subcategoria citadas nela + hash do SYSTEM_PROMPT
+    + versão da base de conhecimento: se o prompt ou o índice mudam, o cache começa do zero, e
+    "qual a taxa da Ademicon?" nunca devolve a resposta guardada para outra administradora. A busca é um produto matricial
+    NumPy sobre as perguntas guardadas (LRU + TTL), então um acerto custa alguns milissegundos
+    (ou menos, quando o embedding da pergunta já está no cache do retriever).
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[str], Awaitable[List[float]]],
+        index_version: Callable[[], Awaitable[str]],
+        administradoras: Callable[[], Iterable[str]] = lambda: (),
+        standalone_answer: Optional[Callable[[str], Awaitable[str]]] = None,
+        threshold: float = None,
+        max_entries: int = None,
+        ttl_seconds: float = None,
+    ):
+        self.embed = embed
+        self.index_version = index_version
+        self.administradoras = administradoras
+        # Gera a resposta só com a pergunta (sem o histórico da ligação), em segundo plano
+        self.standalone_answer = standalone_answer
+        self._fill_tasks = set()
+        self._filling = set()
+        self.threshold = threshold or settings.ANSWER_CACHE_THRESHOLD
+        self.max_entries = max_entries or settings.ANSWER_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or settings.ANSWER_CACHE_TTL_SECONDS
+        self.namespace: Optional[str] = None
+        self._vectors: Optional[np.ndarray] = None  # (max_entries, dim), uma linha por pergunta
+        # slot -> (pergunta, resposta, expira_em, entidades); a ordem do OrderedDict é a do LRU
+        self._entries: "OrderedDict[int, Tuple[str, str, float, Tuple]]" = OrderedDict()
+        self._free: List[int] = []
+        self.counters = {"hits": 0, "misses": 0, "skipped": 0, "stored": 0, "resets": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._vectors = None
+        self._entries.clear()
+        self._free = []
+
+    async def _check_namespace(self):
+        namespace = f"{prompt_fingerprint()}:{await self.index_version()}"
+        if namespace != self.namespace:
+            if self.namespace is not None:
+                logger.info("♻️ Prompt ou base de conhecimento mudou. Limpando cache de respostas.")
+                self.counters["resets"] += 1
+            self.namespace = namespace
+            self.clear()
+
+    def _entities(self, message: str) -> Tuple[Optional[str], Optional[str]]:
+        entities = analyze_query(message, self.administradoras())
+        return entities.administradora, entities.subcategoria
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    async def lookup(self, message: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Devolve (resposta, vetor). Resposta None = não achou (ou turno não cacheável);
+        o vetor volta para o store() não precisar calcular o embedding de novo.
+        """
+        question = cache_question(message)
+        if question is None:
+            self.counters["skipped"] += 1
+            count_answer_cache("skipped")
+            return None, None
+
+        with span("answer_cache"):
+            await self._check_namespace()
+            vector = self._normalize(await self.embed(question))
+            answer = None
+            # Só compara com perguntas sobre a mesma administradora/subcategoria
+            entities = self._entities(question)
+            slots = np.fromiter((slot for slot, entry in self._entries.items() if entry[3] == entities), dtype=np.int64)
+            if slots.size:
+                scores = self._vectors[slots] @ vector
+                best = int(np.argmax(scores))
+                slot = int(slots[best])
+                _question, cached, expires_at, _entities = self._entries[slot]
+                if scores[best] >= self.threshold:
+                    if expires_at < time.monotonic():
+                        self._evict(slot)
+                    else:
+                        self._entries.move_to_end(slot)
+                        answer = cached
+
+        result = "hit" if answer is not None else "miss"
+        self.counters["hits" if answer is not None else "misses"] += 1
+        count_answer_cache(result)
+        return answer, vector
+
+    def _evict(self, slot: int):
+        del self._entries[slot]
+        self._free.append(slot)
+
+    def store(self, message: str, answer: str, vector: Optional[np.ndarray], history: Optional[List[dict]] = None):
+        """
+        Guarda a resposta do agente para a pergunta, se ela e a resposta forem cacheáveis e o
+        `history` usado para gerá-la não tiver fala do cliente.
+        """
+        question = cache_question(message)
+        if question is None or vector is None or not is_cacheable_answer(answer) or not is_cacheable_history(history):
+            return
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            self._free = list(range(self.max_entries - 1, -1, -1))
+        if not self._free:
+            # Cheio: sai a pergunta usada há mais tempo
+            self._evict(next(iter(self._entries)))
+        slot = self._free.pop()
+        self._vectors[slot] = vector
+        self._entries[slot] = (question, answer, time.monotonic() + self.ttl_seconds, self._entities(question))
+        self.counters["stored"] += 1
+        count_answer_cache("stored")
+
+    def remember(self, message: str, answer: str, vector: Optional[np.ndarray], history: List[dict]):
+        """
+        Depois de um miss: a resposta do turno entra direto se saiu sem fala do cliente no prompt;
+        senão o cache gera outra só com a pergunta (standalone_answer) em segundo plano e guarda essa.
+        """
+        if vector is None:
+            return
+        if is_cacheable_history(history):
+            self.store(message, answer, vector, history)
+            return
+        question = cache_question(message)
+        if self.standalone_answer is None or question is None or normalize_query(question) in self._filling:
+            return
+        self._filling.add(normalize_query(question))
+        # Contexto vazio: não herda o orçamento nem o TurnTrace do turno que já respondeu
+        task = asyncio.create_task(self._fill(question, vector), context=contextvars.Context())
+        self._fill_tasks.add(task)
+        task.add_done_callback(self._fill_tasks.discard)
+
+    async def _fill(self, question: str, vector: np.ndarray):
+        namespace = self.namespace
+        try:
+            answer = await self.standalone_answer(question)
+            # Prompt ou base mudou enquanto gerava: a resposta já é de outra versão
+            if self.namespace == namespace:
+                self.store(question, answer, vector, [])
+        except Exception as e:
+            logger.warning(f"⚠️ Resposta para o cache não foi gerada: {e}")
+        finally:
+            self._filling.discard(normalize_query(question))
+
+    async def close(self):
+        for task in list(self._fill_tasks):
+            task.cancel()
+        if self._fill_tasks:
+            await asyncio.gather(*self._fill_tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {**self.counters, "entries": len(self._entries), "namespace": self.namespace}
@@ -1,6 +1,99 @@
+# app/services/crm.py
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.outbox.dispatcher import OutboxDispatcher, PermanentDeliveryError
+from app.services.outbox.store import OutboxEvent, OutboxStore, build_outbox_store
+
+logger = logging.getLogger(__name__)
+
+HOT_LEAD = "hot_lead"
+
+
 class CRMService:
+    """
+    Integração com o CRM e a closer. Nada aqui roda no tempo da ligação: notify_closer() só grava o
+    evento no outbox (uma linha) e acorda o dispatcher do worker, que entrega em lote para o
+    CRM_WEBHOOK_URL em segundo plano, com dedupe por telefone, retry com backoff e o status de
+    entrega gravado no banco. Se o worker cair, o evento continua no outbox e sai no próximo boot.
+    """
+
+    def __init__(self, store: OutboxStore = None):
+        self.store = store
+        self.dispatcher: Optional[OutboxDispatcher] = None
+        self.http_client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        if self.dispatcher is not None:
+            return
+        if self.store is None:
+            self.store = build_outbox_store()
+        await self.store.open()
+        if settings.CRM_WEBHOOK_URL:
+            self.http_client = httpx.AsyncClient(timeout=settings.CRM_WEBHOOK_TIMEOUT_SECONDS)
+        self.dispatcher = OutboxDispatcher(self.store, self.deliver)
+        await self.dispatcher.start()
+
     def save_interaction(self, call_id, data):
         pass
-    
-    def notify_closer(self, lead_data):
-        print(f"ALERTA FERNANDA ARO: Novo lead quente! {lead_data}")
+
+    async def notify_closer(self, lead_data: dict) -> Optional[int]:
+        """Enfileira o alerta de lead quente. Devolve o id do evento (None se o outbox estiver fora)."""
+        if self.dispatcher is None:
+            await self.start()
+        try:
+            event_id = await self.store.append(OutboxEvent(kind=HOT_LEAD, phone=lead_data.get("phone"), payload=lead_data))
+        except Exception as e:
+            logger.error(f"⚠️ Alerta de lead quente não foi para o outbox: {e} | {lead_data}")
+            return None
+        self.dispatcher.wake()
+        return event_id
+
+    async def deliver(self, events: List[OutboxEvent]):
+        """Sender do dispatcher: um POST por lote. O `id` de cada evento serve de chave de idempotência."""
+        if self.http_client is None:
+            for event in events:
+                logger.info(f"🔥 ALERTA {settings.DEFAULT_CLOSER_NAME.upper()}: Novo lead quente! {event.payload}")
+            return
+        body = {
+            "closer": settings.DEFAULT_CLOSER_NAME,
+            "events": [
+                {
+                    "id": event.id,
+                    "kind": event.kind,
+                    "phone": event.phone,
+                    "created_at": datetime.fromtimestamp(event.created_at, timezone.utc).isoformat(),
+                    "attempt": event.attempts + 1,
+                    "data": event.payload,
+                }
+                for event in events
+            ],
+        }
+        headers = {"Authorization": f"Bearer {settings.CRM_WEBHOOK_TOKEN}"} if settings.CRM_WEBHOOK_TOKEN else {}
+        response = await self.http_client.post(settings.CRM_WEBHOOK_URL, json=body, headers=headers)
+        # 408/429 e 5xx são passageiros (retry); o resto dos 4xx não vai mudar tentando de novo
+        if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+            raise PermanentDeliveryError(f"CRM respondeu {response.status_code}: {response.text[:200]}")
+        response.raise_for_status()
+
+    async def close(self):
+        """Última passada do dispatcher e fecha banco/cliente HTTP (shutdown do worker)."""
+        if self.dispatcher is not None:
+            await self.dispatcher.close()
+            self.dispatcher = None
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+        if self.store is not None:
+            await self.store.close()
+
+    def stats(self) -> Optional[dict]:
+        return self.dispatcher.stats() if self.dispatcher is not None else None
+
+
+# Instância única por processo (cada worker do gunicorn tem a sua)
+crm_service = CRMService()
@@ -0,0 +1,176 @@
+# app/services/database/postgres.py
+import logging
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+import asyncpg  # noqa: F401  (driver do create_async_engine; sem ele o build_lead_repository cai fora)
+import pytz
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from app.db.session import dispose_engine, get_engine
+from app.models.lead import Lead, LeadStatus
+from app.services.database.repository import (
+    LeadPage,
+    LeadQuery,
+    LeadRecord,
+    LeadRepository,
+    decode_cursor,
+    dedupe_by_phone,
+    encode_cursor,
+)
+
+logger = logging.getLogger(__name__)
+
+# Linhas por INSERT: 6 colunas x 1000 fica bem abaixo do limite de 32767 parâmetros do Postgres
+UPSERT_MAX_ROWS = 1000
+
+
+def _naive_utc(value: Optional[datetime]) -> datetime:
+    # As colunas DateTime do modelo guardam UTC sem fuso (mesmo padrão do created_at)
+    if value is None:
+        return datetime.utcnow()
+    if value.tzinfo is not None:
+        value = value.astimezone(pytz.utc).replace(tzinfo=None)
+    return value
+
+
+def _iso_utc(value: Optional[datetime]) -> Optional[str]:
+    # Mesmo formato do UpdatedAt do Table Storage
+    return pytz.utc.localize(value).isoformat() if value is not None else None
+
+
+def _row(lead: LeadRecord) -> dict:
+    return {
+        "phone": lead.phone,
+        "name": lead.name,
+        "status": LeadStatus.parse(lead.status) if lead.status else None,
+        "summary": lead.summary,
+        "created_at": _naive_utc(lead.updated_at),
+        "updated_at": _naive_utc(lead.updated_at),
+    }
+
+
+def build_upsert(rows: List[dict]):
+    """
+    INSERT ... VALUES (...), (...) ON CONFLICT (phone) DO UPDATE com semântica de merge:
+    campo None no lote não apaga o valor salvo, e created_at só vale na primeira gravação.
+    """
+    stmt = insert(Lead).values(rows)
+    excluded = stmt.excluded
+    return stmt.on_conflict_do_update(
+        index_elements=[Lead.phone],
+        set_={
+            "name": func.coalesce(excluded.name, Lead.name),
+            "status": func.coalesce(excluded.status, Lead.status),
+            "summary": func.coalesce(excluded.summary, Lead.summary),
+            "updated_at": func.greatest(excluded.updated_at, Lead.updated_at),
+        },
+    )
+
+
+def build_list_query(query: LeadQuery, limit: int, cursor: Optional[dict] = None):
+    """
+    SELECT só das colunas pedidas, do mais recente para o mais antigo, paginado por keyset:
+    a próxima página começa depois do (updated_at, id) da última linha, sem OFFSET. O custo é o
+    mesmo na página 1 e na 1000, e lead gravado no meio da exportação não desloca as páginas.
+    Usa o índice (status, updated_at, id) com filtro de status, ou (updated_at, id) sem.
+    Pede limit + 1 linhas: a sobra só diz se há próxima página.
+    """
+    table = Lead.__table__
+    stmt = select(*(table.c[name] for name in query.fields), Lead.updated_at.label("_updated_at"), Lead.id.label("_id"))
+    if query.statuses:
+        stmt = stmt.where(Lead.status.in_([LeadStatus.parse(status) for status in query.statuses]))
+    if query.updated_after is not None:
+        stmt = stmt.where(Lead.updated_at >= _naive_utc(query.updated_after))
+    if query.updated_before is not None:
+        stmt = stmt.where(Lead.updated_at < _naive_utc(query.updated_before))
+    if cursor is not None:
+        stmt = stmt.where(tuple_(Lead.updated_at, Lead.id) < tuple_(datetime.fromisoformat(cursor["u"]), int(cursor["i"])))
+    return stmt.order_by(Lead.updated_at.desc(), Lead.id.desc()).limit(limit + 1)
+
+
+class PostgresLeadRepository(LeadRepository):
+    """
+    Leads no Postgres do docker-compose (tabela `leads` do modelo Lead), via SQLAlchemy async +
+    asyncpg com pool por worker. Cada flush do LeadWriter é um único INSERT multi-linha com
+    ON CONFLICT (phone) DO UPDATE numa transação, em ordem de telefone: dois workers gravando os
+    mesmos telefones travam as linhas na mesma ordem e não entram em deadlock.
+    """
+
+    backend = "postgres"
+
+    def __init__(self):
+        self.engine = None
+
+    async def connect(self):
+        """Abre o pool e garante a tabela (uma vez por worker, como o create_table do Table Storage)."""
+        try:
+            engine = get_engine()
+            async with engine.begin() as conn:
+                await conn.run_sync(Lead.metadata.create_all, tables=[Lead.__table__])
+            self.engine = engine
+        except Exception as e:
+            # Sem banco agora: o writer continua aceitando e o próximo flush tenta de novo
+            logger.error(f"⚠️ Erro ao conectar no Postgres: {e}")
+
+    async def upsert_many(self, leads: Sequence[LeadRecord]) -> int:
+        if self.engine is None:
+            await self.connect()
+            if self.engine is None:
+                raise ConnectionError("Postgres indisponível")
+        rows = [_row(lead) for lead in dedupe_by_phone(leads)]
+        async with self.engine.begin() as conn:
+            for start in range(0, len(rows), UPSERT_MAX_ROWS):
+                await conn.execute(build_upsert(rows[start:start + UPSERT_MAX_ROWS]))
+        return len(rows)
+
+    async def get_lead(self, phone: str) -> Optional[LeadRecord]:
+        if self.engine is None:
+            return None
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(select(Lead.__table__).where(Lead.phone == phone))).mappings().first()
+        if row is None:
+            return None
+        return LeadRecord(
+            phone=row["phone"],
+            name=row["name"],
+            status=row["status"].value if row["status"] else None,
+            summary=row["summary"],
+            updated_at=row["updated_at"],
+        )
+
+    async def list_leads(self, query: LeadQuery, limit: int, cursor: Optional[str] = None) -> LeadPage:
+        state = decode_cursor(cursor) if cursor else None
+        if state is not None:
+            try:
+                datetime.fromisoformat(state["u"]), int(state["i"])
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError("Cursor inválido") from e
+        if self.engine is None:
+            await self.connect()
+            if self.engine is None:
+                raise ConnectionError("Postgres indisponível")
+
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(build_list_query(query, limit, state))).mappings().all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor({"u": last["_updated_at"].isoformat(), "i": last["_id"]})
+
+        items = []
+        for row in rows:
+            item = {name: row[name] for name in query.fields}
+            if "status" in item and item["status"] is not None:
+                item["status"] = item["status"].value
+            if "updated_at" in item:
+                item["updated_at"] = _iso_utc(item["updated_at"])
+            items.append(item)
+        return LeadPage(items=items, next_cursor=next_cursor)
+
+    async def close(self):
+        if self.engine is not None:
+            await dispose_engine()
+            self.engine = None
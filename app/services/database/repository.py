@@ -0,0 +1,129 @@
+# app/services/database/repository.py
+import base64
+import json
+import logging
+from dataclasses import dataclass, field, fields
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+import pytz
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Colunas que a listagem devolve (nomes iguais nos dois bancos); o telefone sempre vem
+LEAD_FIELDS = ("phone", "name", "status", "summary", "updated_at")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(pytz.utc)
+
+
+@dataclass
+class LeadRecord:
+    """Um lead como o LeadWriter o enfileira, independente do banco. None = não mexe no campo salvo."""
+
+    phone: str
+    name: Optional[str] = None
+    status: Optional[str] = None
+    summary: Optional[str] = None
+    updated_at: datetime = field(default_factory=_utcnow)
+
+    def merge(self, newer: "LeadRecord") -> "LeadRecord":
+        """Junta dois turnos do mesmo telefone: os campos preenchidos do mais novo vencem."""
+        values = {f.name: getattr(newer, f.name) for f in fields(self)}
+        for name, value in values.items():
+            if value is None:
+                values[name] = getattr(self, name)
+        return LeadRecord(**values)
+
+
+def dedupe_by_phone(leads: Sequence[LeadRecord]) -> list:
+    """Um registro por telefone (merge na ordem de chegada), em ordem de telefone."""
+    merged = {}
+    for lead in leads:
+        merged[lead.phone] = merged[lead.phone].merge(lead) if lead.phone in merged else lead
+    return [merged[phone] for phone in sorted(merged)]
+
+
+@dataclass
+class LeadQuery:
+    """Filtros da listagem, aplicados no banco (nada de varrer a tabela inteira no worker)."""
+
+    statuses: List[str] = field(default_factory=list)  # valores do LeadStatus ("quente", "agendado")
+    updated_after: Optional[datetime] = None  # inclusive
+    updated_before: Optional[datetime] = None  # exclusive
+    fields: Sequence[str] = LEAD_FIELDS
+
+    def __post_init__(self):
+        unknown = [name for name in self.fields if name not in LEAD_FIELDS]
+        if unknown:
+            raise ValueError(f"Campos desconhecidos: {', '.join(unknown)} (disponíveis: {', '.join(LEAD_FIELDS)})")
+        self.fields = ["phone"] + [name for name in dict.fromkeys(self.fields) if name != "phone"]
+
+
+@dataclass
+class LeadPage:
+    items: List[dict]
+    next_cursor: Optional[str] = None  # None = acabou
+
+
+def encode_cursor(state: dict) -> str:
+    """Cursor opaco para o cliente (base64 url-safe de um JSON pequeno)."""
+    raw = json.dumps(state, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError as e:
+        raise ValueError("Cursor inválido") from e
+    if not isinstance(state, dict):
+        raise ValueError("Cursor inválido")
+    return state
+
+
+class LeadRepository:
+    """
+    Interface comum dos bancos de leads usados pelo LeadWriter (um por worker).
+    connect() abre o cliente/pool e garante a tabela; upsert_many() grava um lote (merge por
+    telefone) e devolve quantos foram gravados; close() fecha tudo no shutdown.
+    """
+
+    backend = "none"
+
+    async def connect(self):
+        raise NotImplementedError
+
+    async def upsert_many(self, leads: Sequence[LeadRecord]) -> int:
+        raise NotImplementedError
+
+    async def get_lead(self, phone: str) -> Optional[LeadRecord]:
+        raise NotImplementedError
+
+    async def list_leads(self, query: LeadQuery, limit: int, cursor: Optional[str] = None) -> LeadPage:
+        """Uma página (até `limit` leads) e o cursor da próxima; ValueError se o cursor não for válido."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+def build_lead_repository() -> Optional[LeadRepository]:
+    """Repositório do LEADS_BACKEND. None se o SDK/driver do backend não estiver instalado."""
+    backend = settings.LEADS_BACKEND
+    try:
+        if backend == "postgres":
+            from app.services.database.postgres import PostgresLeadRepository
+
+            return PostgresLeadRepository()
+        if backend == "table_storage":
+            from app.services.database.storage import TableStorageLeadRepository
+
+            return TableStorageLeadRepository()
+    except ImportError as e:
+        logger.warning(f"⚠️ Backend de leads '{backend}' indisponível ({e}). Leads não serão gravados.")
+        return None
+    raise ValueError(f"LEADS_BACKEND inválido: {backend!r} (use 'table_storage' ou 'postgres')")
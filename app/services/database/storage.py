@@ -2,15 +2,46 @@
 from azure.data.tables import TableClient
 from azure.core.exceptions import ResourceExistsError
 from app.core.config import settings
-import uuid
+from app.models.lead import LeadStatus
+from app.services.database.repository import LeadPage, LeadQuery, LeadRecord, LeadRepository, decode_cursor, encode_cursor
+import logging
 from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
 import pytz
 
+try:
+    from azure.data.tables.aio import TableClient as AsyncTableClient
+except ImportError:
+    AsyncTableClient = None
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = "BarcelonaLeads"
+PARTITION_KEY = "Leads2026"  # Agrupador (pode ser o Ano ou Mês)
+TRANSACTION_MAX_OPERATIONS = 100  # limite do Table Storage por submit_transaction
+# Campo da listagem -> propriedade da entidade (o select do Table Storage só traz essas)
+ENTITY_COLUMNS = {"phone": "RowKey", "name": "Name", "status": "Status", "summary": "LastSummary", "updated_at": "UpdatedAt"}
+
+
+def build_lead_entity(phone: str, name: str, status: str, summary: str, updated_at: datetime = None) -> dict:
+    # No Table Storage, PartitionKey + RowKey é a chave primária
+    entity = {
+        "PartitionKey": PARTITION_KEY,
+        "RowKey": phone,             # O telefone é único por pessoa
+        "Name": name,
+        "Status": status,
+        "LastSummary": summary,
+        "UpdatedAt": (updated_at or datetime.now(pytz.utc)).isoformat()
+    }
+    # Merge do Table Storage: campo ausente não apaga o que já está salvo
+    return {key: value for key, value in entity.items() if value is not None}
+
+
 class LeadsRepository:
     def __init__(self):
         # Conecta no Azure (ou no emulador local)
         self.connection_string = settings.AZURE_STORAGE_CONNECTION_STRING
-        self.table_name = "BarcelonaLeads"
+        self.table_name = TABLE_NAME
         
         try:
             self.client = TableClient.from_connection_string(
@@ -31,15 +62,7 @@ class LeadsRepository:
             print("❌ Banco de dados offline. Lead não salvo.")
             return
 
-        # No Table Storage, PartitionKey + RowKey é a chave primária
-        entity = {
-            "PartitionKey": "Leads2026", # Agrupador (pode ser o Ano ou Mês)
-            "RowKey": phone,             # O telefone é único por pessoa
-            "Name": name,
-            "Status": status,
-            "LastSummary": summary,
-            "UpdatedAt": datetime.now(pytz.utc).isoformat()
-        }
+        entity = build_lead_entity(phone, name, status, summary)
 
         # upsert_entity = Cria se não existe, Atualiza se já existe
         self.client.upsert_entity(mode="merge", entity=entity)
@@ -48,6 +71,158 @@ class LeadsRepository:
     def get_lead(self, phone: str):
         if not self.client: return None
         try:
-            return self.client.get_entity(partition_key="Leads2026", row_key=phone)
+            return self.client.get_entity(partition_key=PARTITION_KEY, row_key=phone)
         except:
-            return None # Não encontrado
\ No newline at end of file
+            return None # Não encontrado
+
+
+def _canonical_status(status: Optional[str]) -> Optional[str]:
+    # Grava o valor do LeadStatus ("em_atendimento") para o filtro por status bater exato
+    try:
+        return LeadStatus.parse(status).value if status else status
+    except ValueError:
+        return status
+
+
+def _utc_iso(value: datetime) -> str:
+    # Mesmo formato do UpdatedAt gravado (ISO em UTC): o Table Storage compara como texto
+    if value.tzinfo is None:
+        value = pytz.utc.localize(value)
+    return value.astimezone(pytz.utc).isoformat()
+
+
+def build_lead_filter(query: LeadQuery) -> Tuple[str, dict]:
+    """Filtro OData parametrizado (status e faixa de UpdatedAt) aplicado no servidor."""
+    clauses, parameters = ["PartitionKey eq @pk"], {"pk": PARTITION_KEY}
+    if query.statuses:
+        # Linhas antigas têm o texto livre do webhook ("Em Atendimento", "Quente")
+        variants = dict.fromkeys(
+            variant
+            for status in query.statuses
+            for variant in (status, status.replace("_", " ").title())
+        )
+        options = []
+        for i, variant in enumerate(variants):
+            parameters[f"s{i}"] = variant
+            options.append(f"Status eq @s{i}")
+        clauses.append(f"({' or '.join(options)})")
+    if query.updated_after is not None:
+        parameters["after"] = _utc_iso(query.updated_after)
+        clauses.append("UpdatedAt ge @after")
+    if query.updated_before is not None:
+        parameters["before"] = _utc_iso(query.updated_before)
+        clauses.append("UpdatedAt lt @before")
+    return " and ".join(clauses), parameters
+
+
+class TableStorageLeadRepository(LeadRepository):
+    """
+    Leads no Azure Table Storage, async (azure.data.tables.aio): um único TableClient por worker,
+    tabela criada uma vez só, lote agrupado por PartitionKey em submit_transaction (até 100).
+    """
+
+    backend = "table_storage"
+
+    def __init__(self):
+        if AsyncTableClient is None:
+            raise ImportError("azure.data.tables.aio indisponível (falta o aiohttp?)")
+        self.client = None
+
+    async def connect(self):
+        """Abre o cliente e garante a tabela (uma vez por worker, não a cada turno)."""
+        client = None
+        try:
+            client = AsyncTableClient.from_connection_string(
+                conn_str=settings.AZURE_STORAGE_CONNECTION_STRING,
+                table_name=TABLE_NAME
+            )
+            try:
+                await client.create_table()
+            except ResourceExistsError:
+                pass  # Tabela já existe, segue o jogo
+            self.client = client
+        except Exception as e:
+            # Sem banco agora: o writer continua aceitando e o próximo flush tenta de novo
+            logger.error(f"⚠️ Erro ao conectar no Table Storage: {e}")
+            if client is not None:
+                await client.close()
+
+    async def upsert_many(self, leads: Sequence[LeadRecord]) -> int:
+        if self.client is None:
+            await self.connect()
+            if self.client is None:
+                raise ConnectionError("Table Storage indisponível")
+        by_partition: Dict[str, List[dict]] = {}
+        for lead in leads:
+            entity = build_lead_entity(lead.phone, lead.name, _canonical_status(lead.status), lead.summary, lead.updated_at)
+            by_partition.setdefault(entity["PartitionKey"], []).append(entity)
+
+        written = 0
+        for partition_entities in by_partition.values():
+            for start in range(0, len(partition_entities), TRANSACTION_MAX_OPERATIONS):
+                chunk = partition_entities[start:start + TRANSACTION_MAX_OPERATIONS]
+                try:
+                    await self.client.submit_transaction([("upsert", entity, {"mode": "merge"}) for entity in chunk])
+                    written += len(chunk)
+                except Exception as e:
+                    # Um lote inválido derruba a transação inteira: tenta um por um para salvar o resto
+                    logger.warning(f"⚠️ Transação de {len(chunk)} leads falhou ({e}). Gravando individualmente.")
+                    for entity in chunk:
+                        try:
+                            await self.client.upsert_entity(mode="merge", entity=entity)
+                            written += 1
+                        except Exception as inner:
+                            logger.error(f"⚠️ Lead {entity['RowKey']} não salvo: {inner}")
+        return written
+
+    async def get_lead(self, phone: str) -> Optional[LeadRecord]:
+        if self.client is None:
+            return None
+        try:
+            entity = await self.client.get_entity(partition_key=PARTITION_KEY, row_key=phone)
+        except Exception:
+            return None  # Não encontrado
+        updated_at = entity.get("UpdatedAt")
+        return LeadRecord(
+            phone=entity["RowKey"],
+            name=entity.get("Name"),
+            status=entity.get("Status"),
+            summary=entity.get("LastSummary"),
+            updated_at=datetime.fromisoformat(updated_at) if updated_at else None,
+        )
+
+    async def list_leads(self, query: LeadQuery, limit: int, cursor: Optional[str] = None) -> LeadPage:
+        """
+        Uma página via continuation token do próprio Table Storage (PartitionKey/RowKey da próxima
+        entidade): nada é pulado nem recontado. A ordem é a do telefone (RowKey); o Table Storage
+        não ordena por outra coluna, então a recência entra como filtro de UpdatedAt.
+        """
+        token = decode_cursor(cursor) if cursor else None
+        if token is not None and set(token) != {"PartitionKey", "RowKey"}:
+            raise ValueError("Cursor inválido")
+        if self.client is None:
+            await self.connect()
+            if self.client is None:
+                raise ConnectionError("Table Storage indisponível")
+
+        query_filter, parameters = build_lead_filter(query)
+        pages = self.client.query_entities(
+            query_filter,
+            parameters=parameters,
+            select=[ENTITY_COLUMNS[name] for name in query.fields],
+            results_per_page=limit,
+        ).by_page(continuation_token=token)
+        items = []
+        async for page in pages:
+            items = [
+                {name: entity.get(ENTITY_COLUMNS[name]) for name in query.fields}
+                async for entity in page
+            ]
+            break
+        next_token = pages.continuation_token
+        return LeadPage(items=items, next_cursor=encode_cursor(next_token) if next_token else None)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
@@ -0,0 +1,172 @@
+# app/services/database/writer.py
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.telemetry import observe_stage
+from app.services.database.repository import LeadRecord, LeadRepository, build_lead_repository
+
+logger = logging.getLogger(__name__)
+
+
+class LeadWriter:
+    """
+    Gravação assíncrona e em lote dos leads (um por worker, criado no startup).
+    - O banco vem do LEADS_BACKEND (Table Storage ou Postgres), atrás do LeadRepository.
+    - Vários turnos do mesmo telefone dentro da janela viram uma única escrita (merge).
+    - Cada flush é um upsert em lote no banco, nunca uma ida por turno.
+    - Fila limitada: se o banco ficar lento, quem enfileira espera em vez de estourar a memória.
+    - Flush que falhou volta para o próximo lote (com backoff), junto com os turnos novos do mesmo
+      telefone; só depois de LEADS_WRITER_MAX_ATTEMPTS tentativas o lead conta como "failed".
+    - No shutdown, tudo que está na fila (e o que espera retry) é gravado antes do worker sair.
+    """
+
+    def __init__(self, flush_seconds: float = None, queue_size: int = None, repository: LeadRepository = None):
+        self.flush_seconds = flush_seconds if flush_seconds is not None else settings.LEADS_WRITER_FLUSH_SECONDS
+        self.queue: Optional[asyncio.Queue] = None
+        self.queue_size = queue_size or settings.LEADS_WRITER_QUEUE_SIZE
+        self.repository = repository
+        self._task: Optional[asyncio.Task] = None
+        # Leads de flushes que falharam (telefone -> registro) e quantas vezes cada um já falhou
+        self._retry: Dict[str, LeadRecord] = {}
+        self._attempts: Dict[str, int] = {}
+        self._writing: Dict[str, LeadRecord] = {}  # lote do flush em andamento
+        self.counters = {"enqueued": 0, "coalesced": 0, "written": 0, "retried": 0, "failed": 0, "batches": 0}
+
+    async def start(self):
+        if self._task is not None:
+            return
+        if self.repository is None:
+            self.repository = build_lead_repository()
+            if self.repository is None:
+                return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        await self.repository.connect()
+        self._task = asyncio.create_task(self._run())
+
+    async def submit(self, phone: str, name: str, status: str, summary: str):
+        """Enfileira o lead. Só espera se a fila estiver cheia (backpressure)."""
+        if self._task is None:
+            await self.start()
+        if self.queue is None:
+            return
+        await self.queue.put(LeadRecord(phone=phone, name=name, status=status, summary=summary))
+        self.counters["enqueued"] += 1
+
+    def _retry_delay(self) -> float:
+        return settings.LEADS_WRITER_RETRY_SECONDS * 2 ** (max(self._attempts.values(), default=1) - 1)
+
+    async def _collect(self) -> Tuple[Dict[str, LeadRecord], int]:
+        """
+        Espera o primeiro lead (ou parte dos retries pendentes) e junta tudo que chegar na janela,
+        um registro por telefone. Devolve (leads, itens tirados da fila).
+        """
+        received = 0
+        if self._retry:
+            # Cópia: se a task for cancelada na janela, os retries continuam em self._retry para o close()
+            pending = dict(self._retry)
+            window = max(self.flush_seconds, self._retry_delay())
+        else:
+            first = await self.queue.get()
+            received = 1
+            pending = {first.phone: first}
+            window = self.flush_seconds
+        deadline = time.monotonic() + window
+        while True:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                lead = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            received += 1
+            if lead.phone in pending:
+                self.counters["coalesced"] += 1
+                pending[lead.phone] = pending[lead.phone].merge(lead)
+            else:
+                pending[lead.phone] = lead
+        self._retry = {}
+        return pending, received
+
+    async def _write(self, leads: list):
+        started = time.perf_counter()
+        written = await self.repository.upsert_many(leads)
+        self.counters["written"] += written
+        self.counters["failed"] += len(leads) - written
+        self.counters["batches"] += 1
+        observe_stage("persist_flush", time.perf_counter() - started, started)
+
+    def _requeue(self, pending: Dict[str, LeadRecord]) -> int:
+        """Guarda o lote que falhou para o próximo flush; devolve quantos leads esgotaram as tentativas."""
+        dropped = 0
+        for phone, lead in pending.items():
+            attempts = self._attempts.get(phone, 0) + 1
+            if attempts >= settings.LEADS_WRITER_MAX_ATTEMPTS:
+                self._attempts.pop(phone, None)
+                dropped += 1
+            else:
+                self._attempts[phone] = attempts
+                self._retry[phone] = lead
+        self.counters["retried"] += len(pending) - dropped
+        self.counters["failed"] += dropped
+        return dropped
+
+    async def _run(self):
+        while True:
+            pending, received = await self._collect()
+            self._writing = pending
+            try:
+                await self._write(list(pending.values()))
+                self._writing = {}
+                for phone in pending:
+                    self._attempts.pop(phone, None)
+                logger.info(f"💾 {len(pending)} lead(s) salvos ({self.repository.backend}).")
+            except Exception as e:
+                self._writing = {}
+                dropped = self._requeue(pending)
+                logger.error(
+                    f"⚠️ Erro no banco de dados: {e} | {len(pending) - dropped} lead(s) para nova tentativa, "
+                    f"{dropped} descartado(s)"
+                )
+            finally:
+                # Cancelada no meio do flush (shutdown), self._writing fica para o close() regravar
+                for _ in range(received):
+                    self.queue.task_done()
+
+    async def close(self, timeout: float = 10.0):
+        """Drena a fila (até `timeout` segundos) e fecha o repositório."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Shutdown com {self.queue.qsize()} lead(s) ainda na fila.")
+        task, self._task = self._task, None
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if self._retry or self._writing:
+            # Última tentativa para o que esperava retry (ou foi cancelado no meio); o que falhar aqui se perde
+            retry = list({**self._retry, **self._writing}.values())
+            self._retry, self._writing = {}, {}
+            try:
+                await self._write(retry)
+            except Exception as e:
+                self.counters["failed"] += len(retry)
+                logger.error(f"⚠️ Shutdown: {len(retry)} lead(s) não gravados: {e}")
+        await self.repository.close()
+
+    def stats(self) -> dict:
+        backend = self.repository.backend if self.repository is not None else None
+        return {
+            **self.counters,
+            "backend": backend,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "awaiting_retry": len(self._retry),
+        }
+
+
+# Instância única por processo (cada worker do gunicorn tem a sua)
+lead_writer = LeadWriter()
@@ -0,0 +1,245 @@
+# app/services/intents.py
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.telemetry import count_intent, span
+from app.services.llm.tools import _brl, estimate_installment, get_price_store
+from app.services.rag.cache import normalize_query
+from app.services.rag.hybrid import analyze_query
+from app.services.rag.price_tables import EXACT_PRAZO_SOURCES, infer_subcategoria
+
+CLOSER = settings.DEFAULT_CLOSER_NAME.split()[0]
+
+RESPONSES = {
+    "greeting_opening": (
+        f"Olá, aqui é da equipe da {settings.DEFAULT_CLOSER_NAME} na Barcelona Partners. Tudo bem? "
+        "Com quem eu falo?"
+    ),
+    "greeting_again": "Oi, estou aqui sim. Pode falar.",
+    "who_is_calling": (
+        f"Aqui é a consultora da equipe da {settings.DEFAULT_CLOSER_NAME}, da Barcelona Partners Consultoria. "
+        "Estou entrando em contato porque você tem perfil para alavancagem patrimonial com consórcio."
+    ),
+    "schedule_confirm": (
+        "Perfeito, fica reservado {day}às {slot} com a " + CLOSER + ". "
+        "Ela vai te mostrar os números da estratégia. Esse número é o melhor para contato?"
+    ),
+}
+
+# Regras compiladas sobre o texto normalizado (minúsculo, sem acento, sem pontuação)
+GREETING_RE = re.compile(r"^(?:(?:oi+|ola|alo+|e ai|opa|bom dia|boa tarde|boa noite|tudo bem|tudo bom)\s*){1,4}$")
+# No meio da ligação só "alô?" / "tá me ouvindo?" é checagem de linha; "tudo bem" ali é resposta
+LINE_CHECK_RE = re.compile(r"^(?:(?:oi+|ola|alo+)\s*){1,4}(?:(?:voce )?(?:ta|esta) (?:ai|me ouvindo))?$")
+# Só a pergunta de quem está ligando, sozinha (no máximo com um "alô"/"oi" antes): "quem é a
+# administradora?" ou "qual é a empresa que administra?" são perguntas de negócio e vão para o agente
+WHO_RE = re.compile(
+    r"^(?:(?:oi+|ola|alo+|e ai|opa)\s+){0,2}"
+    r"(?:quem (?:fala|esta falando|ta falando|e voce|seria|e que ta falando|ta ligando|esta ligando|me ligou)"
+    r"|de onde (?:fala|e|voce fala|voces sao|ligam|e que ta falando)|e da onde|falando de onde"
+    r"|(?:qual|que) (?:e )?(?:a )?empresa(?: e essa)?|(?:voce|vc) e de (?:qual|que) empresa|com quem eu falo)$"
+)
+SLOT_10_RE = re.compile(r"\b(?:10 ?h(?:oras)?|10 da manha|dez(?: horas)?(?: da manha)?|as 10|de manha|pela manha)\b")
+SLOT_14_RE = re.compile(r"\b(?:14 ?h(?:oras)?|duas(?: horas)?(?: da tarde)?|as 14|as duas|a tarde|de tarde|pela tarde)\b")
+REFUSAL_RE = re.compile(r"\b(?:nao|nenhum|nem|outro dia|depois|ocupado)\b")
+INSTALLMENT_CUE_RE = re.compile(r"\b(?:parcela|parcelas|quanto fica|quanto da|quanto sai|quanto pago|por mes|mensal)\b")
+# Valores em texto normalizado: "200 mil", "1 5 milhao" (1,5 milhão), "200000", "200k"
+CREDIT_RE = re.compile(r"\b(\d+(?: \d{3})*)(?: (\d{1,2}))? ?(mil|k|milhao|milhoes)?\b")
+MONTHS_RE = re.compile(r"\b(\d{1,3}) ?(meses|mes|x|vezes|anos)\b")
+TAX_RE = re.compile(r"\b(\d{1,2})(?: (\d{1,2}))? ?(?:por cento|porcento)\b")
+SLOT_OFFER_RE = re.compile(r"10h.*14h|14h.*10h", re.S)
+# Dia citado na oferta de horários (texto normalizado), repetido na confirmação
+OFFER_DAY_RE = re.compile(
+    r"\b(depois de amanha|amanha|hoje|segunda|terca|quarta|quinta|sexta|sabado|domingo|dia \d{1,2})\b"
+)
+SPOKEN_DAYS = {
+    "depois de amanha": "depois de amanhã", "amanha": "amanhã", "hoje": "hoje",
+    "segunda": "na segunda", "terca": "na terça", "quarta": "na quarta", "quinta": "na quinta",
+    "sexta": "na sexta", "sabado": "no sábado", "domingo": "no domingo",
+}
+
+# Frases de exemplo para o classificador por similaridade (só intents de resposta fixa)
+EXEMPLARS = {
+    "greeting": ["oi", "ola tudo bem", "alo", "bom dia", "boa tarde", "oi quem e", "alo alo"],
+    "who_is_calling": [
+        "quem esta falando", "quem fala", "de onde voce fala", "qual empresa e essa",
+        "quem e voce", "voce e de qual empresa", "com quem eu falo", "e da onde",
+    ],
+}
+
+
+@dataclass
+class IntentMatch:
+    intent: str
+    text: str
+    confidence: float
+
+
+def _parse_credit(text: str) -> Optional[float]:
+    # Pega o maior valor citado (o prazo e a taxa já foram removidos do texto)
+    best = None
+    for integer, decimal, unit in CREDIT_RE.findall(text):
+        value = float(integer.replace(" ", "") + ("." + decimal if decimal else ""))
+        if unit in ("mil", "k"):
+            value *= 1_000
+        elif unit in ("milhao", "milhoes"):
+            value *= 1_000_000
+        if value >= 1_000 and (best is None or value > best):
+            best = value
+    return best
+
+
+class NgramIntentClassifier:
+    """
+    Classificador local por similaridade: vetores de trigramas de caracteres (hash em 2^12 posições)
+    comparados por cosseno com as frases de exemplo. Roda em microssegundos, sem rede.
+    """
+
+    DIM = 4096
+
+    def __init__(self, exemplars: Dict[str, List[str]], threshold: float):
+        self.threshold = threshold
+        self.labels = [intent for intent, phrases in exemplars.items() for _ in phrases]
+        self.matrix = np.stack([self._vector(phrase) for phrases in exemplars.values() for phrase in phrases])
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.DIM, dtype=np.float32)
+        padded = f"  {text} "
+        for i in range(len(padded) - 2):
+            vector[zlib.crc32(padded[i:i + 3].encode("utf-8")) % self.DIM] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def predict(self, text: str):
+        if not text:
+            return None, 0.0
+        scores = self.matrix @ self._vector(text)
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        return (self.labels[best], score) if score >= self.threshold else (None, score)
+
+
+class IntentRouter:
+    """
+    Respostas determinísticas para turnos que não precisam do LLM: saudação, "quem fala?",
+    confirmação dos horários 10h/14h oferecidos e parcela com crédito + prazo explícitos.
+    Só responde quando tem certeza; na dúvida devolve None e o agente assume.
+    """
+
+    def __init__(self, classifier: Optional[NgramIntentClassifier] = None, price_store_getter: Callable = get_price_store):
+        self.classifier = classifier
+        self.price_store_getter = price_store_getter
+        self.rules = [
+            self._greeting,
+            self._who_is_calling,
+            self._schedule_confirm,
+            self._installment,
+        ]
+
+    def route(self, message: str, history: Optional[List[dict]] = None) -> Optional[IntentMatch]:
+        with span("fast_path"):
+            # "%" some na normalização: vira "por cento" antes
+            text = normalize_query((message or "").replace("%", " por cento"))
+            match = None
+            for rule in self.rules:
+                match = rule(text, history or [])
+                if match is not None:
+                    break
+            if match is None and self.classifier is not None and len(text.split()) <= 6:
+                intent, score = self.classifier.predict(text)
+                if intent == "greeting" and not history:
+                    match = self._greeting_reply([], score)
+                elif intent == "who_is_calling":
+                    match = IntentMatch("who_is_calling", RESPONSES["who_is_calling"], score)
+        count_intent(match.intent if match else "agent", fast_path=match is not None)
+        return match
+
+    def _greeting_reply(self, history: List[dict], confidence: float) -> IntentMatch:
+        key = "greeting_again" if history else "greeting_opening"
+        return IntentMatch("greeting", RESPONSES[key], confidence)
+
+    def _greeting(self, text: str, history: List[dict]) -> Optional[IntentMatch]:
+        if not text:
+            return IntentMatch("empty", RESPONSES["greeting_opening"], 1.0)
+        if (LINE_CHECK_RE if history else GREETING_RE).match(text):
+            return self._greeting_reply(history, 1.0)
+        return None
+
+    def _who_is_calling(self, text: str, history: List[dict]) -> Optional[IntentMatch]:
+        if WHO_RE.match(text):
+            return IntentMatch("who_is_calling", RESPONSES["who_is_calling"], 1.0)
+        return None
+
+    def _schedule_confirm(self, text: str, history: List[dict]) -> Optional[IntentMatch]:
+        # Só vale como resposta à oferta de horários feita no turno anterior
+        last_reply = next((m["content"] for m in reversed(history) if m["role"] == "assistant"), "")
+        if not SLOT_OFFER_RE.search(last_reply) or len(text.split()) > 10 or REFUSAL_RE.search(text):
+            return None
+        wants_10, wants_14 = bool(SLOT_10_RE.search(text)), bool(SLOT_14_RE.search(text))
+        if wants_10 == wants_14:
+            return None  # nenhum ou os dois: ambíguo, o agente resolve
+        slot = "10h" if wants_10 else "14h"
+        # O dia vem da própria oferta; sem dia citado, a confirmação também não cita
+        day_match = OFFER_DAY_RE.search(normalize_query(last_reply))
+        day = ""
+        if day_match:
+            day = SPOKEN_DAYS.get(day_match.group(1), "no " + day_match.group(1)) + " "
+        return IntentMatch("schedule_confirm", RESPONSES["schedule_confirm"].format(day=day, slot=slot), 1.0)
+
+    def _installment(self, text: str, history: List[dict]) -> Optional[IntentMatch]:
+        if not INSTALLMENT_CUE_RE.search(text):
+            return None
+        months_match = MONTHS_RE.search(text)
+        if not months_match:
+            return None
+        months = int(months_match.group(1)) * (12 if months_match.group(2) == "anos" else 1)
+        tax_match = TAX_RE.search(text)
+        rest = MONTHS_RE.sub(" ", TAX_RE.sub(" ", text))
+        credit = _parse_credit(rest)
+        if credit is None or not 6 <= months <= 240:
+            return None
+
+        if tax_match:
+            # Cliente deu a taxa: mesma conta da calculate_consortium_installment
+            tax = float(tax_match.group(1) + ("." + tax_match.group(2) if tax_match.group(2) else ""))
+            value = estimate_installment(credit, months, tax)
+            tax_text = f"{tax:g}".replace(".", ",")
+            return IntentMatch(
+                "installment",
+                f"Com {tax_text}% de taxa total, {_brl(credit)} em {months} meses dá uma parcela de {_brl(value)} por mês.",
+                1.0,
+            )
+
+        store = self.price_store_getter()
+        if store is None:
+            return None
+        # Administradora citada pelo cliente (mesma extração da busca na base); sem ela, vale qualquer uma
+        named = analyze_query(text, store.administradoras).administradora
+        subcategoria = infer_subcategoria(text)
+        matches = []
+        for administradora in [named] if named else store.administradoras:
+            # Só responde direto quando a tabela tem exatamente o crédito e o prazo pedidos (prazo lido do cabeçalho)
+            row = store.lookup(credit, months, administradora, subcategoria, prazo_sources=EXACT_PRAZO_SOURCES)
+            if row and row["credito"] == credit and row["prazo"] == months:
+                matches.append(row)
+        # Nenhuma ou mais de uma administradora com esse crédito/prazo: o agente pergunta qual
+        if len(matches) != 1:
+            return None
+        row = matches[0]
+        return IntentMatch(
+            "installment",
+            f"Na tabela da {row['administradora']}, {_brl(credit)} em {months} meses fica em {_brl(row['parcela'])} por mês. "
+            f"A {CLOSER} te mostra as condições completas na reunião.",
+            1.0,
+        )
+
+
+def build_intent_router() -> IntentRouter:
+    classifier = None
+    if settings.INTENT_CLASSIFIER_ENABLED:
+        classifier = NgramIntentClassifier(EXEMPLARS, settings.INTENT_CLASSIFIER_THRESHOLD)
+    return IntentRouter(classifier=classifier)
@@ -0,0 +1,84 @@
+# app/services/llm/callbacks.py
+import time
+from typing import Dict
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+from app.core.telemetry import TOOL_CALLS, observe_stage, record_tokens
+
+# Fora do app.core.telemetry: langchain_core.callbacks custa ~0,5s de import e só o LLMEngine precisa dele
+
+
+class LatencyCallbackHandler(AsyncCallbackHandler):
+    """
+    Cronometra as chamadas do LLM e das ferramentas dentro do AgentExecutor.
+    Chamada do LLM que termina pedindo ferramenta = "llm_plan"; a que gera o texto = "llm_final".
+    No streaming também registra o tempo até o primeiro token ("llm_ttft").
+    """
+
+    def __init__(self):
+        self._started: Dict[UUID, float] = {}
+        self._first_token_seen = set()
+        self._tool_names: Dict[UUID, str] = {}
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    async def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        if token and run_id not in self._first_token_seen and run_id in self._started:
+            self._first_token_seen.add(run_id)
+            observe_stage("llm_ttft", time.perf_counter() - self._started[run_id], self._started[run_id])
+
+    async def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        started = self._started.pop(run_id, None)
+        self._first_token_seen.discard(run_id)
+        if started is None:
+            return
+        stage = "llm_final"
+        try:
+            message = response.generations[0][0].message
+            if getattr(message, "tool_calls", None) or message.additional_kwargs.get("tool_calls"):
+                stage = "llm_plan"
+        except (AttributeError, IndexError):
+            message = None
+        observe_stage(stage, time.perf_counter() - started, started)
+        self._record_usage(response, message)
+
+    @staticmethod
+    def _record_usage(response, message):
+        # Tokens que a OpenAI cobrou (e quantos vieram do cache de prompt dela)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage.get("prompt_tokens"):
+            record_tokens("llm_prompt", usage["prompt_tokens"])
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+            if cached is not None:
+                record_tokens("llm_prompt_cached", cached)
+            return
+        # Streaming: só o total de entrada (usage_metadata, com stream_usage=True)
+        usage_metadata = getattr(message, "usage_metadata", None) or {}
+        if usage_metadata.get("input_tokens"):
+            record_tokens("llm_prompt", usage_metadata["input_tokens"])
+
+    async def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            observe_stage("llm_error", time.perf_counter() - started, started)
+
+    async def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs):
+        self._started[run_id] = time.perf_counter()
+        self._tool_names[run_id] = (serialized or {}).get("name", "tool")
+
+    async def _tool_done(self, run_id: UUID, status: str):
+        started = self._started.pop(run_id, None)
+        name = self._tool_names.pop(run_id, "tool")
+        if TOOL_CALLS is not None:
+            TOOL_CALLS.labels(name, status).inc()
+        if started is not None:
+            observe_stage(f"tool:{name}", time.perf_counter() - started, started)
+
+    async def on_tool_end(self, output, *, run_id: UUID, **kwargs):
+        await self._tool_done(run_id, "ok")
+
+    async def on_tool_error(self, error, *, run_id: UUID, **kwargs):
+        await self._tool_done(run_id, "error")
@@ -1,49 +1,242 @@
 ## app/services/llm/engine.py
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+import asyncio
+import re
+from typing import AsyncIterator, List, Optional
 from app.core.config import settings
-from app.services.llm.prompts import SYSTEM_PROMPT
-from app.services.llm.tools import calculate_consortium_installment, search_knowledge_base
+from app.core.resilience import current_budget
+from app.core.telemetry import count_degradation
+from app.services.llm.prompts import MEMORY_SUMMARY_PROMPT
+from app.services.llm.tools import (
+    clear_prefetched_search,
+    format_knowledge,
+    get_agent_tools,
+    start_prefetched_search,
+)
+from app.services.rag.cache import normalize_query
+from app.services.rag.vectorstore import get_retriever
 
-# Importação direta compatível com as versões 0.2 e 0.3 (Azure)
-from langchain.agents import AgentExecutor, create_openai_tools_agent
+# Stack do LangChain importada só ao montar o LLMEngine (ou no preload do gunicorn, antes do fork):
+# importar este módulo não custa os ~2s de langchain/langchain_openai/openai
+LLM_STACK_MODULES = (
+    "langchain_openai", "langchain_core.prompts", "langchain.agents",
+    "app.services.llm.callbacks", "app.services.llm.prompt_builder",
+)
+
+# Perguntas sobre regras do consórcio (respondidas pela Base de Conhecimento), no texto normalizado
+KNOWLEDGE_RE = re.compile(
+    r"\b(?:fgts|lance|lances|contempla\w*|sorteio|assembleia|taxa de administracao|fundo de reserva|seguro"
+    r"|reajuste|juros|carta de credito|como funciona|desist\w*|cancel\w*|transferi\w*|administradora)\b"
+)
+QUESTION_START_RE = re.compile(r"^(?:o que|oque|qual|quais|como|quando|onde|por que|porque|pode|posso|tem|e possivel)\b")
+# Fala curta ("sim", "pode ser") não vale uma busca antecipada
+MIN_PREFETCH_WORDS = 3
+
+
+def is_knowledge_question(text: str) -> bool:
+    """Pergunta sobre regras/funcionamento, sem números (conta de parcela continua no agente)."""
+    if not text or re.search(r"\d", text):
+        return False
+    return bool(KNOWLEDGE_RE.search(normalize_query(text)))
+
+
+def should_prefetch(text: str) -> bool:
+    normalized = normalize_query(text or "")
+    if len(normalized.split()) < MIN_PREFETCH_WORDS:
+        return False
+    return (text.strip().endswith("?") or bool(QUESTION_START_RE.match(normalized))
+            or bool(KNOWLEDGE_RE.search(normalized)))
 
-# Importação direta compatível com LangChain 0.2 e 0.3
-from langchain.agents import AgentExecutor, create_openai_tools_agent
 
 class LLMEngine:
-    def __init__(self):
+    def __init__(self, http_client=None, http_async_client=None):
+        # Importação direta compatível com LangChain 0.2 e 0.3 (Azure)
+        from langchain.agents import AgentExecutor, create_openai_tools_agent
+        from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+        from langchain_openai import ChatOpenAI
+
+        from app.services.llm.callbacks import LatencyCallbackHandler
+        from app.services.llm.hedging import HedgedChatModel
+        from app.services.llm.prompt_builder import get_prompt_builder
+
+        # Cronômetro das chamadas ao LLM/ferramentas (uma instância nova por turno)
+        self.latency_handler = LatencyCallbackHandler
+
         # 1. Configura o Modelo (Cérebro)
+        # Os clientes HTTP vêm do EngineRegistry: assim o pool de conexões (TLS já
+        # aberto) com a OpenAI é reaproveitado entre todas as chamadas do worker.
+        # stream_usage: o streaming também devolve os tokens cobrados (entram no log do turno)
+        cache_kwargs = {"extra_body": {"prompt_cache_key": settings.PROMPT_CACHE_KEY}} if settings.PROMPT_CACHE_KEY else {}
         self.llm = ChatOpenAI(
             api_key=settings.OPENAI_API_KEY,
-            model="gpt-4o-mini",
-            temperature=0.0
+            model=settings.OPENAI_MODEL,
+            temperature=0.0,
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            stream_usage=True,
+            **cache_kwargs,
         )
+        # Prefixo fixo do prompt (SystemMessage pronta) e orçamento de tokens das partes variáveis
+        self.prompt_builder = get_prompt_builder()
         
-        # 2. Lista de Ferramentas (Braços)
-        self.tools = [
-            calculate_consortium_installment,
-            search_knowledge_base
-        ]
+        # 2. Lista de Ferramentas (Braços), as mesmas instâncias para todo LLMEngine do processo
+        self.tools = get_agent_tools()
+        self.prompt_builder.set_tools(self.tools)
         
         # 3. Cria o Prompt no formato novo (LCEL)
         prompt = ChatPromptTemplate.from_messages([
-            ("system", SYSTEM_PROMPT),
+            self.prompt_builder.system_message,
+            # Histórico da ligação (resumo + janela recente) vindo da ConversationMemory
+            MessagesPlaceholder(variable_name="chat_history", optional=True),
             ("user", "{input}"),
             MessagesPlaceholder(variable_name="agent_scratchpad"),
         ])
         
         # 4. Cria o Agente Moderno
-        agent = create_openai_tools_agent(self.llm, self.tools, prompt)
+        # O hedge fica em cada requisição ao modelo (plano e resposta final), não em volta do agente:
+        # uma cópia atrasada repete só aquela ida ao LLM, sem rodar as ferramentas de novo
+        agent = create_openai_tools_agent(HedgedChatModel(self.llm), self.tools, prompt)
         
         # 5. Cria o Executor (quem roda o agente)
         self.agent_executor = AgentExecutor(
             agent=agent, 
-            tools=self.tools, 
-            verbose=True
+            tools=self.tools,
+            verbose=settings.AGENT_VERBOSE
         )
 
-    async def generate_reply(self, text: str) -> str:
-        # O invoke agora espera um dicionário com a chave "input"
-        response = await self.agent_executor.ainvoke({"input": text})
-        return response["output"]
\ No newline at end of file
+        # 6. Modo "single-shot": trechos da base direto no prompt, uma única chamada ao LLM
+        self.single_shot_chain = ChatPromptTemplate.from_messages([
+            self.prompt_builder.system_message,
+            ("system", "{knowledge}\n\nResponda com base nesses trechos. Se eles não cobrirem a pergunta, "
+                       "diga que a Fernanda confirma esse detalhe na reunião."),
+            MessagesPlaceholder(variable_name="chat_history", optional=True),
+            ("user", "{input}"),
+        ]) | HedgedChatModel(self.llm)
+
+        # 7. Degradação: modelo menor, sem ferramentas, para quando o agente estoura o orçamento
+        quick_llm = ChatOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            model=settings.DEGRADED_OPENAI_MODEL,
+            temperature=0.0,
+            max_tokens=120,
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            stream_usage=True,
+            **cache_kwargs,
+        )
+        self.quick_chain = ChatPromptTemplate.from_messages([
+            self.prompt_builder.system_message,
+            MessagesPlaceholder(variable_name="chat_history", optional=True),
+            ("user", "{input}"),
+        ]) | quick_llm
+
+    def _inputs(self, text: str, history: Optional[List[dict]], tools: bool = True) -> dict:
+        """Entrada do prompt com o histórico no orçamento; registra os tokens do turno por seção."""
+        chat_history = self.prompt_builder.history(history or [])
+        self.prompt_builder.report(text, chat_history, tools=tools)
+        return {"input": text, "chat_history": chat_history}
+
+    def _use_single_shot(self, text: str) -> bool:
+        return settings.RAG_SINGLE_SHOT and is_knowledge_question(text)
+
+    def _start_prefetch(self, text: str):
+        """
+        Busca especulativa: a busca na base começa junto com a chamada de planejamento do LLM.
+        Se o agente pedir a search_knowledge_base, a ferramenta recebe o resultado já pronto
+        (ou quase) em vez de começar outra ida ao OpenAI + Pinecone depois do plano.
+        """
+        if settings.RAG_SPECULATIVE_PREFETCH and should_prefetch(text):
+            start_prefetched_search(text)
+
+    async def _single_shot_payload(self, text: str, history: Optional[List[dict]]) -> dict:
+        try:
+            docs = await asyncio.wait_for(
+                get_retriever().asearch(text), current_budget().stage_timeout(settings.RAG_TIMEOUT_SECONDS)
+            )
+        except asyncio.TimeoutError:
+            count_degradation("skip_rag")
+            docs = []
+        except Exception as e:
+            print(f"❌ Erro no RAG: {e}")
+            docs = []
+        return {**self._inputs(text, history, tools=False), "knowledge": format_knowledge(docs or [])}
+
+    async def generate_reply(self, text: str, history: Optional[List[dict]] = None) -> str:
+        config = {"callbacks": [self.latency_handler()]}
+        try:
+            if self._use_single_shot(text):
+                payload = await self._single_shot_payload(text, history)
+                response = await self.single_shot_chain.ainvoke(payload, config=config)
+                return response.content
+
+            self._start_prefetch(text)
+            # O invoke agora espera um dicionário com a chave "input".
+            response = await self.agent_executor.ainvoke(self._inputs(text, history), config=config)
+            return response["output"]
+        finally:
+            clear_prefetched_search()
+
+    async def standalone_reply(self, text: str) -> str:
+        """
+        Resposta só com a pergunta e os trechos da base, sem o histórico da ligação: é a que o
+        cache de respostas guarda para as próximas ligações (roda fora do caminho da resposta).
+        """
+        payload = await self._single_shot_payload(text, None)
+        response = await self.single_shot_chain.ainvoke(payload, config={"callbacks": [self.latency_handler()]})
+        return response.content
+
+    async def _agent_tokens(self, payload: dict, config: dict) -> AsyncIterator[str]:
+        async for event in self.agent_executor.astream_events(payload, config=config, version="v1"):
+            if event["event"] != "on_chat_model_stream":
+                continue
+            chunk = event["data"].get("chunk")
+            content = getattr(chunk, "content", None)
+            if isinstance(content, str) and content:
+                yield content
+
+    @staticmethod
+    async def _chain_tokens(chain, payload: dict, config: dict) -> AsyncIterator[str]:
+        async for chunk in chain.astream(payload, config=config):
+            if isinstance(chunk.content, str) and chunk.content:
+                yield chunk.content
+
+    async def stream_reply(self, text: str, history: Optional[List[dict]] = None) -> AsyncIterator[str]:
+        """
+        Igual ao generate_reply, mas devolve os tokens conforme o modelo gera.
+        Passa pelo loop de ferramentas: os passos que só pedem tool_calls não têm
+        texto e são ignorados; a resposta final sai token a token.
+        """
+        config = {"callbacks": [self.latency_handler()]}
+        try:
+            if self._use_single_shot(text):
+                payload = await self._single_shot_payload(text, history)
+                tokens = self._chain_tokens(self.single_shot_chain, payload, config)
+            else:
+                self._start_prefetch(text)
+                tokens = self._agent_tokens(self._inputs(text, history), config)
+            async for token in tokens:
+                yield token
+        finally:
+            clear_prefetched_search()
+
+    async def quick_reply(self, text: str, history: Optional[List[dict]] = None) -> str:
+        """Degradação nível 2: modelo menor, sem ferramentas, resposta curta."""
+        payload = self._inputs(text, history, tools=False)
+        response = await self.quick_chain.ainvoke(payload, config={"callbacks": [self.latency_handler()]})
+        return response.content
+
+    def quick_stream(self, text: str, history: Optional[List[dict]] = None) -> AsyncIterator[str]:
+        payload = self._inputs(text, history, tools=False)
+        return self._chain_tokens(self.quick_chain, payload, {"callbacks": [self.latency_handler()]})
+
+    async def summarize(self, previous_summary: str, messages: List[dict]) -> str:
+        """Resumo curto da ligação para a ConversationMemory (roda fora do caminho da resposta)."""
+        transcript = "\n".join(
+            f"{'Cliente' if m['role'] == 'user' else 'Consultora'}: {m['content']}" for m in messages
+        )
+        response = await self.llm.bind(max_tokens=settings.MEMORY_SUMMARY_TOKENS).ainvoke([
+            ("system", MEMORY_SUMMARY_PROMPT),
+            ("user", f"Resumo anterior: {previous_summary or '(nenhum)'}\n\nTrechos novos:\n{transcript}"),
+        ])
+        return response.content
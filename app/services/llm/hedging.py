@@ -0,0 +1,43 @@
+# app/services/llm/hedging.py
+from typing import Any, AsyncIterator, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from app.core.resilience import HedgePolicy, hedged_call, hedged_stream
+
+
+class HedgedChatModel(Runnable):
+    """
+    Hedge de cada requisição ao modelo, não do turno inteiro: passou do p95 sem o primeiro
+    chunk, dispara a mesma requisição de novo e fica com a que responder primeiro. Dentro do
+    agente isso vale para a chamada de planejamento e para a final, separadamente; as
+    ferramentas entre elas rodam uma vez só e o hedge repete no máximo uma ida ao LLM.
+    """
+
+    def __init__(self, model: Runnable, policy: Optional[HedgePolicy] = None):
+        self.model = model
+        self.policy = policy or HedgePolicy()
+
+    @property
+    def InputType(self):
+        return self.model.InputType
+
+    @property
+    def OutputType(self):
+        return self.model.OutputType
+
+    def bind(self, **kwargs: Any) -> "HedgedChatModel":
+        # create_openai_tools_agent chama llm.bind(tools=...): o hedge fica em volta do modelo com as ferramentas
+        return HedgedChatModel(self.model.bind(**kwargs), self.policy)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        # Síncrono só em scripts: sem hedge
+        return self.model.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await hedged_call(lambda: self.model.ainvoke(input, config, **kwargs), self.policy)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Optional[Any]) -> AsyncIterator[Any]:
+        # O AgentExecutor chama o modelo por astream até no ainvoke: a corrida é pelo primeiro chunk
+        async for chunk in hedged_stream(lambda: self.model.astream(input, config, **kwargs), self.policy):
+            yield chunk
@@ -0,0 +1,131 @@
+# app/services/llm/prompt_builder.py
+import hashlib
+import json
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.documents import Document
+from langchain_core.messages import SystemMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from app.core.config import settings
+from app.core.telemetry import record_tokens
+from app.services.llm.prompts import BASE_IDENTITY, CLOSING_TECHNIQUE, SALES_STRATEGY, SYSTEM_PROMPT
+from app.services.llm.tokens import count_message_tokens, count_tokens, truncate_tokens
+
+# Prefixo fixo, sempre nesta ordem e idêntico byte a byte: é ele que o cache de prompt da OpenAI reaproveita
+PREFIX_SECTIONS = (
+    ("identity", BASE_IDENTITY),
+    ("sales_strategy", SALES_STRATEGY),
+    ("closing", CLOSING_TECHNIQUE),
+)
+
+NO_KNOWLEDGE_MESSAGE = "Não encontrei informações específicas sobre isso no manual das operadoras."
+
+
+class PromptBuilder:
+    """
+    Monta as partes do prompt do agente com orçamento de tokens.
+    Ordem: prefixo fixo (SYSTEM_PROMPT + schemas das ferramentas) -> histórico -> fala do cliente ->
+    trechos da base. Tudo que muda por turno fica depois do prefixo, para o cache de prompt acertar
+    em todos os passos do agente; histórico e trechos são cortados no orçamento do Settings.
+    """
+
+    def __init__(
+        self,
+        model: str = None,
+        knowledge_budget: int = None,
+        chunk_limit: int = None,
+        history_budget: int = None,
+    ):
+        self.model = model or settings.OPENAI_MODEL
+        self.knowledge_budget = knowledge_budget or settings.PROMPT_KNOWLEDGE_TOKEN_BUDGET
+        self.chunk_limit = chunk_limit or settings.PROMPT_CHUNK_TOKEN_LIMIT
+        self.history_budget = history_budget or settings.PROMPT_HISTORY_TOKEN_BUDGET
+        # Mensagem pronta (não é template): nenhuma formatação por turno mexe no prefixo
+        self.system_message = SystemMessage(content=SYSTEM_PROMPT)
+        self.section_tokens: Dict[str, int] = {name: count_tokens(text, self.model) for name, text in PREFIX_SECTIONS}
+        self.system_tokens = count_tokens(SYSTEM_PROMPT, self.model)
+        self.tool_tokens = 0
+        self._tool_names: tuple = ()
+
+    @property
+    def prefix_fingerprint(self) -> str:
+        return hashlib.sha1(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+    def set_tools(self, tools: Sequence):
+        """Conta os schemas das ferramentas (vão no prefixo de toda chamada do agente)."""
+        names = tuple(tool.name for tool in tools)
+        if names == self._tool_names:
+            # Já contado (ex.: no preload do gunicorn, antes do fork)
+            return
+        self._tool_names = names
+        schemas = [convert_to_openai_tool(tool) for tool in tools]
+        self.tool_tokens = count_tokens(json.dumps(schemas, ensure_ascii=False, sort_keys=True), self.model)
+
+    def history(self, messages: List[dict]) -> List[dict]:
+        """
+        Histórico dentro do orçamento: o resumo (mensagem system da ConversationMemory) fica,
+        e entram as falas mais recentes que couberem.
+        """
+        if not messages or count_message_tokens(messages, self.model) <= self.history_budget:
+            return list(messages or [])
+        head = [m for m in messages[:1] if m.get("role") == "system"]
+        body = messages[len(head):]
+        budget = self.history_budget - count_message_tokens(head, self.model)
+        kept = []
+        for message in reversed(body):
+            budget -= count_message_tokens([message], self.model)
+            if budget < 0:
+                break
+            kept.append(message)
+        return head + kept[::-1]
+
+    def knowledge(self, docs: List[Document]) -> str:
+        """Trechos da base (com Administradora e Categoria), cada um e a soma dentro do orçamento."""
+        result_chunks, used = [], 0
+        for doc in docs:
+            admin = doc.metadata.get('administradora', 'Geral')
+            cat = doc.metadata.get('categoria', 'Informativo')
+            chunk = f"[{admin} - {cat}]: {truncate_tokens(doc.page_content, self.chunk_limit, self.model)}"
+            tokens = count_tokens(chunk, self.model)
+            if result_chunks and used + tokens > self.knowledge_budget:
+                break
+            result_chunks.append(chunk)
+            used += tokens
+
+        if not result_chunks:
+            return NO_KNOWLEDGE_MESSAGE
+        record_tokens("knowledge", used)
+        result_text = "\n\n".join(result_chunks)
+        return f"Informações encontradas na Base de Conhecimento:\n{result_text}"
+
+    def report(self, text: str, history: List[dict], tools: bool = True) -> Dict[str, int]:
+        """Tokens do turno por seção (log JSON do turno + histograma barcelona_prompt_tokens)."""
+        breakdown = {
+            "system": self.system_tokens,
+            "tools": self.tool_tokens if tools else 0,
+            "history": count_message_tokens(history, self.model),
+            "input": count_tokens(text, self.model),
+        }
+        for section, tokens in breakdown.items():
+            record_tokens(section, tokens)
+        return breakdown
+
+    def stats(self) -> dict:
+        return {
+            "prefix_fingerprint": self.prefix_fingerprint,
+            "sections": {**self.section_tokens, "tools": self.tool_tokens},
+            "prefix_tokens": self.system_tokens + self.tool_tokens,
+            "budgets": {"knowledge": self.knowledge_budget, "chunk": self.chunk_limit, "history": self.history_budget},
+        }
+
+
+_prompt_builder: Optional[PromptBuilder] = None
+
+
+def get_prompt_builder() -> PromptBuilder:
+    # Criado no primeiro uso (contar o prompt fixo não precisa atrasar o import)
+    global _prompt_builder
+    if _prompt_builder is None:
+        _prompt_builder = PromptBuilder()
+    return _prompt_builder
@@ -0,0 +1,57 @@
+# app/services/llm/tokens.py
+from functools import lru_cache
+from typing import Iterable
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Custo fixo aproximado de cada mensagem no formato de chat (role + separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=4)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Modelo que o tiktoken ainda não conhece: usa o vocabulário da família gpt-4o
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+    except Exception:
+        # Sem rede para baixar o vocabulário: usa a aproximação
+        return None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """
+    Tokens do texto para o modelo (aproximação len/4 se não houver tiktoken).
+    Com cache: prompt fixo, trechos da base e falas da memória são contados uma vez só.
+    """
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = "gpt-4o-mini") -> str:
+    """Corta o texto em `max_tokens` tokens (no fim), sem quebrar caractere."""
+    if not text or count_tokens(text, model) <= max_tokens:
+        return text
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[: max_tokens * 4]
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+
+def count_message_tokens(messages: Iterable[dict], model: str = "gpt-4o-mini") -> int:
+    """Tokens de uma lista de mensagens {"role", "content"} como o modelo vai recebê-las."""
+    return sum(count_tokens(m.get("content") or "", model) + MESSAGE_OVERHEAD_TOKENS for m in messages)
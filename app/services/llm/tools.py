@@ -1,15 +1,59 @@
 # app/services/llm/tools.py
-try:
-    from langchain_pinecone import PineconeVectorStore
-except ImportError:
-    from langchain_pinecone import Pinecone as PineconeVectorStore
-
-from langchain.tools import tool
-from langchain_openai import OpenAIEmbeddings
+import asyncio
+import logging
+import re
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, TYPE_CHECKING
+import numpy as np
 from app.core.config import settings
+from app.core.resilience import current_budget
+from app.core.telemetry import count_degradation
+from app.services.rag.price_tables import EXACT_PRAZO_SOURCES, PriceTableStore, infer_subcategoria
+from app.services.rag.vectorstore import get_retriever
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+_price_store: Optional[PriceTableStore] = None
+_price_store_loaded = False
+
+# Ferramentas do agente montadas no primeiro uso (get_agent_tools): o decorator @tool do
+# LangChain gera os schemas pydantic e puxa langchain_core.tools, caro para quem só quer
+# a conta da parcela ou a tabela de preços (intents, scripts)
+_agent_tools: Optional[list] = None
+
+# Busca antecipada do turno: o LLMEngine dispara a busca com a fala do cliente enquanto
+# o LLM ainda decide se vai chamar a ferramenta ({"task": asyncio.Task} ou None)
+SEARCH_TIMEOUT_MESSAGE = (
+    "A base de conhecimento não respondeu a tempo. Responda sem citar regras específicas "
+    "e diga que a Fernanda confirma esse detalhe na reunião."
+)
+
+_prefetched_search: ContextVar[Optional[dict]] = ContextVar("barcelona_prefetched_search", default=None)
+
+# Simulação em lote: teto de cenários por chamada (a tabela volta inteira para o prompt)
+MAX_SCENARIOS = 36
+_RANGE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(?:-|a|até)\s*(\d+(?:\.\d+)?)\s*(?::|passo|de)\s*(\d+(?:\.\d+)?)\s*$")
+# Números em pt-BR: "200.000" (milhar) e "17,5" (decimal) viram 200000 e 17.5 antes de separar a lista
+_THOUSANDS_RE = re.compile(r"\b\d{1,3}(?:\.\d{3})+\b")
+_DECIMAL_COMMA_RE = re.compile(r"(\d),(\d{1,2})\b")
+
+
+def get_price_store() -> Optional[PriceTableStore]:
+    # Carregado uma vez por worker (arquivo gerado pelo scripts/ingest.py)
+    global _price_store, _price_store_loaded
+    if not _price_store_loaded:
+        _price_store = PriceTableStore.load(settings.PRICE_TABLES_DIR)
+        _price_store_loaded = True
+    return _price_store
 
-@tool
-def calculate_consortium_installment(credit_value: float, months: int, admin_tax_percent: float) -> str:
+def estimate_installment(credit_value: float, months: int, admin_tax_percent: float) -> float:
+    """Parcela mensal = (crédito + taxa administrativa total) / prazo."""
+    return credit_value * (1 + admin_tax_percent / 100) / months
+
+def _calculate_consortium_installment(credit_value: float, months: int, admin_tax_percent: float) -> str:
     """
     Calcula a parcela estimada de um consórcio.
     Use para simular valores quando o cliente perguntar o preço.
@@ -20,14 +64,8 @@ def calculate_consortium_installment(credit_value: float, months: int, admin_tax
         admin_tax_percent: Taxa administrativa total em porcentagem (ex: 18 para 18%)
     """
     try:
-        # Cálculo da Taxa Total em Reais
-        total_tax = credit_value * (admin_tax_percent / 100)
-        
-        # Montante Total a Pagar
-        total_payable = credit_value + total_tax
-        
-        # Parcela Mensal
-        monthly_installment = total_payable / months
+        # Parcela Mensal (crédito + taxa total, dividido pelo prazo)
+        monthly_installment = estimate_installment(credit_value, months, admin_tax_percent)
         
         return (
             f"--- SIMULAÇÃO ---\n"
@@ -39,45 +77,276 @@ def calculate_consortium_installment(credit_value: float, months: int, admin_tax
     except Exception as e:
         return "Erro no cálculo. Verifique os números."
 
-@tool
-def search_knowledge_base(query: str) -> str:
+def _brl(value: float, decimals: int = 2) -> str:
+    """1311.1 -> 'R$ 1.311,10' (formato falado em português)."""
+    return "R$ " + f"{value:,.{decimals}f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+
+def _brl_whole(value: float) -> str:
+    return _brl(value, 0)
+
+
+def parse_values(text) -> np.ndarray:
+    """
+    Lista ("120; 180; 200") ou faixa com passo ("100000-300000:50000") vinda do LLM, com números
+    em pt-BR ("200.000", "17,5"). Aceita também um número solto. ValueError se não der para ler.
+    """
+    if isinstance(text, (int, float)):
+        return np.array([float(text)])
+    text = str(text).replace("R$", "").replace("%", "").strip()
+    text = _THOUSANDS_RE.sub(lambda m: m.group(0).replace(".", ""), text)
+    # Vírgula entre dígitos com até 2 casas é decimal; as outras ("120,180", "15, 20") separam a lista
+    text = _DECIMAL_COMMA_RE.sub(r"\1.\2", text)
+    match = _RANGE_RE.match(text)
+    if match:
+        start, stop, step = (float(group) for group in match.groups())
+        if step <= 0 or stop < start:
+            raise ValueError(f"Faixa inválida: {text}")
+        return np.arange(start, stop + step / 2, step)
+    values = [float(token) for token in re.split(r"[;,\s]+", text) if token]
+    if not values:
+        raise ValueError("Nenhum valor informado")
+    return np.array(values)
+
+
+def simulate_scenarios(
+    credit_values: np.ndarray,
+    months: np.ndarray,
+    admin_tax_percents: np.ndarray,
+    reserve_fund_percent: float = 0.0,
+    insurance_monthly_percent: float = 0.0,
+    embedded_bid_percent: float = 0.0,
+) -> Dict[str, np.ndarray]:
+    """
+    Todas as combinações crédito x prazo x taxa numa passada só (arrays achatados, nessa ordem).
+    - Parcela: mesma conta da estimate_installment, com o fundo de reserva somado à taxa, mais o
+      seguro mensal sobre o crédito.
+    - Lance embutido: sai da própria carta (crédito líquido menor) e abate o saldo devedor; a parcela
+      pós-lance é o saldo restante dividido pelo mesmo prazo.
+    """
+    credit, term, tax = (grid.ravel() for grid in np.meshgrid(credit_values, months, admin_tax_percents, indexing="ij"))
+    total_debt = credit * (1 + (tax + reserve_fund_percent) / 100)
+    insurance = credit * insurance_monthly_percent / 100
+    installment = total_debt / term + insurance
+    bid = credit * embedded_bid_percent / 100
+    return {
+        "credit": credit,
+        "months": term,
+        "tax": tax,
+        "installment": installment,
+        "installment_after_bid": (total_debt - bid) / term + insurance,
+        "net_credit": credit - bid,
+        "total_paid": installment * term,
+    }
+
+
+def _format_table(result: Dict[str, np.ndarray], reserve: float, insurance: float, bid: float) -> str:
+    """Tabela compacta: o que é igual em todos os cenários vai para o cabeçalho, não para cada linha."""
+    header = [f"--- SIMULAÇÃO: {len(result['credit'])} CENÁRIOS ---"]
+    columns = []
+    for key, label, fmt in (
+        ("credit", "Crédito", _brl_whole),
+        ("months", "Prazo", lambda v: f"{v:g} meses"),
+        ("tax", "Taxa", lambda v: f"{v:g}%".replace(".", ",")),
+    ):
+        if np.unique(result[key]).size == 1:
+            header.append(f"{label}: {fmt(result[key][0])}")
+        else:
+            columns.append((key, label, fmt))
+    extras = []
+    if reserve:
+        extras.append(f"Fundo de Reserva: {reserve:g}%")
+    if insurance:
+        extras.append(f"Seguro: {insurance:g}% a.m.")
+    if bid:
+        extras.append(f"Lance Embutido: {bid:g}% (crédito líquido = crédito - lance)")
+    if extras:
+        header.append(" | ".join(extras))
+
+    columns.append(("installment", "Parcela", _brl))
+    if bid:
+        columns.extend([("installment_after_bid", "Pós-lance", _brl), ("net_credit", "Crédito Líquido", _brl_whole)])
+    columns.append(("total_paid", "Total Pago", _brl_whole))
+
+    lines = header + [" | ".join(label for _, label, _ in columns)]
+    for i in range(len(result["credit"])):
+        lines.append(" | ".join(fmt(result[key][i]) for key, _, fmt in columns))
+    return "\n".join(lines)
+
+
+def _in_percent_range(values: np.ndarray) -> bool:
+    return bool(((values >= 0) & (values < 100)).all())
+
+
+def _simulate_consortium_scenarios(
+    credit_values: str,
+    months: str,
+    admin_tax_percents: str,
+    reserve_fund_percent: float = 0.0,
+    insurance_monthly_percent: float = 0.0,
+    embedded_bid_percent: float = 0.0,
+) -> str:
+    """
+    Simula VÁRIOS cenários de consórcio de uma vez e devolve uma tabela comparativa.
+    Use quando o cliente comparar prazos, créditos ou administradoras (ex.: "e em 120, 180 ou 200 meses?"),
+    em vez de chamar a simulação várias vezes. Separe os valores da lista com ";".
+
+    Args:
+        credit_values: Créditos, lista ou faixa com passo (ex: "200000" ou "150.000; 200.000" ou "100000-300000:50000")
+        months: Prazos em meses, lista ou faixa (ex: "120; 180; 200" ou "60-240:60")
+        admin_tax_percents: Taxas administrativas totais em % (ex: "18" ou "15; 17,5; 20"), uma por administradora
+        reserve_fund_percent: Fundo de reserva total em % (ex: 2), 0 se não informado
+        insurance_monthly_percent: Seguro mensal em % do crédito (ex: 0.035), 0 se não informado
+        embedded_bid_percent: Lance embutido em % do crédito (ex: 25), 0 se não houver
+    """
+    try:
+        grids = [parse_values(credit_values), parse_values(months), parse_values(admin_tax_percents)]
+    except ValueError:
+        return "Erro no cálculo. Informe números separados por ponto e vírgula ou uma faixa (ex: 100000-300000:50000)."
+    size = int(np.prod([grid.size for grid in grids]))
+    if size > MAX_SCENARIOS:
+        return f"São {size} cenários; simule no máximo {MAX_SCENARIOS} de uma vez (menos créditos, prazos ou taxas)."
+    credits, prazos, taxas = grids
+    percents = np.array([reserve_fund_percent, insurance_monthly_percent, embedded_bid_percent], dtype=float)
+    # Crédito e prazo positivos; taxa, fundo, seguro e lance em [0, 100) (NaN também cai aqui)
+    if not ((credits > 0).all() and (prazos > 0).all() and _in_percent_range(taxas) and _in_percent_range(percents)):
+        return "Erro no cálculo. Verifique os números."
+
+    result = simulate_scenarios(*grids, reserve_fund_percent, insurance_monthly_percent, embedded_bid_percent)
+    return _format_table(result, reserve_fund_percent, insurance_monthly_percent, embedded_bid_percent)
+
+def _lookup_price_table(credit_value: float, months: int, administradora: str = "", categoria: str = "") -> str:
+    """
+    Consulta a tabela de preços das administradoras (parcela por crédito e prazo, lida dos PDFs).
+    Use quando o cliente perguntar a parcela de um crédito em um prazo, ex.: "200 mil em 180 meses na Embracon".
+    Prefira esta ferramenta à simulação quando houver tabela da administradora.
+
+    Args:
+        credit_value: Valor da carta de crédito (ex: 200000)
+        months: Prazo em meses (ex: 180)
+        administradora: Nome da administradora, se o cliente citou (ex: "Embracon", "Ademicon")
+        categoria: Tipo do bem, se o cliente citou (ex: "imóvel", "carro", "moto", "caminhão", "serviços")
+    """
+    try:
+        store = get_price_store()
+        if store is None:
+            return "Tabela de preços indisponível no momento. Use a simulação e diga que a Fernanda confirma os valores."
+
+        row = store.lookup(credit_value, months, administradora=administradora, subcategoria=infer_subcategoria(categoria))
+        if row is None:
+            return "Não encontrei tabela para essa administradora/categoria. Use a simulação e diga que a Fernanda confirma os valores."
+
+        # Prazo deduzido do layout do PDF (não lido do cabeçalho) não é apresentado como exato
+        exact = row["prazo_source"] in EXACT_PRAZO_SOURCES
+        lines = [
+            "--- TABELA DA ADMINISTRADORA ---" if exact else "--- TABELA DA ADMINISTRADORA (VALOR APROXIMADO) ---",
+            f"Administradora: {row['administradora']} ({row['subcategoria']})",
+            f"Plano: {row['plano']} | Código: {row['codigo']}",
+            f"Crédito: R$ {row['credito']:,.2f}",
+            f"Prazo: {row['prazo']} meses",
+            f"Parcela: R$ {row['parcela']:,.2f}",
+        ]
+        if row["primeira_parcela"] is not None:
+            lines.append(f"1ª Parcela: R$ {row['primeira_parcela']:,.2f}")
+        if row["fundo_reserva_pct"] is not None:
+            lines.append(f"Fundo de Reserva: {row['fundo_reserva_pct']}%")
+        if row["credito"] != credit_value or row["prazo"] != months:
+            lines.append("Obs.: valor mais próximo disponível na tabela.")
+        if not exact:
+            lines.append("Obs.: valor aproximado (prazo deduzido do layout do PDF); a Fernanda confirma na reunião.")
+        return "\n".join(lines)
+    except Exception as e:
+        print(f"❌ Erro na tabela de preços: {e}")
+        return "Erro ao consultar a tabela de preços."
+
+def format_knowledge(docs: List["Document"]) -> str:
+    """Trechos da base com os metadados de Administradora e Categoria, dentro do orçamento de tokens."""
+    from app.services.llm.prompt_builder import get_prompt_builder
+
+    return get_prompt_builder().knowledge(docs)
+
+
+def start_prefetched_search(query: str) -> asyncio.Task:
+    """Dispara a busca na base para o turno atual; a primeira chamada da ferramenta reaproveita."""
+    task = asyncio.create_task(get_retriever().asearch(query))
+    # Busca que ninguém usou não pode deixar exceção "nunca recuperada" no log
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    _prefetched_search.set({"task": task})
+    return task
+
+
+def clear_prefetched_search():
+    _prefetched_search.set(None)
+
+
+async def take_prefetched_search() -> Optional[List["Document"]]:
+    """Resultado da busca antecipada (uma vez por turno). None = não havia ou ela falhou."""
+    holder = _prefetched_search.get()
+    task = holder.pop("task", None) if holder else None
+    if task is None:
+        return None
+    try:
+        return await task
+    except Exception as e:
+        logger.warning(f"⚠️ Busca antecipada falhou, buscando de novo: {e}")
+        return None
+
+
+async def _search(query: str) -> List["Document"]:
+    # 1. Se o LLMEngine já começou a busca com a fala do cliente, usa o resultado dela
+    docs = await take_prefetched_search()
+    if docs is None:
+        # 2. Senão busca agora, com o retriever do worker (conexões já abertas)
+        docs = await get_retriever().asearch(query)
+    return docs
+
+
+async def _search_knowledge_base(query: str) -> str:
     """
     Busca informações específicas no Manual de Vendas da Barcelona Partners.
     USE SEMPRE que o cliente perguntar sobre regras, taxas, lances, FGTS ou funcionamento.
     Não invente regras, consulte esta ferramenta.
     """
     try:
-        # 1. Configura a tradução (Embeddings)
-        embeddings = OpenAIEmbeddings(
-            api_key=settings.OPENAI_API_KEY,
-            model="text-embedding-3-small"
-        )
+        # Nunca espera mais que o RAG_TIMEOUT_SECONDS (nem que o orçamento restante do turno)
+        docs = await asyncio.wait_for(_search(query), current_budget().stage_timeout(settings.RAG_TIMEOUT_SECONDS))
+        return format_knowledge(docs)
 
-        # 2. Conecta no Banco de Memória (Pinecone)
-        vectorstore = PineconeVectorStore(
-            index_name="barcelona-index",
-            embedding=embeddings,
-            pinecone_api_key=settings.PINECONE_API_KEY
-        )
+    except asyncio.TimeoutError:
+        # Degradação nível 1: segue sem o manual em vez de deixar o cliente no silêncio
+        count_degradation("skip_rag")
+        return SEARCH_TIMEOUT_MESSAGE
 
-        # 3. Faz a busca dos 3 trechos mais parecidos com a pergunta
-        docs = vectorstore.similarity_search(query, k=3)
-        
-        # 4. Junta as respostas incluindo os metadados de Administradora e Categoria
-        result_chunks = []
-        for doc in docs:
-            admin = doc.metadata.get('administradora', 'Geral')
-            cat = doc.metadata.get('categoria', 'Informativo')
-            conteudo = doc.page_content
-            result_chunks.append(f"[{admin} - {cat}]: {conteudo}")
-
-        result_text = "\n\n".join(result_chunks)
-        
-        if not result_text:
-            return "Não encontrei informações específicas sobre isso no manual das operadoras."
-            
-        return f"Informações encontradas na Base de Conhecimento:\n{result_text}"
-        
     except Exception as e:
         print(f"❌ Erro no RAG: {e}")
-        return "Erro ao consultar o manual interno."
\ No newline at end of file
+        return "Erro ao consultar o manual interno."
+
+
+# Nome da ferramenta (o que o LLM vê) -> função; a ordem é a do prefixo do prompt
+AGENT_TOOL_FUNCTIONS: Dict[str, Callable] = {
+    "calculate_consortium_installment": _calculate_consortium_installment,
+    "simulate_consortium_scenarios": _simulate_consortium_scenarios,
+    "lookup_price_table": _lookup_price_table,
+    "search_knowledge_base": _search_knowledge_base,
+}
+
+
+def get_agent_tools() -> list:
+    """
+    Ferramentas do agente (StructuredTool), criadas uma vez por processo. Com o gunicorn --preload
+    são montadas no master e os workers herdam os objetos prontos.
+    """
+    global _agent_tools
+    if _agent_tools is None:
+        from langchain_core.tools import tool
+
+        _agent_tools = [tool(name)(func) for name, func in AGENT_TOOL_FUNCTIONS.items()]
+    return _agent_tools
+
+
+def __getattr__(name: str):
+    # Compatibilidade: `from app.services.llm.tools import search_knowledge_base` continua
+    # devolvendo a ferramenta do LangChain (ex.: test_rag.py)
+    if name in AGENT_TOOL_FUNCTIONS:
+        return get_agent_tools()[list(AGENT_TOOL_FUNCTIONS).index(name)]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,240 @@
+# app/services/memory.py
+import asyncio
+import json
+import logging
+import weakref
+from typing import Awaitable, Callable, List, Optional, Union
+
+from app.core.config import settings
+from app.services.llm.tokens import count_message_tokens, count_tokens
+from app.services.rag.cache import TTLLRUCache
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# IDs usados quando a Vapi não manda o call.id: sem sessão, senão ligações diferentes se misturam
+ANONYMOUS_CALL_IDS = {"", "unknown", "vapi_call"}
+
+# Depois de compactar, a janela fica abaixo do orçamento para não resumir a cada turno
+LOW_WATER_RATIO = 0.6
+
+# (resumo anterior, mensagens que saíram da janela) -> resumo novo
+Summarizer = Callable[[str, List[dict]], Awaitable[str]]
+# Histórico mandado pela Vapi: lista pronta ou função que monta a lista só se for preciso
+Transcript = Union[List[dict], Callable[[], List[dict]], None]
+
+
+def history_from_openai_messages(messages: List[dict]) -> List[dict]:
+    """
+    Converte o `messages` que a Vapi manda (formato OpenAI) em histórico {"role", "content"}.
+    Fica só com falas do cliente e da consultora e tira a última pergunta (ela é o input do turno).
+    """
+    history = [
+        {"role": m.get("role"), "content": m.get("content")}
+        for m in messages or []
+        if m.get("role") in ("user", "assistant") and isinstance(m.get("content"), str) and m.get("content")
+    ]
+    if history and history[-1]["role"] == "user":
+        history.pop()
+    return history
+
+
+class InMemorySessionStore:
+    """Sessões no processo do worker (LRU + TTL). Cada worker do gunicorn tem as suas."""
+
+    def __init__(self, max_sessions: int, ttl_seconds: float):
+        self._sessions = TTLLRUCache(max_sessions, ttl_seconds)
+
+    async def get(self, call_id: str) -> Optional[dict]:
+        return self._sessions.get(call_id)
+
+    async def set(self, call_id: str, session: dict):
+        self._sessions.set(call_id, session)
+
+    async def close(self):
+        self._sessions.clear()
+
+
+class RedisSessionStore:
+    """Sessões no Redis: a ligação mantém o histórico mesmo se o turno cair em outro worker."""
+
+    def __init__(self, url: str, ttl_seconds: int, prefix: str = "barcelona:call:"):
+        self.client = aioredis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    async def get(self, call_id: str) -> Optional[dict]:
+        raw = await self.client.get(self.prefix + call_id)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, call_id: str, session: dict):
+        await self.client.set(self.prefix + call_id, json.dumps(session, ensure_ascii=False), ex=self.ttl_seconds)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def build_session_store():
+    if settings.REDIS_URL and aioredis is not None:
+        return RedisSessionStore(settings.REDIS_URL, settings.MEMORY_TTL_SECONDS)
+    if settings.REDIS_URL:
+        logger.warning("⚠️ REDIS_URL definido mas o pacote 'redis' não está instalado. Memória só no worker.")
+    return InMemorySessionStore(settings.MEMORY_MAX_SESSIONS, settings.MEMORY_TTL_SECONDS)
+
+
+class ConversationMemory:
+    """
+    Histórico por ligação (call.id da Vapi) com orçamento de tokens fixo.
+    As mensagens recentes vão inteiras para o prompt; as que estouram o orçamento saem da janela
+    e viram um resumo curto. O prompt fica do mesmo tamanho, por mais longa que seja a ligação.
+    """
+
+    def __init__(
+        self,
+        store=None,
+        summarizer: Optional[Summarizer] = None,
+        token_budget: int = None,
+        summary_tokens: int = None,
+        model: str = None,
+    ):
+        self.store = store or InMemorySessionStore(settings.MEMORY_MAX_SESSIONS, settings.MEMORY_TTL_SECONDS)
+        self.summarizer = summarizer
+        self.token_budget = token_budget or settings.MEMORY_TOKEN_BUDGET
+        self.summary_tokens = summary_tokens or settings.MEMORY_SUMMARY_TOKENS
+        self.model = model or settings.OPENAI_MODEL
+        # Um lock por ligação ativa (some sozinho quando ninguém mais usa)
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._summary_tasks = set()
+
+    @staticmethod
+    def is_tracked(call_id: Optional[str]) -> bool:
+        return bool(call_id) and call_id not in ANONYMOUS_CALL_IDS
+
+    def _lock(self, call_id: str) -> asyncio.Lock:
+        lock = self._locks.get(call_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[call_id] = lock
+        return lock
+
+    def _window_budget(self) -> int:
+        return max(self.token_budget - self.summary_tokens, 0)
+
+    def _split(self, messages: List[dict], budget: int):
+        """Separa (saem, ficam): fica o maior sufixo de mensagens que cabe no orçamento."""
+        kept_tokens, cut = 0, len(messages)
+        for i in range(len(messages) - 1, -1, -1):
+            kept_tokens += count_message_tokens([messages[i]], self.model)
+            if kept_tokens > budget:
+                break
+            cut = i
+        return messages[:cut], messages[cut:]
+
+    def _fallback_summary(self, previous: str, dropped: List[dict]) -> str:
+        """Resumo sem LLM: o que o cliente disse nas falas que saíram da janela (o mais recente fica)."""
+        said = [m["content"] for m in dropped if m["role"] == "user"]
+        text = " | ".join(part for part in [previous, *said] if part)
+        if count_tokens(text, self.model) > self.summary_tokens:
+            text = text[-self.summary_tokens * 4:]
+        return text
+
+    def _compact(self, session: dict, low_water: bool) -> List[dict]:
+        """Tira da janela o que passou do orçamento; devolve as mensagens removidas."""
+        messages = session["messages"]
+        if count_message_tokens(messages, self.model) <= self._window_budget():
+            return []
+        budget = int(self._window_budget() * (LOW_WATER_RATIO if low_water else 1.0))
+        dropped, kept = self._split(messages, budget)
+        session["messages"] = kept
+        session["summary"] = self._fallback_summary(session.get("summary", ""), dropped)
+        # Número da compactação: o resumo por LLM só vale se nenhuma outra aconteceu depois dele
+        session["compactions"] = session.get("compactions", 0) + 1
+        return dropped
+
+    async def load(self, call_id: Optional[str], transcript: Transcript = None, timeout: Optional[float] = None) -> dict:
+        """
+        Sessão da ligação. Se o worker ainda não a conhece (primeiro turno, reinício, outro worker
+        sem Redis) ou o store não responde em `timeout` s, usa o histórico que a própria Vapi
+        mandou no `messages`.
+        """
+        session = None
+        if self.is_tracked(call_id):
+            try:
+                session = await asyncio.wait_for(self.store.get(call_id), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"⏱️ Memória da ligação {call_id} não respondeu em {timeout:.2f}s; usando o histórico da Vapi")
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao ler a memória da ligação {call_id}: {e}")
+        if session is None:
+            if callable(transcript):
+                transcript = transcript()
+            session = {"summary": "", "messages": list(transcript or [])}
+            self._compact(session, low_water=False)
+        return session
+
+    def history(self, session: dict) -> List[dict]:
+        """Mensagens que vão para o prompt: resumo (se houver) + janela recente."""
+        history = []
+        if session.get("summary"):
+            history.append({"role": "system", "content": f"Resumo da ligação até aqui: {session['summary']}"})
+        return history + session["messages"]
+
+    async def append(self, call_id: Optional[str], session: dict, user_message: str, reply: str):
+        """Grava o turno. Se passar do orçamento, compacta e (opcionalmente) resume em segundo plano."""
+        if not self.is_tracked(call_id):
+            return
+        async with self._lock(call_id):
+            # Um _summarize pode ter gravado o resumo por LLM depois do load deste turno: fica o do store
+            try:
+                stored = await asyncio.wait_for(self.store.get(call_id), settings.MEMORY_TIMEOUT_SECONDS)
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao reler a memória da ligação {call_id}: {e!r}")
+                stored = None
+            if stored is not None and stored is not session:
+                session["summary"] = stored.get("summary", "")
+                session["compactions"] = max(stored.get("compactions", 0), session.get("compactions", 0))
+            if user_message:
+                session["messages"].append({"role": "user", "content": user_message})
+            if reply:
+                session["messages"].append({"role": "assistant", "content": reply})
+            previous_summary = session.get("summary", "")
+            dropped = self._compact(session, low_water=True)
+            try:
+                await asyncio.wait_for(self.store.set(call_id, session), settings.MEMORY_TIMEOUT_SECONDS)
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao gravar a memória da ligação {call_id}: {e!r}")
+                return
+
+        if dropped and self.summarizer is not None:
+            # O resumo por LLM sai do caminho da resposta: até ficar pronto vale o resumo simples
+            task = asyncio.create_task(self._summarize(call_id, previous_summary, dropped, session["compactions"]))
+            self._summary_tasks.add(task)
+            task.add_done_callback(self._summary_tasks.discard)
+
+    async def _summarize(self, call_id: str, previous_summary: str, dropped: List[dict], compaction: int):
+        try:
+            summary = await self.summarizer(previous_summary, dropped)
+        except Exception as e:
+            logger.warning(f"⚠️ Resumo da ligação {call_id} falhou, mantendo o resumo simples: {e}")
+            return
+        if not summary:
+            return
+        async with self._lock(call_id):
+            try:
+                session = await self.store.get(call_id)
+                # Outra compactação depois desta: o resumo dela (simples ou por LLM) já inclui este trecho
+                if session is None or session.get("compactions", 0) != compaction:
+                    return
+                session["summary"] = summary.strip()
+                await self.store.set(call_id, session)
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao gravar o resumo da ligação {call_id}: {e!r}")
+
+    async def close(self):
+        for task in list(self._summary_tasks):
+            task.cancel()
+        await self.store.close()
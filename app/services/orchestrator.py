@@ -1,17 +1,158 @@
 # app/services/orchestrator.py
+import asyncio
+import logging
+from typing import AsyncIterator, List, Optional, Tuple
+from app.core.config import settings
+from app.core.resilience import TurnBudget, first_token, start_budget
+from app.core.telemetry import count_degradation, current_turn, span
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.intents import IntentRouter
 from app.services.llm.engine import LLMEngine
+from app.services.memory import ConversationMemory, Transcript
+
+logger = logging.getLogger(__name__)
 
 class ConversationOrchestrator:
-    def __init__(self):
-        self.llm_engine = LLMEngine()
+    def __init__(
+        self,
+        llm_engine: LLMEngine = None,
+        memory: ConversationMemory = None,
+        intent_router: Optional[IntentRouter] = None,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+    ):
+        # O engine e a memória normalmente vêm prontos do EngineRegistry (um por worker)
+        self.llm_engine = llm_engine or LLMEngine()
+        self.memory = memory or ConversationMemory()
+        # Fast path opcional: intents conhecidas são respondidas sem chamar o LLM
+        self.intent_router = intent_router
+        # Cache semântico opcional: FAQ repetida volta direto, sem plano + ferramenta + geração
+        self.answer_cache = answer_cache
+
+    async def _cached_answer(self, message: str, budget: TurnBudget):
+        if self.answer_cache is None:
+            return None, None
+        timeout = budget.stage_timeout(settings.ANSWER_CACHE_TIMEOUT_SECONDS, settings.DEGRADED_RESERVE_SECONDS)
+        try:
+            return await asyncio.wait_for(self.answer_cache.lookup(message), timeout)
+        except asyncio.TimeoutError:
+            # Embedding lento não pode comer o orçamento do agente: conta como miss
+            logger.warning(f"⏱️ Cache de respostas não respondeu em {timeout:.2f}s; seguindo para o agente")
+            return None, None
+        except Exception as e:
+            # Cache é só atalho: qualquer falha (ex.: embedding fora do ar) cai no agente
+            logger.warning(f"⚠️ Cache de respostas indisponível: {e}")
+            return None, None
+
+    @staticmethod
+    def _start_budget():
+        # O orçamento conta desde a chegada da requisição (mesmo início do TurnTrace)
+        trace = current_turn()
+        return start_budget(started=trace.started if trace is not None else None)
+
+    async def _load_session(self, call_id: str, transcript: Transcript, budget: TurnBudget) -> dict:
+        with span("memory_load"):
+            return await self.memory.load(call_id, transcript, timeout=budget.stage_timeout(settings.MEMORY_TIMEOUT_SECONDS))
 
-    async def get_response(self, message: str, call_id: str) -> str:
+    async def _reply_within_budget(self, message: str, history: List[dict], budget: TurnBudget) -> Tuple[str, str]:
+        """
+        Resposta em níveis, sem passar do orçamento do turno: agente completo (a busca na base
+        já tem timeout próprio) -> modelo menor sem ferramentas -> frase de espera.
+        Devolve (resposta, nível).
+        """
+        tiers = [
+            ("agent", lambda: self.llm_engine.generate_reply(message, history=history), settings.DEGRADED_RESERVE_SECONDS),
+            ("small_model", lambda: self.llm_engine.quick_reply(message, history=history), 0.0),
+        ]
+        for tier, make_reply, reserve in tiers:
+            try:
+                reply = await asyncio.wait_for(make_reply(), budget.remaining(reserve))
+                if reply:
+                    return reply, tier
+            except asyncio.TimeoutError:
+                logger.warning(f"⏱️ Nível '{tier}' estourou o orçamento do turno ({budget.elapsed():.2f}s)")
+            except Exception as e:
+                logger.error(f"❌ Nível '{tier}' falhou: {e}")
+        return settings.BRIDGE_MESSAGE, "bridge"
+
+    async def _stream_within_budget(
+        self, message: str, history: List[dict], outcome: dict, budget: TurnBudget
+    ) -> AsyncIterator[str]:
+        """Mesmos níveis do _reply_within_budget; no streaming o prazo vale até o primeiro token."""
+        tiers = [
+            ("agent", lambda: self.llm_engine.stream_reply(message, history=history), settings.DEGRADED_RESERVE_SECONDS),
+            ("small_model", lambda: self.llm_engine.quick_stream(message, history=history), 0.0),
+        ]
+        for tier, make_stream, reserve in tiers:
+            stream = make_stream()
+            try:
+                first = await first_token(stream, budget.remaining(reserve))
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    logger.warning(f"⏱️ Nível '{tier}' não começou a falar dentro do orçamento ({budget.elapsed():.2f}s)")
+                elif not isinstance(e, StopAsyncIteration):
+                    logger.error(f"❌ Nível '{tier}' falhou: {e}")
+                await stream.aclose()
+                continue
+            outcome["tier"] = tier
+            yield first
+            async for token in stream:
+                yield token
+            return
+        outcome["tier"] = "bridge"
+        yield settings.BRIDGE_MESSAGE
+
+    async def get_response(self, message: str, call_id: str, transcript: Transcript = None) -> str:
         """
         Recebe a mensagem do usuário e coordena a resposta da IA.
+        `transcript` é o histórico que a Vapi mandou; só é usado se a sessão da ligação não existir.
+        """
+        # O orçamento abre antes de tudo: memória e cache também contam no silêncio do cliente
+        budget = self._start_budget()
+        session = await self._load_session(call_id, transcript, budget)
+
+        match = self.intent_router.route(message, session["messages"]) if self.intent_router else None
+        if match is not None:
+            response = match.text
+        else:
+            response, vector = await self._cached_answer(message, budget)
+            if response is None:
+                history = self.memory.history(session)
+                # O "await" é obrigatório porque a função generate_reply é async (demorada)
+                response, tier = await self._reply_within_budget(message, history, budget)
+                if tier != "agent":
+                    count_degradation(tier)
+                elif self.answer_cache is not None:
+                    self.answer_cache.remember(message, response, vector, history)
+
+        with span("memory_save"):
+            await self.memory.append(call_id, session, message, response)
+        return response
+
+    async def stream_response(
+        self, message: str, call_id: str, transcript: Transcript = None
+    ) -> AsyncIterator[str]:
+        """
+        Versão em streaming do get_response: entrega os tokens assim que saem do LLM,
+        para a Vapi começar a falar antes da resposta inteira ficar pronta.
         """
-        # --- CORREÇÃO AQUI ---
-        # Antes estava provavelmente assim: return self.llm_engine.generate_reply(message)
-        # O "await" é obrigatório porque a função generate_reply é async (demorada)
-        response = await self.llm_engine.generate_reply(message)
-        
-        return response
\ No newline at end of file
+        budget = self._start_budget()
+        session = await self._load_session(call_id, transcript, budget)
+        parts = []
+        match = self.intent_router.route(message, session["messages"]) if self.intent_router else None
+        cached, vector = (None, None) if match is not None else await self._cached_answer(message, budget)
+        if match is not None or cached is not None:
+            text = match.text if match is not None else cached
+            parts.append(text)
+            yield text
+        else:
+            outcome = {}
+            history = self.memory.history(session)
+            async for token in self._stream_within_budget(message, history, outcome, budget):
+                parts.append(token)
+                yield token
+            if outcome.get("tier") != "agent":
+                count_degradation(outcome.get("tier", "bridge"))
+            elif self.answer_cache is not None:
+                self.answer_cache.remember(message, "".join(parts), vector, history)
+        with span("memory_save"):
+            await self.memory.append(call_id, session, message, "".join(parts))
@@ -0,0 +1,165 @@
+# app/services/outbox/dispatcher.py
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.telemetry import observe_stage
+from app.services.outbox.store import DEDUPED, FAILED, PENDING, SENT, OutboxEvent, OutboxStore, OutboxUpdate
+
+logger = logging.getLogger(__name__)
+
+# Entrega um lote inteiro (ex.: um POST para o CRM); exceção = o lote todo volta para retry
+Sender = Callable[[List[OutboxEvent]], Awaitable[None]]
+
+PRUNE_EVERY_SECONDS = 3600.0
+
+
+class PermanentDeliveryError(Exception):
+    """O destino recusou o lote de vez (ex.: 400/401/404): não adianta tentar de novo."""
+
+
+class OutboxDispatcher:
+    """
+    Entrega em segundo plano os eventos do outbox (um por worker, criado no startup).
+    - Acorda logo depois de um append (esperando OUTBOX_FLUSH_SECONDS para juntar o lote) ou a cada
+      OUTBOX_POLL_SECONDS, para pegar retries vencidos e eventos de outros workers.
+    - Dedupe por telefone: vários eventos do mesmo telefone no lote viram um (vai o mais novo), e
+      telefone já avisado dentro da OUTBOX_DEDUPE_WINDOW_SECONDS não é avisado de novo.
+    - Falha de entrega volta para o banco com backoff exponencial e jitter; depois de
+      OUTBOX_MAX_ATTEMPTS (ou de um PermanentDeliveryError) o evento fica "failed".
+    - O status de cada evento (sent/deduped/failed, tentativas, último erro) fica gravado no banco.
+    """
+
+    def __init__(
+        self,
+        store: OutboxStore,
+        sender: Sender,
+        batch_size: int = None,
+        flush_seconds: float = None,
+        poll_seconds: float = None,
+        dedupe_window: float = None,
+        max_attempts: int = None,
+        lease_seconds: float = None,
+    ):
+        self.store = store
+        self.sender = sender
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.flush_seconds = flush_seconds if flush_seconds is not None else settings.OUTBOX_FLUSH_SECONDS
+        self.poll_seconds = poll_seconds or settings.OUTBOX_POLL_SECONDS
+        self.dedupe_window = dedupe_window if dedupe_window is not None else settings.OUTBOX_DEDUPE_WINDOW_SECONDS
+        self.max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+        self.lease_seconds = lease_seconds or settings.OUTBOX_LEASE_SECONDS
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._next_prune = 0.0
+        self.counters = {"sent": 0, "deduped": 0, "retried": 0, "failed": 0, "batches": 0}
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._wake = asyncio.Event()
+        self._next_prune = time.monotonic() + PRUNE_EVERY_SECONDS
+        self._task = asyncio.create_task(self._run())
+
+    def wake(self):
+        """Chamado depois de um append: o dispatcher sai da espera sem esperar o próximo poll."""
+        if self._wake is not None:
+            self._wake.set()
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(settings.OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), settings.OUTBOX_BACKOFF_MAX_SECONDS)
+        # Jitter: workers que falharam juntos não voltam todos no mesmo segundo
+        return delay * random.uniform(0.5, 1.0)
+
+    def _dedupe(self, events: List[OutboxEvent]) -> Tuple[Dict[Tuple[str, str], OutboxEvent], List[OutboxUpdate]]:
+        """Um evento por (kind, phone) no lote, o mais novo; os mais velhos saem como deduped."""
+        latest: Dict[Tuple[str, str], OutboxEvent] = {}
+        updates = []
+        for event in events:
+            previous = latest.get(event.dedupe_key)
+            if previous is not None:
+                updates.append(OutboxUpdate(previous.id, DEDUPED, previous.attempts))
+            latest[event.dedupe_key] = event
+        return latest, updates
+
+    async def dispatch_once(self) -> int:
+        """Pega um lote vencido, entrega e grava o resultado. Devolve quantos eventos foram pegos."""
+        events = await self.store.claim(self.batch_size, self.lease_seconds)
+        if not events:
+            return 0
+        latest, updates = self._dedupe(events)
+        phones = [key for key, event in latest.items() if event.phone]
+        already_sent = await self.store.recently_sent(phones, time.time() - self.dedupe_window)
+        to_send = []
+        for key, event in latest.items():
+            if key in already_sent:
+                updates.append(OutboxUpdate(event.id, DEDUPED, event.attempts))
+            else:
+                to_send.append(event)
+
+        if to_send:
+            started = time.perf_counter()
+            try:
+                await self.sender(to_send)
+                updates.extend(OutboxUpdate(event.id, SENT, event.attempts + 1) for event in to_send)
+            except Exception as e:
+                permanent = isinstance(e, PermanentDeliveryError)
+                logger.warning(f"⚠️ Entrega de {len(to_send)} evento(s) do outbox falhou: {e}")
+                now = time.time()
+                for event in to_send:
+                    attempts = event.attempts + 1
+                    if permanent or attempts >= self.max_attempts:
+                        updates.append(OutboxUpdate(event.id, FAILED, attempts, error=str(e)))
+                    else:
+                        updates.append(OutboxUpdate(event.id, PENDING, attempts, now + self.backoff(attempts), str(e)))
+            observe_stage("outbox_delivery", time.perf_counter() - started, started)
+
+        await self.store.finish(updates, time.time())
+        for update in updates:
+            key = "retried" if update.status == PENDING else update.status
+            self.counters[key] += 1
+        self.counters["batches"] += 1
+        return len(events)
+
+    async def _prune(self):
+        if time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + PRUNE_EVERY_SECONDS
+        removed = await self.store.prune(time.time() - settings.OUTBOX_RETENTION_DAYS * 86400)
+        if removed:
+            logger.info(f"🧹 Outbox: {removed} evento(s) antigos apagados.")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+                # Acordou por um append: espera a janela para o lote juntar o que vier junto
+                await asyncio.sleep(self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                # Lote cheio = pode haver mais esperando (backlog depois de uma queda do CRM)
+                while await self.dispatch_once() >= self.batch_size:
+                    pass
+                await self._prune()
+            except Exception as e:
+                # Banco fora: os eventos continuam lá, o próximo ciclo tenta de novo
+                logger.error(f"⚠️ Erro no dispatcher do outbox: {e}")
+
+    async def close(self, timeout: float = 5.0):
+        """Para o loop e faz uma última passada (até `timeout` s); o que sobrar fica no banco."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        try:
+            await asyncio.wait_for(self.dispatch_once(), timeout)
+        except Exception as e:
+            logger.warning(f"⚠️ Outbox: última entrega no shutdown não concluída ({e!r}).")
+
+    def stats(self) -> dict:
+        return {**self.counters, "backend": self.store.backend}
@@ -0,0 +1,200 @@
+# app/services/outbox/postgres.py
+import logging
+import time
+from datetime import datetime, timezone
+from typing import List, Sequence, Set, Tuple
+
+import asyncpg  # noqa: F401  (driver do create_async_engine; sem ele o build_outbox_store cai no SQLite)
+from sqlalchemy import DateTime, bindparam, delete, func, select, tuple_, update
+
+from app.core.config import settings
+from app.db.session import dispose_engine, get_engine
+from app.models.outbox import OutboxEntry
+from app.services.outbox.store import (
+    DEDUPED,
+    FAILED,
+    PENDING,
+    SENDING,
+    SENT,
+    OutboxEvent,
+    OutboxStore,
+    OutboxUpdate,
+    SQLiteOutboxStore,
+)
+
+logger = logging.getLogger(__name__)
+
+TABLE = OutboxEntry.__table__
+
+
+def _naive_utc(epoch: float) -> datetime:
+    # Mesmo padrão das colunas DateTime do Lead: UTC sem fuso
+    return datetime.fromtimestamp(epoch, timezone.utc).replace(tzinfo=None)
+
+
+def _epoch(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def build_claim(limit: int, now: float, lease_seconds: float):
+    """
+    UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) RETURNING: cada dispatcher leva
+    um lote diferente sem esperar o lock dos outros, e o lote fica com lease até now + lease.
+    """
+    due = (
+        select(TABLE.c.id)
+        .where(TABLE.c.status.in_((PENDING, SENDING)), TABLE.c.next_attempt_at <= _naive_utc(now))
+        .order_by(TABLE.c.next_attempt_at, TABLE.c.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        update(TABLE)
+        .where(TABLE.c.id.in_(due))
+        .values(status=SENDING, next_attempt_at=_naive_utc(now + lease_seconds))
+        .returning(TABLE.c.id, TABLE.c.kind, TABLE.c.phone, TABLE.c.payload, TABLE.c.attempts, TABLE.c.created_at)
+    )
+
+
+# Executado uma vez por lote (executemany), um conjunto de parâmetros por evento
+FINISH = (
+    update(TABLE)
+    .where(TABLE.c.id == bindparam("event_id"))
+    .values(
+        status=bindparam("new_status"),
+        attempts=bindparam("new_attempts"),
+        next_attempt_at=func.coalesce(bindparam("retry_at", type_=DateTime), TABLE.c.next_attempt_at),
+        sent_at=bindparam("new_sent_at", type_=DateTime),
+        last_error=bindparam("error"),
+    )
+)
+
+
+class PostgresOutboxStore(OutboxStore):
+    """
+    Outbox na tabela `outbox_events` do Postgres do docker-compose (mesmo pool do
+    PostgresLeadRepository). Serve quando os workers estão em mais de um host: o claim com
+    SKIP LOCKED reparte os lotes entre eles.
+    O append não vai à rede: grava no SQLite local do host (spool, o mesmo OUTBOX_SQLITE_PATH) e
+    o dispatcher, a cada claim, repassa o spool para o Postgres numa transação e apaga o que
+    passou. Com o Postgres fora, os eventos esperam no spool e nada se perde na ligação.
+    """
+
+    backend = "postgres"
+
+    def __init__(self, spool: SQLiteOutboxStore = None):
+        self.engine = None
+        self.spool = spool or SQLiteOutboxStore()
+
+    async def open(self):
+        await self.spool.open()
+        try:
+            engine = get_engine()
+            async with engine.begin() as conn:
+                await conn.run_sync(OutboxEntry.metadata.create_all, tables=[TABLE])
+            self.engine = engine
+        except Exception as e:
+            # O próximo append/claim tenta de novo
+            logger.error(f"⚠️ Erro ao conectar no Postgres (outbox): {e}")
+
+    async def _engine(self):
+        if self.engine is None:
+            await self.open()
+            if self.engine is None:
+                raise ConnectionError("Postgres indisponível")
+        return self.engine
+
+    async def append(self, event: OutboxEvent) -> int:
+        # Devolve o id no spool; no Postgres (e na entrega) o evento ganha outro id
+        return await self.spool.append(event)
+
+    async def _relay(self, limit: int, lease_seconds: float) -> int:
+        """Repassa um lote do spool local para o Postgres; com o Postgres fora, o lote volta a pendente."""
+        events = await self.spool.claim(limit, lease_seconds)
+        if not events:
+            return 0
+        rows = [
+            {
+                "kind": event.kind,
+                "phone": event.phone,
+                "payload": event.payload,
+                "status": PENDING,
+                "attempts": 0,
+                "next_attempt_at": _naive_utc(event.created_at),
+                "created_at": _naive_utc(event.created_at),
+            }
+            for event in events
+        ]
+        try:
+            engine = await self._engine()
+            async with engine.begin() as conn:
+                await conn.execute(TABLE.insert(), rows)
+        except Exception:
+            await self.spool.finish([OutboxUpdate(event.id, PENDING, event.attempts, time.time()) for event in events], time.time())
+            raise
+        # Um crash entre o commit e o remove repassa o lote de novo depois da lease (a dedupe por telefone segura)
+        await self.spool.remove([event.id for event in events])
+        return len(events)
+
+    async def claim(self, limit: int, lease_seconds: float) -> List[OutboxEvent]:
+        await self._relay(limit, lease_seconds)
+        engine = await self._engine()
+        now = datetime.now(timezone.utc).timestamp()
+        async with engine.begin() as conn:
+            rows = (await conn.execute(build_claim(limit, now, lease_seconds))).mappings().all()
+        events = [
+            OutboxEvent(
+                kind=row["kind"],
+                phone=row["phone"],
+                payload=row["payload"],
+                id=row["id"],
+                attempts=row["attempts"],
+                created_at=_epoch(row["created_at"]),
+            )
+            for row in rows
+        ]
+        return sorted(events, key=lambda event: event.id)
+
+    async def recently_sent(self, keys: Sequence[Tuple[str, str]], since: float) -> Set[Tuple[str, str]]:
+        if not keys:
+            return set()
+        engine = await self._engine()
+        stmt = (
+            select(TABLE.c.kind, TABLE.c.phone)
+            .where(tuple_(TABLE.c.kind, TABLE.c.phone).in_(list(keys)), TABLE.c.sent_at >= _naive_utc(since))
+            .distinct()
+        )
+        async with engine.connect() as conn:
+            rows = (await conn.execute(stmt)).all()
+        return {(kind, phone) for kind, phone in rows}
+
+    async def finish(self, updates: Sequence[OutboxUpdate], now: float):
+        if not updates:
+            return
+        engine = await self._engine()
+        params = [
+            {
+                "event_id": u.id,
+                "new_status": u.status,
+                "new_attempts": u.attempts,
+                "retry_at": _naive_utc(u.next_attempt_at) if u.next_attempt_at is not None else None,
+                "new_sent_at": _naive_utc(now) if u.status == SENT else None,
+                "error": u.error,
+            }
+            for u in updates
+        ]
+        async with engine.begin() as conn:
+            await conn.execute(FINISH, params)
+
+    async def prune(self, before: float) -> int:
+        engine = await self._engine()
+        stmt = delete(TABLE).where(TABLE.c.status.in_((SENT, DEDUPED, FAILED)), TABLE.c.created_at < _naive_utc(before))
+        async with engine.begin() as conn:
+            return (await conn.execute(stmt)).rowcount
+
+    async def close(self):
+        # Com os leads também no Postgres, quem fecha o pool é o PostgresLeadRepository (depois do outbox)
+        if self.engine is not None and settings.LEADS_BACKEND != "postgres":
+            await dispose_engine()
+        self.engine = None
+        await self.spool.close()
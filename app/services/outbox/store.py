@@ -0,0 +1,279 @@
+# app/services/outbox/store.py
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Set, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Ciclo de vida de um evento no outbox
+PENDING = "pending"  # esperando envio (ou o próximo retry, em next_attempt_at)
+SENDING = "sending"  # pego por um dispatcher até next_attempt_at (lease); depois disso volta a valer
+SENT = "sent"
+DEDUPED = "deduped"  # mesmo telefone já avisado dentro da janela: não vai de novo
+FAILED = "failed"  # esgotou as tentativas ou o destino recusou de vez
+
+# O append roda no event loop: se outro worker segurar o arquivo mais que isso, espera numa thread
+SQLITE_APPEND_BUSY_SECONDS = 0.05
+SQLITE_BUSY_SECONDS = 5.0
+
+
+@dataclass
+class OutboxEvent:
+    kind: str  # ex.: "hot_lead"
+    payload: dict
+    phone: Optional[str] = None  # chave da dedupe (None = nunca deduplicado)
+    id: Optional[int] = None
+    attempts: int = 0
+    created_at: float = field(default_factory=time.time)  # epoch (segundos)
+
+    @property
+    def dedupe_key(self) -> Tuple[str, str]:
+        return (self.kind, self.phone) if self.phone else (self.kind, f"#{self.id}")
+
+
+@dataclass
+class OutboxUpdate:
+    """Resultado de um evento no lote; o dispatcher grava todos de uma vez no finish()."""
+
+    id: int
+    status: str
+    attempts: int
+    next_attempt_at: Optional[float] = None  # só no retry (status PENDING)
+    error: Optional[str] = None
+
+
+class OutboxStore:
+    """
+    Interface dos bancos do outbox (um por worker). Só o append() roda no caminho da ligação:
+    uma linha nova, sem ler nada. O resto é do dispatcher em segundo plano: claim() pega um lote
+    vencido com lease (dois workers nunca pegam o mesmo evento), recently_sent() alimenta a dedupe
+    por telefone, finish() grava o status de entrega e prune() apaga o histórico velho.
+    """
+
+    backend = "none"
+
+    async def open(self):
+        raise NotImplementedError
+
+    async def append(self, event: OutboxEvent) -> int:
+        raise NotImplementedError
+
+    async def claim(self, limit: int, lease_seconds: float) -> List[OutboxEvent]:
+        raise NotImplementedError
+
+    async def recently_sent(self, keys: Sequence[Tuple[str, str]], since: float) -> Set[Tuple[str, str]]:
+        """Quais (kind, phone) tiveram um evento entregue desde `since`."""
+        raise NotImplementedError
+
+    async def finish(self, updates: Sequence[OutboxUpdate], now: float):
+        raise NotImplementedError
+
+    async def prune(self, before: float) -> int:
+        """Apaga eventos entregues/deduplicados/falhos criados antes de `before`; devolve quantos."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    phone TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_outbox_events_due ON outbox_events (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS ix_outbox_events_sent ON outbox_events (kind, phone, sent_at);
+"""
+
+SQLITE_INSERT = (
+    "INSERT INTO outbox_events (kind, phone, payload, status, attempts, next_attempt_at, created_at) "
+    "VALUES (?, ?, ?, 'pending', 0, ?, ?)"
+)
+
+# pending vencido ou sending com lease expirada (worker morreu no meio do envio)
+SQLITE_CLAIM = """
+UPDATE outbox_events SET status = 'sending', next_attempt_at = :lease_until
+WHERE id IN (
+    SELECT id FROM outbox_events
+    WHERE status IN ('pending', 'sending') AND next_attempt_at <= :now
+    ORDER BY next_attempt_at, id LIMIT :limit
+)
+RETURNING id, kind, phone, payload, attempts, created_at
+"""
+
+
+class SQLiteOutboxStore(OutboxStore):
+    """
+    Outbox num arquivo SQLite local (padrão, só biblioteca padrão). Em WAL com synchronous=NORMAL
+    o append é um INSERT de dezenas de microssegundos feito direto no event loop, e o evento
+    sobrevive a um crash ou restart do processo. Os workers do mesmo host dividem o arquivo: o
+    claim é um UPDATE ... RETURNING atômico. O trabalho do dispatcher roda numa thread
+    (asyncio.to_thread) com outra conexão, para não segurar o loop.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.OUTBOX_SQLITE_PATH
+        self._append_conn: Optional[sqlite3.Connection] = None
+        self._dispatch_conn: Optional[sqlite3.Connection] = None
+        # Uma chamada por vez na conexão do dispatcher (um to_thread cancelado continua rodando)
+        self._dispatch_lock = threading.Lock()
+
+    def _connect(self, timeout: float) -> sqlite3.Connection:
+        # isolation_level=None: autocommit, cada INSERT é a própria transação
+        conn = sqlite3.connect(self.path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        dispatch_conn = self._connect(SQLITE_BUSY_SECONDS)
+        dispatch_conn.executescript(SQLITE_SCHEMA)
+        self._dispatch_conn = dispatch_conn
+        self._append_conn = self._connect(SQLITE_APPEND_BUSY_SECONDS)
+
+    async def open(self):
+        if self._dispatch_conn is None:
+            await asyncio.to_thread(self._open)
+
+    def _locked(self, fn, *args):
+        with self._dispatch_lock:
+            return fn(*args)
+
+    async def _in_thread(self, fn, *args):
+        return await asyncio.to_thread(self._locked, fn, *args)
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, event: OutboxEvent) -> int:
+        payload = json.dumps(event.payload, ensure_ascii=False, default=str)
+        cursor = conn.execute(SQLITE_INSERT, (event.kind, event.phone, payload, event.created_at, event.created_at))
+        return cursor.lastrowid
+
+    def _insert_blocking(self, event: OutboxEvent) -> int:
+        conn = self._connect(SQLITE_BUSY_SECONDS)
+        try:
+            return self._insert(conn, event)
+        finally:
+            conn.close()
+
+    async def append(self, event: OutboxEvent) -> int:
+        if self._append_conn is None:
+            await self.open()
+        try:
+            event.id = self._insert(self._append_conn, event)
+        except sqlite3.OperationalError:
+            # Arquivo travado por outro worker além do busy timeout curto: espera fora do loop
+            event.id = await asyncio.to_thread(self._insert_blocking, event)
+        return event.id
+
+    def _claim(self, limit: int, lease_seconds: float) -> List[OutboxEvent]:
+        now = time.time()
+        rows = self._dispatch_conn.execute(
+            SQLITE_CLAIM, {"now": now, "lease_until": now + lease_seconds, "limit": limit}
+        ).fetchall()
+        events = [
+            OutboxEvent(kind=kind, phone=phone, payload=json.loads(payload), id=event_id, attempts=attempts, created_at=created_at)
+            for event_id, kind, phone, payload, attempts, created_at in rows
+        ]
+        return sorted(events, key=lambda event: event.id)
+
+    async def claim(self, limit: int, lease_seconds: float) -> List[OutboxEvent]:
+        return await self._in_thread(self._claim, limit, lease_seconds)
+
+    def _recently_sent(self, keys: Sequence[Tuple[str, str]], since: float) -> Set[Tuple[str, str]]:
+        found = set()
+        for kind, phone in keys:
+            row = self._dispatch_conn.execute(
+                "SELECT 1 FROM outbox_events WHERE kind = ? AND phone = ? AND sent_at >= ? LIMIT 1",
+                (kind, phone, since),
+            ).fetchone()
+            if row is not None:
+                found.add((kind, phone))
+        return found
+
+    async def recently_sent(self, keys: Sequence[Tuple[str, str]], since: float) -> Set[Tuple[str, str]]:
+        if not keys:
+            return set()
+        return await self._in_thread(self._recently_sent, keys, since)
+
+    def _finish(self, updates: Sequence[OutboxUpdate], now: float):
+        conn = self._dispatch_conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "UPDATE outbox_events SET status = ?, attempts = ?, next_attempt_at = COALESCE(?, next_attempt_at), "
+                "sent_at = ?, last_error = ? WHERE id = ?",
+                [
+                    (u.status, u.attempts, u.next_attempt_at, now if u.status == SENT else None, u.error, u.id)
+                    for u in updates
+                ],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def finish(self, updates: Sequence[OutboxUpdate], now: float):
+        if updates:
+            await self._in_thread(self._finish, updates, now)
+
+    def _prune(self, before: float) -> int:
+        cursor = self._dispatch_conn.execute(
+            "DELETE FROM outbox_events WHERE status IN ('sent', 'deduped', 'failed') AND created_at < ?",
+            (before,),
+        )
+        return cursor.rowcount
+
+    async def prune(self, before: float) -> int:
+        return await self._in_thread(self._prune, before)
+
+    def _remove(self, ids: Sequence[int]):
+        self._dispatch_conn.executemany("DELETE FROM outbox_events WHERE id = ?", [(event_id,) for event_id in ids])
+
+    async def remove(self, ids: Sequence[int]):
+        """Apaga eventos já repassados a outro banco (spool do PostgresOutboxStore)."""
+        if ids:
+            await self._in_thread(self._remove, ids)
+
+    async def close(self):
+        for conn in (self._append_conn, self._dispatch_conn):
+            if conn is not None:
+                conn.close()
+        self._append_conn = None
+        self._dispatch_conn = None
+
+
+def build_outbox_store() -> OutboxStore:
+    """Banco do OUTBOX_BACKEND. Sem o driver do Postgres cai no SQLite local (o alerta não se perde)."""
+    backend = settings.OUTBOX_BACKEND
+    if backend == "postgres":
+        try:
+            from app.services.outbox.postgres import PostgresOutboxStore
+
+            return PostgresOutboxStore()
+        except ImportError as e:
+            logger.warning(f"⚠️ Outbox no Postgres indisponível ({e}). Usando SQLite em {settings.OUTBOX_SQLITE_PATH}.")
+            return SQLiteOutboxStore()
+    if backend == "sqlite":
+        return SQLiteOutboxStore()
+    raise ValueError(f"OUTBOX_BACKEND inválido: {backend!r} (use 'sqlite' ou 'postgres')")
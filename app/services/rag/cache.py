@@ -0,0 +1,236 @@
+# app/services/rag/cache.py
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, List, Optional, TYPE_CHECKING
+
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION_KEY = "barcelona:kb:index_version"
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normaliza a pergunta para a chave do cache: minúsculas, sem acento, sem pontuação.
+    Assim "Qual a taxa de administração?" e "qual a taxa de administracao" batem na mesma entrada.
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class TTLLRUCache:
+    """Cache em memória do processo, limitado por tamanho (LRU) e por tempo de vida (TTL)."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCacheBackend:
+    """Segundo nível opcional, compartilhado entre os workers (serviço `redis` do docker-compose)."""
+
+    def __init__(self, url: str, ttl_seconds: int, prefix: str = "barcelona:rag:"):
+        self.client = aioredis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any):
+        await self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl_seconds)
+
+    async def get_index_version(self) -> Optional[str]:
+        raw = await self.client.get(INDEX_VERSION_KEY)
+        return raw.decode("utf-8") if raw is not None else None
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def read_index_version() -> str:
+    """Versão do índice publicada pelo último `scripts/ingest.py` (arquivo local)."""
+    try:
+        with open(settings.INDEX_VERSION_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip() or "0"
+    except FileNotFoundError:
+        return "0"
+
+
+def publish_index_version(version: str = None) -> str:
+    """
+    Chamado pelo ingest ao terminar: grava a nova versão no arquivo e, se houver, no Redis.
+    Os caches de resultados usam a versão na chave, então tudo que foi gravado antes é descartado.
+    """
+    version = version or str(int(time.time()))
+    os.makedirs(os.path.dirname(settings.INDEX_VERSION_FILE) or ".", exist_ok=True)
+    with open(settings.INDEX_VERSION_FILE, "w", encoding="utf-8") as f:
+        f.write(version)
+
+    if settings.REDIS_URL:
+        try:
+            import redis
+            redis.Redis.from_url(settings.REDIS_URL).set(INDEX_VERSION_KEY, version)
+        except Exception as e:
+            print(f"⚠️ Não foi possível publicar a versão do índice no Redis: {e}")
+    return version
+
+
+class RetrievalCache:
+    """
+    Cache de dois níveis para o search_knowledge_base:
+      1. pergunta normalizada -> vetor de embedding (economiza a chamada à OpenAI)
+      2. pergunta normalizada + k (+ filtros) -> top-k trechos (economiza a ida ao Pinecone)
+    Cada nível tem LRU+TTL em memória e, opcionalmente, Redis compartilhado.
+    """
+
+    def __init__(self):
+        self.embeddings = TTLLRUCache(settings.RAG_CACHE_MAX_ENTRIES, settings.RAG_CACHE_TTL_SECONDS)
+        self.results = TTLLRUCache(settings.RAG_CACHE_MAX_ENTRIES, settings.RAG_CACHE_TTL_SECONDS)
+        self.redis: Optional[RedisCacheBackend] = None
+        if settings.REDIS_URL and aioredis is not None:
+            self.redis = RedisCacheBackend(settings.REDIS_URL, settings.RAG_CACHE_TTL_SECONDS)
+        elif settings.REDIS_URL:
+            logger.warning("⚠️ REDIS_URL definido mas o pacote 'redis' não está instalado. Usando só memória.")
+
+        self.index_version = read_index_version()
+        self._version_checked_at = time.monotonic()
+        self.counters = {
+            "embedding_hits": 0,
+            "embedding_misses": 0,
+            "result_hits": 0,
+            "result_misses": 0,
+            "invalidations": 0,
+        }
+
+    async def _refresh_index_version(self):
+        """Confere (no máximo a cada N segundos) se o ingest publicou um índice novo."""
+        now = time.monotonic()
+        if now - self._version_checked_at < settings.INDEX_VERSION_CHECK_SECONDS:
+            return
+        self._version_checked_at = now
+
+        version = None
+        if self.redis is not None:
+            try:
+                version = await self.redis.get_index_version()
+            except Exception as e:
+                logger.warning(f"⚠️ Redis indisponível para checar versão do índice: {e}")
+        version = version or read_index_version()
+
+        if version != self.index_version:
+            logger.info(f"♻️ Índice mudou ({self.index_version} -> {version}). Limpando cache de resultados.")
+            self.index_version = version
+            self.results.clear()
+            self.counters["invalidations"] += 1
+
+    async def current_index_version(self) -> str:
+        await self._refresh_index_version()
+        return self.index_version
+
+    def _embedding_key(self, query: str) -> str:
+        return f"emb:{settings.EMBEDDING_MODEL}:{_digest(normalize_query(query))}"
+
+    def _result_key(self, query: str, k: int, filters: Optional[dict] = None) -> str:
+        extra = json.dumps(filters, sort_keys=True) if filters else ""
+        return f"res:{self.index_version}:{k}:{_digest(normalize_query(query) + extra)}"
+
+    async def _get(self, tier: TTLLRUCache, key: str) -> Optional[Any]:
+        value = tier.get(key)
+        if value is None and self.redis is not None:
+            try:
+                value = await self.redis.get(key)
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao ler cache no Redis: {e}")
+            if value is not None:
+                tier.set(key, value)
+        return value
+
+    async def _set(self, tier: TTLLRUCache, key: str, value: Any):
+        tier.set(key, value)
+        if self.redis is not None:
+            try:
+                await self.redis.set(key, value)
+            except Exception as e:
+                logger.warning(f"⚠️ Falha ao gravar cache no Redis: {e}")
+
+    async def get_embedding(self, query: str) -> Optional[List[float]]:
+        vector = await self._get(self.embeddings, self._embedding_key(query))
+        self.counters["embedding_hits" if vector is not None else "embedding_misses"] += 1
+        return vector
+
+    async def set_embedding(self, query: str, vector: List[float]):
+        await self._set(self.embeddings, self._embedding_key(query), list(vector))
+
+    async def get_results(self, query: str, k: int, filters: Optional[dict] = None) -> Optional[List["Document"]]:
+        await self._refresh_index_version()
+        raw = await self._get(self.results, self._result_key(query, k, filters))
+        self.counters["result_hits" if raw is not None else "result_misses"] += 1
+        if raw is None:
+            return None
+        from langchain_core.documents import Document
+
+        return [Document(page_content=item["page_content"], metadata=item["metadata"]) for item in raw]
+
+    async def set_results(self, query: str, k: int, docs: List["Document"], filters: Optional[dict] = None):
+        raw = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+        await self._set(self.results, self._result_key(query, k, filters), raw)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "index_version": self.index_version,
+            "embedding_entries": len(self.embeddings),
+            "result_entries": len(self.results),
+            "redis": self.redis is not None,
+        }
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.close()
@@ -0,0 +1,297 @@
+# app/services/rag/evaluation.py
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.services.rag.cache import normalize_query
+from app.services.rag.hybrid import analyze_query, filter_levels, reciprocal_rank_fusion
+from app.services.rag.ingestion import count_tokens as count_embedding_tokens
+from app.services.rag.ingestion import split_pages
+from app.services.rag.lexical_index import BM25Index
+from app.services.rag.local_index import LocalVectorIndex, _normalize_rows
+
+EMBEDDINGS_FILE = "embeddings.npy"
+KEYS_FILE = "keys.json"
+GROUP_FIELDS = ("administradora", "categoria")
+
+
+@dataclass
+class LabeledQuestion:
+    """
+    Pergunta rotulada do conjunto de avaliação (uma linha do JSONL).
+    O rótulo não aponta para IDs de chunk (mudam com o chunking): um trecho é relevante se vem
+    da administradora/categoria/arquivo esperados e contém todos os termos de `contains`.
+    """
+
+    qid: str
+    question: str
+    administradora: Optional[str] = None
+    categoria: Optional[str] = None
+    subcategoria: Optional[str] = None
+    source: Optional[str] = None  # parte do caminho do PDF que responde a pergunta
+    contains: List[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        self._source = normalize_query(self.source) if self.source else None
+        self._terms = [normalize_query(term) for term in self.contains]
+
+    @property
+    def group(self) -> str:
+        return " / ".join(getattr(self, name) or "-" for name in GROUP_FIELDS)
+
+    def is_relevant(self, doc: Document, normalized_text: str = None) -> bool:
+        meta = doc.metadata
+        for name in ("administradora", "categoria", "subcategoria"):
+            wanted = getattr(self, name)
+            if wanted and meta.get(name) != wanted:
+                return False
+        if self._source and self._source not in normalize_query(meta.get("source", "")):
+            return False
+        text = normalized_text if normalized_text is not None else normalize_query(doc.page_content)
+        return all(term in text for term in self._terms)
+
+
+def load_questions(path: str) -> List[LabeledQuestion]:
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            questions.append(LabeledQuestion(
+                qid=item["id"],
+                question=item["question"],
+                administradora=item.get("administradora"),
+                categoria=item.get("categoria"),
+                subcategoria=item.get("subcategoria"),
+                source=item.get("source"),
+                contains=item.get("contains", []),
+            ))
+    return questions
+
+
+class EmbeddingCache:
+    """
+    Embeddings persistidos em disco por modelo, com chave sha1 do texto: depois de preenchido
+    uma vez, a avaliação inteira (chunks de todas as configurações + perguntas) roda sem rede.
+    Fica numa matriz .npy + lista de chaves, regravadas de forma atômica no save().
+    """
+
+    def __init__(self, directory: str, model: str):
+        self.directory = os.path.join(directory, model)
+        self.model = model
+        self._pos: Dict[str, int] = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._pending: Dict[str, np.ndarray] = {}
+        keys_path = os.path.join(self.directory, KEYS_FILE)
+        vectors_path = os.path.join(self.directory, EMBEDDINGS_FILE)
+        if os.path.exists(keys_path) and os.path.exists(vectors_path):
+            with open(keys_path, "r", encoding="utf-8") as f:
+                keys = json.load(f)
+            self._vectors = np.load(vectors_path)
+            self._pos = {key: i for i, key in enumerate(keys)}
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def __len__(self):
+        return len(self._pos) + len(self._pending)
+
+    def __contains__(self, text: str) -> bool:
+        key = self.key(text)
+        return key in self._pos or key in self._pending
+
+    def missing(self, texts: Sequence[str]) -> List[str]:
+        """Textos distintos ainda sem embedding (o que o --fill precisa mandar para a API)."""
+        return list(dict.fromkeys(text for text in texts if text not in self))
+
+    def add(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        for text, vector in zip(texts, vectors):
+            self._pending[self.key(text)] = np.asarray(vector, dtype=np.float32)
+
+    def matrix(self, texts: Sequence[str]) -> np.ndarray:
+        rows = []
+        for text in texts:
+            key = self.key(text)
+            rows.append(self._pending[key] if key in self._pending else self._vectors[self._pos[key]])
+        return np.vstack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+
+    def save(self):
+        if not self._pending:
+            return
+        keys = list(self._pos) + list(self._pending)
+        new_rows = np.vstack(list(self._pending.values()))
+        vectors = np.vstack([self._vectors, new_rows]) if len(self._pos) else new_rows
+
+        os.makedirs(self.directory, exist_ok=True)
+        vectors_tmp = os.path.join(self.directory, EMBEDDINGS_FILE + ".tmp")
+        keys_tmp = os.path.join(self.directory, KEYS_FILE + ".tmp")
+        with open(vectors_tmp, "wb") as f:
+            np.save(f, vectors)
+        with open(keys_tmp, "w", encoding="utf-8") as f:
+            json.dump(keys, f)
+        os.replace(vectors_tmp, os.path.join(self.directory, EMBEDDINGS_FILE))
+        os.replace(keys_tmp, os.path.join(self.directory, KEYS_FILE))
+
+        self._vectors = vectors
+        self._pos = {key: i for i, key in enumerate(keys)}
+        self._pending = {}
+
+
+class ChunkedCorpus:
+    """Os PDFs da base quebrados com uma configuração de chunking (texto normalizado pré-calculado)."""
+
+    def __init__(self, pages_by_path: Dict[str, List[Document]], chunk_size: int, chunk_overlap: int):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.ids: List[str] = []
+        self.documents: List[Document] = []
+        for path, pages in pages_by_path.items():
+            ids, chunks = split_pages(path, pages, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+            self.ids.extend(ids)
+            self.documents.extend(chunks)
+        self.normalized = {doc_id: normalize_query(doc.page_content) for doc_id, doc in zip(self.ids, self.documents)}
+
+    @property
+    def label(self) -> str:
+        return f"{self.chunk_size}/{self.chunk_overlap}"
+
+    @property
+    def texts(self) -> List[str]:
+        return [doc.page_content for doc in self.documents]
+
+    def embedding_tokens(self) -> int:
+        """Tokens cobrados para embedar o corpus inteiro nesta configuração (custo do ingest)."""
+        return count_embedding_tokens(self.texts)
+
+    def build_index(self, cache: EmbeddingCache) -> LocalVectorIndex:
+        return LocalVectorIndex(self.ids, _normalize_rows(cache.matrix(self.texts)), self.documents)
+
+    def build_lexical_index(self) -> BM25Index:
+        return BM25Index.build(self.ids, self.documents)
+
+    def answerable(self, question: LabeledQuestion) -> bool:
+        """O rótulo tem pelo menos um trecho relevante nesta configuração (senão o recall é teto baixo)."""
+        return any(
+            question.is_relevant(doc, self.normalized[doc_id])
+            for doc_id, doc in zip(self.ids, self.documents)
+        )
+
+
+def first_relevant_rank(question: LabeledQuestion, docs: Sequence[Document], normalized: Dict[str, str] = None) -> Optional[int]:
+    """Posição (1-based) do primeiro trecho relevante na lista, ou None."""
+    for rank, doc in enumerate(docs, start=1):
+        text = (normalized or {}).get(doc.metadata.get("chunk_id"))
+        if question.is_relevant(doc, text):
+            return rank
+    return None
+
+
+def quality(ranks: Sequence[Optional[int]], k: int) -> Dict[str, float]:
+    """recall@k (fração das perguntas com um trecho relevante no top-k) e MRR@k."""
+    if not ranks:
+        return {"recall": 0.0, "mrr": 0.0}
+    hits = [rank for rank in ranks if rank is not None and rank <= k]
+    return {
+        "recall": len(hits) / len(ranks),
+        "mrr": sum(1.0 / rank for rank in hits) / len(ranks),
+    }
+
+
+def latency_percentiles(seconds: Sequence[float]) -> Dict[str, float]:
+    if not seconds:
+        return {"p50": 0.0, "p95": 0.0}
+    p50, p95 = np.percentile(np.asarray(seconds) * 1000, [50, 95])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3)}
+
+
+SearchFn = Callable[[LabeledQuestion, int], List[Document]]
+
+
+def evaluate(
+    questions: Sequence[LabeledQuestion],
+    search: SearchFn,
+    ks: Sequence[int],
+    count_context_tokens: Callable[[str], int],
+    normalized: Dict[str, str] = None,
+    repeat: int = 1,
+) -> List[dict]:
+    """
+    Roda as perguntas num backend e devolve uma linha por k: qualidade (recall@k, MRR@k, também por
+    administradora/categoria), latência da consulta (só o índice: o embedding vem do cache) e tokens
+    de contexto que o top-k custa no prompt do agente a cada busca.
+    """
+    rows = []
+    for k in sorted(set(ks)):
+        ranks, latencies, context_tokens = [], [], []
+        by_group: Dict[str, List[Optional[int]]] = defaultdict(list)
+        for question in questions:
+            docs: List[Document] = []
+            for _ in range(max(repeat, 1)):
+                started = time.perf_counter()
+                docs = search(question, k)
+                latencies.append(time.perf_counter() - started)
+            rank = first_relevant_rank(question, docs, normalized)
+            ranks.append(rank)
+            by_group[question.group].append(rank)
+            context_tokens.append(sum(count_context_tokens(doc.page_content) for doc in docs))
+
+        rows.append({
+            "k": k,
+            **quality(ranks, k),
+            "latency_ms": latency_percentiles(latencies),
+            "context_tokens": round(float(np.mean(context_tokens)), 1) if context_tokens else 0.0,
+            "groups": {group: {"n": len(group_ranks), **quality(group_ranks, k)} for group, group_ranks in sorted(by_group.items())},
+            "misses": [q.qid for q, rank in zip(questions, ranks) if rank is None or rank > k],
+        })
+    return rows
+
+
+def rank_rows(rows: List[dict]) -> List[dict]:
+    """Melhor primeiro: recall, depois MRR, depois o menor custo de contexto."""
+    return sorted(rows, key=lambda row: (-row["recall"], -row["mrr"], row["context_tokens"]))
+
+
+def local_search(index: LocalVectorIndex, query_vectors: Dict[str, np.ndarray]) -> SearchFn:
+    def search(question: LabeledQuestion, k: int) -> List[Document]:
+        return [doc for doc, _score in index.search(query_vectors[question.qid], k=k)]
+    return search
+
+
+def hybrid_search(
+    index: LocalVectorIndex,
+    query_vectors: Dict[str, np.ndarray],
+    lexical: Optional[BM25Index] = None,
+    candidates: int = 10,
+    rrf_k: int = 60,
+) -> SearchFn:
+    """
+    Mesma composição do KnowledgeBaseRetriever._retrieve, síncrona: filtros pelas entidades da pergunta,
+    candidatos vetoriais (+ BM25 se `lexical`) por nível de filtro e fusão RRF.
+    """
+    administradoras = index.values("administradora")
+
+    def retrieve(question: LabeledQuestion, k: int, filters: dict) -> List[Document]:
+        n = max(k, candidates)
+        rankings = []
+        for level in filter_levels(filters):
+            rankings.append([doc for doc, _score in index.search(query_vectors[question.qid], k=n, filters=level)])
+            if lexical is not None:
+                rankings.append([doc for doc, _score in lexical.search(question.question, k=n, filters=level)])
+        return reciprocal_rank_fusion(rankings, k, rrf_k)
+
+    def search(question: LabeledQuestion, k: int) -> List[Document]:
+        filters = analyze_query(question.question, administradoras).filters()
+        docs = retrieve(question, k, filters)
+        if not docs and filters:
+            docs = retrieve(question, k, {})
+        return docs
+    return search
@@ -0,0 +1,104 @@
+# app/services/rag/hybrid.py
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, TYPE_CHECKING
+
+
+from app.services.rag.cache import normalize_query
+from app.services.rag.price_tables import infer_subcategoria
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# Trechos sem administradora específica (manual da Barcelona): valem para qualquer uma
+GENERAL_ADMINISTRADORA = "Geral"
+# Uma pasta por administradora (mesma raiz que o scripts/ingest.py percorre)
+ADMINISTRADORAS_DIR = "base_conhecimento/Administradoras"
+
+
+def list_administradoras(manifest_path: str, base_dir: str = ADMINISTRADORAS_DIR) -> List[str]:
+    """
+    Administradoras da base: a pasta logo abaixo de `base_dir` em cada PDF do manifesto do último
+    ingest. Sem manifesto legível, as próprias pastas de `base_dir`. Vale para qualquer backend
+    (o Pinecone não lista valores de metadados).
+    """
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            paths = list(json.load(f).get("files", {}))
+    except (OSError, ValueError):
+        paths = []
+    names = []
+    for path in paths:
+        parts = os.path.relpath(os.path.normpath(path), os.path.normpath(base_dir)).split(os.sep)
+        if len(parts) > 1 and parts[0] != "..":
+            names.append(parts[0])
+    if not names and os.path.isdir(base_dir):
+        names = [name for name in sorted(os.listdir(base_dir)) if os.path.isdir(os.path.join(base_dir, name))]
+    return list(dict.fromkeys(names))
+
+
+@dataclass
+class QueryEntities:
+    """Entidades citadas na pergunta que restringem a busca ("na Ademicon", "caminhão", "moto")."""
+
+    administradora: Optional[str] = None
+    subcategoria: Optional[str] = None
+
+    def filters(self) -> dict:
+        found = {}
+        if self.administradora:
+            found["administradora"] = [self.administradora, GENERAL_ADMINISTRADORA]
+        if self.subcategoria:
+            found["subcategoria"] = self.subcategoria
+        return found
+
+
+def analyze_query(text: str, administradoras: Iterable[str]) -> QueryEntities:
+    """
+    Administradora (entre as que existem no índice) e subcategoria do bem, pelas palavras da pergunta.
+    Regras simples e sem rede: roda em microssegundos antes de cada busca.
+    """
+    padded = f" {normalize_query(text)} "
+    administradora = next(
+        (name for name in administradoras
+         if name != GENERAL_ADMINISTRADORA and f" {normalize_query(name)} " in padded),
+        None,
+    )
+    return QueryEntities(administradora=administradora, subcategoria=infer_subcategoria(text) or None)
+
+
+def filter_levels(filters: dict) -> List[Optional[dict]]:
+    """
+    Filtros de cada rodada de candidatos, do mais restrito ao mais amplo. A administradora é filtro
+    duro; a subcategoria só existe nos PDFs de Tabelas (o contrato e a apresentação não têm), então
+    entra numa lista extra e os trechos que batem com ela ganham peso na fusão sem esconder o resto.
+    """
+    if not filters:
+        return [None]
+    broad = {field: value for field, value in filters.items() if field != "subcategoria"}
+    if broad == filters:
+        return [filters]
+    return [filters, broad or None]
+
+
+def _doc_key(doc: "Document") -> str:
+    return doc.metadata.get("chunk_id") or hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence["Document"]], k: int, rrf_k: int = 60) -> List["Document"]:
+    """
+    Funde listas ranqueadas (vetorial, BM25, com e sem subcategoria) por reciprocal-rank fusion:
+    score = soma de 1 / (rrf_k + posição). Usa só a posição, então escalas diferentes
+    (cosseno x BM25) não precisam ser calibradas.
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, "Document"] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ordered[:k]]
@@ -0,0 +1,207 @@
+# app/services/rag/ingestion.py
+import hashlib
+import json
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+from app.services.rag.hybrid import ADMINISTRADORAS_DIR
+
+BASE_DIR = ADMINISTRADORAS_DIR
+MANIFEST_VERSION = 1
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+
+
+def discover_pdfs(base_dir: str = BASE_DIR) -> Dict[str, dict]:
+    """
+    Lista os PDFs da base com os metadados hierárquicos de cada um:
+      Administradoras/<Admin>/*.pdf              -> categoria "Institucional"
+      Administradoras/<Admin>/Tabelas/**/*.pdf   -> categoria "Tabela de Preços" + subcategoria (Imovel, Moto...)
+    """
+    found = {}
+    for admin_name in sorted(os.listdir(base_dir)):
+        admin_path = os.path.join(base_dir, admin_name)
+        if not os.path.isdir(admin_path):
+            continue
+
+        for name in sorted(os.listdir(admin_path)):
+            path = os.path.join(admin_path, name)
+            if os.path.isfile(path) and name.lower().endswith(".pdf"):
+                found[path] = {"administradora": admin_name, "categoria": "Institucional"}
+
+        tables_path = os.path.join(admin_path, "Tabelas")
+        for root, _dirs, files in os.walk(tables_path):
+            for name in sorted(files):
+                if not name.lower().endswith(".pdf"):
+                    continue
+                subcat = os.path.basename(root)
+                found[os.path.join(root, name)] = {
+                    "administradora": admin_name,
+                    "categoria": "Tabela de Preços",
+                    "subcategoria": subcat if subcat != "Tabelas" else "Geral",
+                }
+    return found
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(path: str, index: int, text: str) -> str:
+    """ID determinístico do trecho: o mesmo arquivo/conteúdo sempre gera o mesmo ID (upsert idempotente)."""
+    content_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return hashlib.sha1(f"{path}:{index}:{content_hash}".encode("utf-8")).hexdigest()
+
+
+def load_pages(path: str, metadata: dict) -> List[Document]:
+    """Lê as páginas de um PDF já com os metadados hierárquicos e o caminho de origem."""
+    pages = PyPDFLoader(path).load()
+    for page in pages:
+        page.metadata.update(metadata)
+        page.metadata["source"] = path
+    return pages
+
+
+def split_pages(
+    path: str,
+    pages: List[Document],
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+) -> Tuple[List[str], List[Document]]:
+    """Quebra as páginas em chunks com IDs determinísticos (o scripts/eval/retrieval_eval.py varia o tamanho)."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = splitter.split_documents(pages)
+    ids = [chunk_id(path, i, chunk.page_content) for i, chunk in enumerate(chunks)]
+    for doc_id, chunk in zip(ids, chunks):
+        chunk.metadata["chunk_id"] = doc_id
+    return ids, chunks
+
+
+def load_and_split(path: str, metadata: dict) -> Tuple[List[str], List[Document]]:
+    """Lê um PDF, aplica os metadados e quebra em chunks com IDs determinísticos."""
+    return split_pages(path, load_pages(path, metadata))
+
+
+@lru_cache(maxsize=1)
+def _embedding_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Sem rede para baixar o vocabulário: usa a aproximação
+        return None
+
+
+def count_tokens(texts: List[str]) -> int:
+    """Tokens que o modelo de embedding vai cobrar (aproximação len/4 se não houver tiktoken)."""
+    encoding = _embedding_encoding()
+    if encoding is None:
+        return sum(len(text) // 4 for text in texts)
+    return sum(len(tokens) for tokens in encoding.encode_batch(texts))
+
+
+def parse_pdf_task(path: str, metadata: dict) -> dict:
+    """
+    Unidade de trabalho do pool de processos do ingest: lê, quebra e conta tokens de um PDF.
+    Fica no nível do módulo (e não no script) para ser serializável pelo multiprocessing.
+    """
+    ids, chunks = load_and_split(path, metadata)
+    pages = len({chunk.metadata.get("page") for chunk in chunks})
+    return {
+        "path": path,
+        "ids": ids,
+        "chunks": chunks,
+        "pages": pages,
+        "tokens": count_tokens([chunk.page_content for chunk in chunks]),
+    }
+
+
+class IngestionManifest:
+    """
+    Registro persistido do que já está no índice: caminho -> (mtime, tamanho, sha256, chunk_ids).
+    Permite reprocessar só os PDFs novos/alterados e remover os vetores de arquivos que sumiram.
+    """
+
+    def __init__(self, path: str, backend: str, files: Optional[Dict[str, dict]] = None):
+        self.path = path
+        self.backend = backend
+        self.files: Dict[str, dict] = files or {}
+
+    @classmethod
+    def load(cls, path: str, backend: str) -> "IngestionManifest":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path, backend)
+        if data.get("version") != MANIFEST_VERSION or data.get("backend") != backend:
+            # Formato antigo ou outro backend: trata como índice vazio e reprocessa tudo
+            return cls(path, backend)
+        return cls(path, backend, data.get("files", {}))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "backend": self.backend, "files": self.files},
+                f, ensure_ascii=False, indent=2
+            )
+        os.replace(tmp, self.path)
+
+    def plan(self, current: Dict[str, dict]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Compara o disco com o manifesto e devolve (alterados, sem_mudança, removidos).
+        mtime+tamanho iguais = sem mudança (nem calcula hash); senão o sha256 decide.
+        """
+        changed, unchanged = [], []
+        for path in current:
+            stat = os.stat(path)
+            entry = self.files.get(path)
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                unchanged.append(path)
+                continue
+
+            sha = file_sha256(path)
+            if entry and entry["sha256"] == sha:
+                # Só o mtime mudou (ex.: cópia do arquivo): atualiza o registro sem reprocessar
+                entry.update(mtime=stat.st_mtime, size=stat.st_size)
+                unchanged.append(path)
+            else:
+                changed.append(path)
+
+        removed = [path for path in self.files if path not in current]
+        return changed, unchanged, removed
+
+    def record(self, path: str, chunk_ids: List[str]):
+        stat = os.stat(path)
+        self.files[path] = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "sha256": file_sha256(path),
+            "chunk_ids": chunk_ids,
+        }
+
+    def forget(self, path: str) -> List[str]:
+        entry = self.files.pop(path, None)
+        return entry["chunk_ids"] if entry else []
+
+    def chunk_ids(self, path: str) -> List[str]:
+        entry = self.files.get(path)
+        return entry["chunk_ids"] if entry else []
@@ -0,0 +1,162 @@
+# app/services/rag/lexical_index.py
+import json
+import os
+from collections import Counter
+from typing import Dict, List, Optional, TYPE_CHECKING, Tuple
+
+import numpy as np
+
+from app.services.rag.cache import normalize_query
+from app.services.rag.local_index import DOCUMENTS_FILE, MetadataFilterIndex, current_version_dir, publish_version_dir
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+POSTINGS_FILE = "postings.npz"
+VOCAB_FILE = "vocab.json"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Palavras que aparecem em quase toda fala/trecho e só diluem o BM25
+STOPWORDS = frozenset(
+    "a o as os um uma uns umas de do da dos das em no na nos nas por para pra com sem que e ou se "
+    "me te lhe eu voce ele ela nos eles elas meu minha seu sua isso isto esse essa este esta qual "
+    "quais quanto como onde quando ja tem ter ser sao foi era fica ao aos pelo pela pelos pelas mais "
+    "muito tambem so nao sim la ai entao".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Termos do BM25: texto normalizado (sem acento/pontuação), sem stopwords; códigos (PSE, TPF, 8837) ficam."""
+    return [term for term in normalize_query(text).split() if term not in STOPWORDS and (len(term) > 1 or term.isdigit())]
+
+
+class BM25Index(MetadataFilterIndex):
+    """
+    Índice lexical (BM25) dos mesmos trechos do índice vetorial, em memória e sem dependências além do
+    NumPy: listas invertidas em formato CSR (termo -> documentos, frequência). A busca percorre só as
+    listas dos termos da pergunta, então códigos de plano e números de cota batem exato e rápido.
+    Gerado pelo scripts/ingest.py; vale tanto para o backend local quanto para o Pinecone.
+    """
+
+    def __init__(
+        self,
+        ids: List[str],
+        documents: List["Document"],
+        vocab: Dict[str, int],
+        term_ptr: np.ndarray,
+        doc_idx: np.ndarray,
+        term_freq: np.ndarray,
+        doc_len: np.ndarray,
+    ):
+        self.ids = ids
+        self.documents = documents
+        self.vocab = vocab
+        self.term_ptr = term_ptr
+        self.doc_idx = doc_idx
+        self.term_freq = term_freq
+        self.doc_len = doc_len
+        n_docs = len(ids)
+        self.avg_len = float(doc_len.mean()) if n_docs else 0.0
+        doc_freq = np.diff(term_ptr).astype(np.float32)
+        # idf do BM25 (variante sempre positiva, como no Lucene)
+        self.idf = np.log1p((n_docs - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+        self._build_filter_columns()
+
+    @classmethod
+    def build(cls, ids: List[str], documents: List["Document"]) -> "BM25Index":
+        counts = [Counter(tokenize(doc.page_content)) for doc in documents]
+        vocab = {term: i for i, term in enumerate(sorted({term for c in counts for term in c}))}
+
+        postings: List[List[Tuple[int, int]]] = [[] for _ in vocab]
+        for doc_pos, counter in enumerate(counts):
+            for term, freq in counter.items():
+                postings[vocab[term]].append((doc_pos, freq))
+
+        lengths = np.fromiter((len(plist) for plist in postings), dtype=np.int64, count=len(postings))
+        term_ptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        doc_idx = np.fromiter((doc for plist in postings for doc, _ in plist), dtype=np.int32, count=int(term_ptr[-1]))
+        term_freq = np.fromiter((freq for plist in postings for _, freq in plist), dtype=np.float32, count=int(term_ptr[-1]))
+        doc_len = np.fromiter((sum(c.values()) for c in counts), dtype=np.float32, count=len(counts))
+        return cls(list(ids), list(documents), vocab, term_ptr, doc_idx, term_freq, doc_len)
+
+    @classmethod
+    def empty(cls) -> "BM25Index":
+        return cls.build([], [])
+
+    def search(self, query: str, k: int = 3, filters: Optional[dict] = None) -> List[Tuple["Document", float]]:
+        """Top-k por BM25, com o mesmo pré-filtro por metadados do índice vetorial."""
+        if not self.ids:
+            return []
+        terms = [self.vocab[term] for term in dict.fromkeys(tokenize(query)) if term in self.vocab]
+        if not terms:
+            return []
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len / (self.avg_len or 1.0))
+        for term in terms:
+            start, end = self.term_ptr[term], self.term_ptr[term + 1]
+            docs, freq = self.doc_idx[start:end], self.term_freq[start:end]
+            scores[docs] += self.idf[term] * freq * (BM25_K1 + 1) / (freq + norm[docs])
+
+        mask = scores > 0
+        filter_mask = self._filter_mask(filters)
+        if filter_mask is not None:
+            mask &= filter_mask
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return []
+        k = min(k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.documents[i], float(scores[i])) for i in top]
+
+    def save(self, directory: str):
+        """Grava numa pasta de versão nova e troca o ponteiro, como o LocalVectorIndex (workers podem estar lendo)."""
+        publish_version_dir(directory, self._write)
+
+    def _write(self, directory: str):
+        with open(os.path.join(directory, POSTINGS_FILE), "wb") as f:
+            np.savez(f, term_ptr=self.term_ptr, doc_idx=self.doc_idx, term_freq=self.term_freq, doc_len=self.doc_len)
+        with open(os.path.join(directory, VOCAB_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        with open(os.path.join(directory, DOCUMENTS_FILE), "w", encoding="utf-8") as f:
+            for doc_id, doc in zip(self.ids, self.documents):
+                f.write(json.dumps({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False) + "\n")
+
+    @classmethod
+    def load(cls, directory: str) -> "BM25Index":
+        from langchain_core.documents import Document
+
+        directory = current_version_dir(directory)
+        paths = [os.path.join(directory, name) for name in (POSTINGS_FILE, VOCAB_FILE, DOCUMENTS_FILE)]
+        if not all(os.path.exists(path) for path in paths):
+            return cls.empty()
+
+        postings_path, vocab_path, docs_path = paths
+        with np.load(postings_path) as data:
+            arrays = {name: data[name] for name in data.files}
+        with open(vocab_path, "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        ids, documents = [], []
+        with open(docs_path, "r", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                ids.append(item["id"])
+                documents.append(Document(page_content=item["page_content"], metadata=item["metadata"]))
+
+        # Postings em CSR: term_ptr delimita, para cada termo, a fatia de doc_idx/term_freq
+        term_ptr, doc_idx, term_freq, doc_len = (arrays[name] for name in ("term_ptr", "doc_idx", "term_freq", "doc_len"))
+        consistent = (
+            len(doc_len) == len(ids)
+            and len(term_ptr) == len(vocab) + 1
+            and int(term_ptr[-1]) == len(doc_idx) == len(term_freq)
+            and (not len(doc_idx) or int(doc_idx.max()) < len(ids))
+        )
+        if not consistent:
+            raise ValueError(
+                f"Índice BM25 inconsistente em {directory}: {len(ids)} trechos, {len(doc_len)} tamanhos, "
+                f"{len(vocab)} termos, {len(term_ptr)} ponteiros, {len(doc_idx)}/{len(term_freq)} postings"
+            )
+        return cls(ids, documents, vocab, term_ptr, doc_idx, term_freq, doc_len)
@@ -0,0 +1,219 @@
+# app/services/rag/local_index.py
+import json
+import os
+import shutil
+import time
+from typing import Callable, Dict, List, Optional, Sequence, TYPE_CHECKING, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# Campos de metadados que aceitam filtro (vêm do scripts/ingest.py)
+FILTER_FIELDS = ("administradora", "categoria", "subcategoria")
+
+VECTORS_FILE = "vectors.npy"
+DOCUMENTS_FILE = "documents.jsonl"
+
+# Cada save grava uma versão inteira em <dir>/v-<ns>/ e troca só este ponteiro (um os.replace)
+CURRENT_FILE = "CURRENT"
+VERSION_PREFIX = "v-"
+# Versões antigas mantidas no disco (um worker pode estar terminando de carregar a anterior)
+KEEP_VERSIONS = 2
+
+
+def current_version_dir(directory: str) -> str:
+    """Pasta da versão publicada no ponteiro CURRENT; sem ponteiro, os arquivos soltos do layout antigo."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return directory
+    return os.path.join(directory, name) if name else directory
+
+
+def publish_version_dir(directory: str, write: Callable[[str], None]) -> str:
+    """
+    Grava uma versão completa numa pasta nova e só então aponta CURRENT para ela (os.replace atômico):
+    quem lê vê a versão antiga inteira ou a nova inteira, nunca arquivos de versões diferentes misturados.
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"{VERSION_PREFIX}{time.time_ns()}-{os.getpid()}"
+    version_dir = os.path.join(directory, name)
+    os.makedirs(version_dir)
+    try:
+        write(version_dir)
+    except BaseException:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+
+    pointer_tmp = os.path.join(directory, CURRENT_FILE + ".tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(directory, CURRENT_FILE))
+
+    # Remove versões antigas; arquivos já abertos/mapeados por workers continuam válidos até fecharem
+    versions = sorted(entry for entry in os.listdir(directory) if entry.startswith(VERSION_PREFIX))
+    for old in versions[:-KEEP_VERSIONS]:
+        if old != name:
+            shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return version_dir
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class MetadataFilterIndex:
+    """
+    Base dos índices em memória (vetorial e BM25): cada campo filtrável vira um vetor de códigos
+    inteiros, e o filtro por metadados vira uma comparação vetorizada antes do ranking.
+    """
+
+    ids: List[str]
+    documents: List["Document"]
+
+    def _build_filter_columns(self):
+        """Converte cada campo filtrável num vetor de códigos inteiros (filtro vira comparação vetorizada)."""
+        self._codes: Dict[str, np.ndarray] = {}
+        self._vocab: Dict[str, Dict[str, int]] = {}
+        for field in FILTER_FIELDS:
+            values = [str(doc.metadata.get(field, "")) for doc in self.documents]
+            vocab = {value: code for code, value in enumerate(sorted(set(values)))}
+            self._vocab[field] = vocab
+            self._codes[field] = np.fromiter((vocab[v] for v in values), dtype=np.int32, count=len(values))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def values(self, field: str) -> List[str]:
+        """Valores presentes no índice para um campo filtrável (ex.: administradoras conhecidas)."""
+        return [value for value in self._vocab.get(field, {}) if value]
+
+    def _filter_mask(self, filters: Optional[dict]) -> Optional[np.ndarray]:
+        if not filters:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        for field, wanted in filters.items():
+            if field not in self._codes:
+                # Campo sem coluna própria: compara direto nos metadados (mais lento, raro)
+                wanted_set = set(wanted) if isinstance(wanted, (list, tuple, set)) else {wanted}
+                mask &= np.fromiter(
+                    (doc.metadata.get(field) in wanted_set for doc in self.documents),
+                    dtype=bool, count=len(self.documents),
+                )
+                continue
+            values = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            codes = [self._vocab[field][v] for v in values if v in self._vocab[field]]
+            mask &= np.isin(self._codes[field], codes)
+        return mask
+
+
+class LocalVectorIndex(MetadataFilterIndex):
+    """
+    Índice vetorial dentro do processo: uma matriz NumPy (float32) de embeddings normalizados,
+    mapeada do disco com mmap, e os documentos/metadados ao lado em JSONL.
+    Como os vetores são unitários, o produto escalar já é a similaridade de cosseno.
+    O corpus inteiro (algumas dezenas de PDFs) cabe com folga em memória.
+    """
+
+    def __init__(self, ids: List[str], vectors: np.ndarray, documents: List["Document"]):
+        self.ids = ids
+        self.vectors = vectors
+        self.documents = documents
+        self._id_pos = {doc_id: i for i, doc_id in enumerate(ids)}
+        self._build_filter_columns()
+
+    @property
+    def dimension(self) -> int:
+        return int(self.vectors.shape[1]) if len(self.ids) else 0
+
+    # ------------------------------------------------------------------
+    # Busca
+    # ------------------------------------------------------------------
+    def search(self, vector: Sequence[float], k: int = 3, filters: Optional[dict] = None) -> List[Tuple["Document", float]]:
+        """Top-k por produto escalar vetorizado, com pré-filtro por metadados."""
+        if not self.ids:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        scores = self.vectors @ query
+        mask = self._filter_mask(filters)
+        if mask is not None:
+            if not mask.any():
+                return []
+            scores = np.where(mask, scores, -np.inf)
+            k = min(k, int(mask.sum()))
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.documents[i], float(scores[i])) for i in top]
+
+    # ------------------------------------------------------------------
+    # Escrita (usada pelo scripts/ingest.py)
+    # ------------------------------------------------------------------
+    def upsert(self, ids: List[str], vectors: Sequence[Sequence[float]], documents: List["Document"]) -> "LocalVectorIndex":
+        """Devolve um novo índice com os ids inseridos/substituídos (idempotente por id)."""
+        new_vectors = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+        replaced = set(ids)
+        keep = [i for i, doc_id in enumerate(self.ids) if doc_id not in replaced]
+
+        merged_ids = [self.ids[i] for i in keep] + list(ids)
+        merged_docs = [self.documents[i] for i in keep] + list(documents)
+        if len(self.ids):
+            merged_vectors = np.vstack([np.asarray(self.vectors)[keep], new_vectors])
+        else:
+            merged_vectors = new_vectors
+        return LocalVectorIndex(merged_ids, merged_vectors, merged_docs)
+
+    def delete(self, ids: List[str]) -> "LocalVectorIndex":
+        removed = set(ids)
+        keep = [i for i, doc_id in enumerate(self.ids) if doc_id not in removed]
+        vectors = np.asarray(self.vectors)[keep] if keep else np.zeros((0, self.dimension), dtype=np.float32)
+        return LocalVectorIndex([self.ids[i] for i in keep], vectors, [self.documents[i] for i in keep])
+
+    def save(self, directory: str):
+        """Grava numa pasta de versão nova e publica trocando o ponteiro (ver publish_version_dir)."""
+        publish_version_dir(directory, self._write)
+
+    def _write(self, directory: str):
+        with open(os.path.join(directory, VECTORS_FILE), "wb") as f:
+            np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        with open(os.path.join(directory, DOCUMENTS_FILE), "w", encoding="utf-8") as f:
+            for doc_id, doc in zip(self.ids, self.documents):
+                f.write(json.dumps({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False) + "\n")
+
+    @classmethod
+    def empty(cls) -> "LocalVectorIndex":
+        return cls([], np.zeros((0, 0), dtype=np.float32), [])
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "LocalVectorIndex":
+        from langchain_core.documents import Document
+
+        directory = current_version_dir(directory)
+        vectors_path = os.path.join(directory, VECTORS_FILE)
+        docs_path = os.path.join(directory, DOCUMENTS_FILE)
+        if not os.path.exists(vectors_path) or not os.path.exists(docs_path):
+            return cls.empty()
+
+        vectors = np.load(vectors_path, mmap_mode="r" if mmap else None)
+        ids, documents = [], []
+        with open(docs_path, "r", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                ids.append(item["id"])
+                documents.append(Document(page_content=item["page_content"], metadata=item["metadata"]))
+        if vectors.ndim != 2 or vectors.shape[0] != len(documents):
+            raise ValueError(
+                f"Índice local inconsistente em {directory}: {vectors.shape[0] if vectors.ndim else 0} vetores "
+                f"para {len(documents)} trechos"
+            )
+        return cls(ids, vectors, documents)
@@ -0,0 +1,326 @@
+# app/services/rag/price_tables.py
+import json
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.rag.cache import normalize_query
+
+TABLE_CATEGORY = "Tabela de Preços"
+STORE_FILE = "store.npz"
+PLANS_FILE = "plans.json"
+
+# Valores no formato brasileiro: 1.234.567,89
+MONEY_RE = re.compile(r"\d{1,3}(?:\.\d{3})*,\d{2}")
+# Linha da tabela: código da cota (8837, IE600, P8776...) + crédito de referência + colunas
+ROW_RE = re.compile(r"^(?P<code>[A-Z]{0,3}\d{2,6})\s+(?P<credit>\d{1,3}(?:\.\d{3})+,\d{2})\s+(?P<rest>.*)$")
+# Inteiros soltos do cabeçalho (prazos); ignora "1ª", "2%", "240 Mil", "R$"...
+HEADER_INT_RE = re.compile(r"(?<![\d.,])(\d{2,6})(?![\d.,ª%º])(?!\s*[Mm]il)")
+ALLOWED_PRAZOS_RE = re.compile(r"Prazos permitidos[^:]*:\s*([\d\s/]+)")
+FUNDO_RESERVA_RE = re.compile(r"(?:Fundo|Fdo)\s*\n?\s*Reserva\s*\n?\s*(\d{1,2},\d{1,2})\s*%")
+
+# Palavra (normalizada) -> subcategoria, no padrão das subpastas de Tabelas/
+SUBCATEGORY_KEYWORDS = {
+    "imovel": "Imovel", "casa": "Imovel", "apartamento": "Imovel", "terreno": "Imovel",
+    "auto": "Automovel", "autos": "Automovel", "carro": "Automovel", "automovel": "Automovel", "veiculo": "Automovel",
+    "moto": "Moto", "motocicleta": "Moto",
+    "pesados": "Pesados", "caminhao": "Pesados", "onibus": "Pesados",
+    "servico": "Servicos", "servicos": "Servicos",
+}
+
+MIN_PRAZO, MAX_PRAZO = 12, 240
+MAIS_POR_MENOS_FACTORS = np.array([1.0, 0.75, 0.5])
+# Coluna "Mais por Menos" paga no máximo isso do custo da coluna cheia do mesmo prazo
+REDUCED_MAX_RATIO = 0.95
+# Custo total (parcela x prazo / crédito) das colunas cheias de prazos diferentes não varia mais que isso
+MAX_FULL_COST_SPREAD = 1.25
+# Só o prazo lido direto do cabeçalho é exato; os outros caminhos deduzem pelo layout do PDF
+EXACT_PRAZO_SOURCES = ("cabecalho",)
+
+
+def _money(value: str) -> float:
+    return float(value.replace(".", "").replace(",", "."))
+
+
+def _clean_line(line: str) -> str:
+    # O pypdf às vezes quebra números no meio ("7.2 60,00", "2.297 ,21")
+    line = line.replace("R$", " ")
+    line = re.sub(r"(\.\d{1,2}) (\d)", r"\1\2", line)
+    line = re.sub(r"(\d) ,(\d)", r"\1,\2", line)
+    return line
+
+
+def _split_glued(token: str, allowed: set) -> List[int]:
+    """'36100' -> [36, 100]; '200200' -> [200, 200]. Cabeçalhos do PDF colam prazos vizinhos."""
+    value = int(token)
+    if (allowed and value in allowed) or (not allowed and MIN_PRAZO <= value <= MAX_PRAZO):
+        return [value]
+    for cut in range(2, len(token) - 1):
+        left, right = token[:cut], token[cut:]
+        if right.startswith("0"):
+            continue
+        left_parts = _split_glued(left, allowed)
+        right_parts = _split_glued(right, allowed)
+        if left_parts and right_parts:
+            return left_parts + right_parts
+    return []
+
+
+def infer_subcategoria(text: str) -> str:
+    """'Moto_MB - ate 30 mil' -> 'Moto'; 'carro' -> 'Automovel'. Vazio se não reconhecer."""
+    for word in normalize_query(text.replace("_", " ")).split():
+        if word in SUBCATEGORY_KEYWORDS:
+            return SUBCATEGORY_KEYWORDS[word]
+    return ""
+
+
+def _layout_score(total_cost: np.ndarray) -> float:
+    """
+    Quão bem os custos totais das colunas se encaixam no padrão de um plano: colunas "normais" pagam
+    o custo cheio e as "Mais por Menos" pagam 75% ou 50% dele até a contemplação. Menor = mais coerente.
+    """
+    full = total_cost.max()
+    if full <= 0:
+        return float("inf")
+    relative = total_cost / full
+    return float(np.abs(relative[:, None] - MAIS_POR_MENOS_FACTORS[None, :]).min(axis=1).sum())
+
+
+def full_columns(prazos: np.ndarray, credits: np.ndarray, regular: np.ndarray) -> Tuple[Optional[List[int]], str]:
+    """
+    Confere se a leitura coluna -> prazo é possível e devolve as colunas "cheias" (uma por prazo).
+    - As colunas do mesmo prazo vêm juntas: a primeira é a cheia e as seguintes ("Mais por Menos")
+      pagam menos até a contemplação; essas saem da grade, não são a parcela do prazo.
+    - Prazos distintos entre as colunas cheias (nada de 100, 90, 100).
+    - Parcela x prazo >= crédito em todas as linhas das colunas cheias (consórcio não custa menos
+      que a carta) e custo total parecido entre os prazos.
+    Devolve (índices, "") ou (None, motivo).
+    """
+    cost = regular * prazos[None, :] / credits[:, None]
+    median_cost = np.median(cost, axis=0)
+    keep, seen = [], set()
+    for col, prazo in enumerate(prazos):
+        if keep and prazos[keep[-1]] == prazo:
+            if median_cost[col] > REDUCED_MAX_RATIO * median_cost[keep[-1]]:
+                return None, f"duas colunas cheias com prazo {prazo:g}"
+            continue
+        if prazo in seen:
+            return None, f"prazo {prazo:g} repetido em colunas separadas"
+        seen.add(prazo)
+        keep.append(col)
+    if (cost[:, keep] < 1.0).any():
+        return None, "parcela x prazo menor que o crédito"
+    full_cost = median_cost[keep]
+    if full_cost.max() / full_cost.min() > MAX_FULL_COST_SPREAD:
+        return None, "custo total incoerente entre os prazos"
+    return keep, ""
+
+
+def parse_price_table(path: str, metadata: dict) -> Optional[dict]:
+    """
+    Extrai a grade crédito x prazo -> parcela de um PDF de Tabelas.
+    Os PDFs das administradoras não têm um layout único, então o mapeamento coluna -> prazo é
+    escolhido entre as leituras possíveis do cabeçalho (ver _layout_score); `prazo_source` registra
+    qual leitura foi usada. Tabela sem cabeçalho legível ou cuja leitura não passa no full_columns()
+    fica de fora (None): prazo chutado não vira preço.
+    """
+    # Só o ingest lê PDFs: a API carrega a grade já extraída e não precisa do pypdf no import
+    from pypdf import PdfReader
+
+    pages = [page.extract_text() or "" for page in PdfReader(path).pages]
+    full_text = "\n".join(pages)
+
+    allowed = set()
+    for match in ALLOWED_PRAZOS_RE.finditer(full_text):
+        allowed.update(n for n in map(int, re.findall(r"\d+", match.group(1))) if MIN_PRAZO <= n <= MAX_PRAZO)
+
+    rows, header_lines = [], []
+    for line in (pages[0] if pages else "").splitlines():
+        line = _clean_line(line)
+        match = ROW_RE.match(line.strip())
+        if match:
+            values = [_money(v) for v in MONEY_RE.findall(match.group("rest"))]
+            rows.append((match.group("code"), _money(match.group("credit")), values))
+        else:
+            header_lines.append(line)
+    if not rows:
+        return None
+
+    # Mantém só as linhas com a largura mais comum (descarta rodapés e linhas quebradas)
+    width = Counter(len(values) for _, _, values in rows).most_common(1)[0][0]
+    rows = [row for row in rows if len(row[2]) == width]
+    header = "\n".join(header_lines)
+
+    # 1ª parcela + demais parcelas (pares) ou uma coluna por prazo
+    paired = "Demais" in header
+    groups = header.count("Demais") if paired else len(re.findall(r"Parcelas(?![a-zà-ú])", header))
+    per_group = 2 if paired else 1
+    if groups == 0 or groups * per_group > width:
+        return None
+
+    codes = [code for code, _, _ in rows]
+    credits = np.array([credit for _, credit, _ in rows], dtype=np.float64)
+    grid = np.array([values[width - groups * per_group:] for _, _, values in rows], dtype=np.float64)
+    if paired:
+        first = grid[:, 0::2]
+        regular = grid[:, 1::2]
+    else:
+        first = np.full((len(rows), groups), np.nan)
+        regular = grid
+
+    # Prazos candidatos do cabeçalho, na ordem em que aparecem
+    header_prazos = []
+    for token in HEADER_INT_RE.findall(header):
+        header_prazos.extend(_split_glued(token, allowed))
+
+    ratio = np.median(regular / credits[:, None], axis=0)  # parcela/crédito por coluna
+    if len(header_prazos) == groups:
+        # O texto do cabeçalho sai fora de ordem em vários PDFs. Testa as leituras possíveis e fica
+        # com a que deixa o custo total (parcela x prazo / crédito) mais coerente entre as colunas.
+        by_ratio = np.empty(groups)
+        by_ratio[np.argsort(ratio)] = sorted(header_prazos, reverse=True)
+        candidates = [
+            ("cabecalho", np.array(header_prazos, dtype=np.float64)),
+            ("ordenado", np.array(sorted(header_prazos, reverse=True), dtype=np.float64)),
+            ("inferido", by_ratio),
+        ]
+        source, prazos = min(candidates, key=lambda item: _layout_score(ratio * item[1]))
+    else:
+        print(f"⚠️ Prazos não lidos do cabeçalho ({len(header_prazos)} para {groups} colunas): {path}")
+        return None
+
+    keep, reason = full_columns(prazos, credits, regular)
+    if keep is None:
+        print(f"⚠️ Grade de preços descartada ({source}: {prazos.astype(int).tolist()}, {reason}): {path}")
+        return None
+
+    fundo = FUNDO_RESERVA_RE.search(full_text)
+    plano = os.path.splitext(os.path.basename(path))[0]
+    subcategoria = metadata.get("subcategoria", "Geral")
+    if subcategoria == "Geral":
+        # Tabelas soltas na pasta (sem subpasta por tipo de bem): deduz pelo nome do arquivo
+        subcategoria = infer_subcategoria(plano) or subcategoria
+    return {
+        "source": path,
+        "administradora": metadata.get("administradora", ""),
+        "subcategoria": subcategoria,
+        "plano": plano,
+        "prazo_source": source,
+        "fundo_reserva_pct": float(fundo.group(1).replace(",", ".")) if fundo else None,
+        "codes": codes,
+        "credits": credits,
+        "prazos": prazos[keep],
+        "first": first[:, keep],
+        "regular": regular[:, keep],
+    }
+
+
+class PriceTableStore:
+    """
+    Armazenamento colunar (uma linha por cota x prazo) das tabelas de preço de todas as administradoras.
+    A busca é uma distância vetorizada sobre arrays NumPy: sub-milissegundo para alguns milhares de linhas.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], plans: List[dict], codes: List[str]):
+        self.columns = columns
+        self.plans = plans
+        self.codes = codes
+        self._admin_keys = np.array([normalize_query(p["administradora"]) for p in plans], dtype=object)
+        self._subcat_keys = np.array([normalize_query(p["subcategoria"]) for p in plans], dtype=object)
+        self._prazo_sources = np.array([p["prazo_source"] for p in plans], dtype=object)
+
+    def __len__(self):
+        return len(self.columns.get("credito", ()))
+
+    @property
+    def administradoras(self) -> List[str]:
+        """Administradoras com pelo menos uma tabela, na ordem de ingestão."""
+        return list(dict.fromkeys(p["administradora"] for p in self.plans))
+
+    @classmethod
+    def from_tables(cls, tables: List[dict]) -> "PriceTableStore":
+        plans, parts = [], {name: [] for name in ("plan_id", "code_idx", "credito", "prazo", "parcela", "primeira_parcela")}
+        codes = []
+        for plan_id, table in enumerate(tables):
+            plans.append({k: table[k] for k in ("source", "administradora", "subcategoria", "plano", "prazo_source", "fundo_reserva_pct")})
+            n_rows, n_groups = table["regular"].shape
+            code_offset = len(codes)
+            codes.extend(table["codes"])
+            parts["plan_id"].append(np.full(n_rows * n_groups, plan_id, dtype=np.int32))
+            parts["code_idx"].append(np.repeat(np.arange(n_rows) + code_offset, n_groups).astype(np.int32))
+            parts["credito"].append(np.repeat(table["credits"], n_groups))
+            parts["prazo"].append(np.tile(table["prazos"], n_rows))
+            parts["parcela"].append(table["regular"].ravel())
+            parts["primeira_parcela"].append(table["first"].ravel())
+
+        columns = {name: np.concatenate(chunks) if chunks else np.array([]) for name, chunks in parts.items()}
+        return cls(columns, plans, codes)
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.savez(os.path.join(directory, STORE_FILE), **self.columns)
+        with open(os.path.join(directory, PLANS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"plans": self.plans, "codes": self.codes}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["PriceTableStore"]:
+        store_path = os.path.join(directory, STORE_FILE)
+        plans_path = os.path.join(directory, PLANS_FILE)
+        if not os.path.exists(store_path) or not os.path.exists(plans_path):
+            return None
+        with np.load(store_path) as data:
+            columns = {name: data[name] for name in data.files}
+        with open(plans_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(columns, meta["plans"], meta["codes"])
+
+    def lookup(
+        self,
+        credit_value: float,
+        months: int,
+        administradora: str = "",
+        subcategoria: str = "",
+        prazo_sources: Sequence[str] = (),
+    ) -> Optional[dict]:
+        """
+        Linha mais próxima de (crédito, prazo), filtrando por administradora/subcategoria e pela origem
+        do prazo (ex.: EXACT_PRAZO_SOURCES) quando informadas.
+        None sem tabela compatível ou com crédito/prazo não positivos.
+        """
+        if not len(self) or not credit_value > 0 or not months > 0:
+            return None
+        cols = self.columns
+        plan_id = cols["plan_id"]
+        mask = np.ones(len(plan_id), dtype=bool)
+        if administradora:
+            mask &= (self._admin_keys == normalize_query(administradora))[plan_id]
+        if subcategoria:
+            mask &= (self._subcat_keys == normalize_query(subcategoria))[plan_id]
+        if prazo_sources:
+            mask &= np.isin(self._prazo_sources, list(prazo_sources))[plan_id]
+        rows = np.flatnonzero(mask)
+        if not rows.size:
+            return None
+
+        # Distância relativa (log) só nas linhas do filtro — prazo pesa mais porque a pergunta costuma ser "em N meses"
+        distance = np.abs(np.log(cols["credito"][rows] / credit_value)) + 2.0 * np.abs(np.log(cols["prazo"][rows] / months))
+        i = int(rows[np.argmin(distance)])
+
+        plan = self.plans[int(plan_id[i])]
+        first = float(cols["primeira_parcela"][i])
+        return {
+            "administradora": plan["administradora"],
+            "subcategoria": plan["subcategoria"],
+            "plano": plan["plano"],
+            "codigo": self.codes[int(cols["code_idx"][i])],
+            "credito": float(cols["credito"][i]),
+            "prazo": int(cols["prazo"][i]),
+            "parcela": float(cols["parcela"][i]),
+            "primeira_parcela": None if np.isnan(first) else first,
+            "custo_total_pct": (float(cols["parcela"][i]) * int(cols["prazo"][i]) / float(cols["credito"][i]) - 1) * 100,
+            "fundo_reserva_pct": plan["fundo_reserva_pct"],
+            "prazo_source": plan["prazo_source"],
+        }
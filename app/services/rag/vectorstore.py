@@ -1 +1,282 @@
-# Código de conexão com Pinecone virá aqui
\ No newline at end of file
+# app/services/rag/vectorstore.py
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional, TYPE_CHECKING, Tuple
+
+from app.core.config import settings
+from app.core.telemetry import span
+from app.services.rag.cache import RetrievalCache, read_index_version
+from app.services.rag.hybrid import analyze_query, filter_levels, list_administradoras, reciprocal_rank_fusion
+from app.services.rag.lexical_index import BM25Index
+from app.services.rag.local_index import LocalVectorIndex
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# Índices só de leitura compartilhados pelo processo: {nome: (versão do índice, objeto)}.
+# Com o gunicorn --preload são carregados no master e os workers herdam as páginas (copy-on-write);
+# um ingest novo (outra versão publicada) faz o próximo retriever recarregar do disco
+_shared_indexes: Dict[str, Tuple[str, object]] = {}
+
+# Stack do Pinecone/OpenAI importada só ao criar o retriever (ou no preload, antes do fork)
+VECTOR_STACK_MODULES = ("langchain_core.documents", "langchain_openai", "langchain_pinecone")
+
+
+def _shared_index(name: str, loader: Callable[[], object], version: Optional[str] = None):
+    version = version or read_index_version()
+    cached = _shared_indexes.get(name)
+    if cached is None or cached[0] != version:
+        cached = _shared_indexes[name] = (version, loader())
+    return cached[1]
+
+
+def shared_local_index(version: Optional[str] = None) -> LocalVectorIndex:
+    return _shared_index("local", lambda: LocalVectorIndex.load(settings.LOCAL_INDEX_DIR), version)
+
+
+def shared_lexical_index(version: Optional[str] = None) -> BM25Index:
+    if not settings.RAG_HYBRID_ENABLED:
+        return BM25Index.empty()
+    return _shared_index("lexical", lambda: BM25Index.load(settings.LEXICAL_INDEX_DIR), version)
+
+
+def preload_indexes() -> Dict[str, int]:
+    """Carrega os índices locais que o retriever vai usar (trechos por índice), para o preload."""
+    loaded = {"lexical": len(shared_lexical_index())}
+    if settings.VECTOR_BACKEND == "local":
+        loaded["local"] = len(shared_local_index())
+    return loaded
+
+
+def _pinecone_filter(filters: Optional[dict]) -> Optional[dict]:
+    # Listas viram $in; valores simples são igualdade (mesma semântica do índice local)
+    if not filters:
+        return None
+    return {
+        field: {"$in": list(value)} if isinstance(value, (list, tuple, set)) else {"$eq": value}
+        for field, value in filters.items()
+    }
+
+
+class KnowledgeBaseRetriever:
+    """
+    Conexão de longa duração com a Base de Conhecimento (OpenAI Embeddings + índice vetorial).
+    Criada uma vez por worker: os clientes HTTP e o handshake com o índice são reaproveitados
+    em todas as buscas, em vez de recriados a cada chamada da ferramenta.
+    O índice é o Pinecone ou o LocalVectorIndex (NumPy em memória), conforme VECTOR_BACKEND.
+    Busca híbrida: a lista vetorial é fundida (RRF) com a do BM25 dos mesmos trechos, e a
+    administradora/tipo do bem citados na pergunta filtram os metadados antes das duas buscas.
+    """
+
+    def __init__(self, http_client=None, http_async_client=None):
+        from langchain_openai import OpenAIEmbeddings
+
+        # 1. Tradução (Embeddings) usando o mesmo pool HTTP do LLM
+        self.embeddings = OpenAIEmbeddings(
+            api_key=settings.OPENAI_API_KEY,
+            model=settings.EMBEDDING_MODEL,
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=http_client,
+            http_async_client=http_async_client,
+            # Só embeda perguntas curtas: dispensa a tokenização com tiktoken antes de cada chamada
+            check_embedding_ctx_length=False,
+        )
+
+        # 2. Banco de Memória: local (mmap do disco) ou Pinecone (pool de conexões aberto)
+        # Versão do ingest dos índices locais em uso; outra versão publicada troca os índices (_use_version)
+        self._loaded_version = read_index_version()
+        self._version_checked_at = time.monotonic()
+        self.backend = settings.VECTOR_BACKEND
+        self.vectorstore = None
+        self.local_index = None
+        if self.backend == "local":
+            self.local_index = shared_local_index(self._loaded_version)
+            logger.info(f"📚 Índice local carregado: {len(self.local_index)} trechos de {settings.LOCAL_INDEX_DIR}")
+        else:
+            try:
+                from langchain_pinecone import PineconeVectorStore
+            except ImportError:
+                from langchain_pinecone import Pinecone as PineconeVectorStore
+
+            self.vectorstore = PineconeVectorStore(
+                index_name=settings.PINECONE_INDEX_NAME,
+                embedding=self.embeddings,
+                pinecone_api_key=settings.PINECONE_API_KEY
+            )
+
+        # 3. Índice lexical (BM25) para a busca híbrida: vale para os dois backends
+        self.lexical_index = shared_lexical_index(self._loaded_version)
+        if len(self.lexical_index):
+            logger.info(f"🔤 Índice BM25 carregado: {len(self.lexical_index)} trechos de {settings.LEXICAL_INDEX_DIR}")
+        self._administradoras = self._known_administradoras()
+
+        # 4. Cache de embeddings e de resultados (perguntas repetidas não saem do processo)
+        self.cache = RetrievalCache() if settings.RAG_CACHE_ENABLED else None
+
+    def _known_administradoras(self) -> List[str]:
+        # Manifesto do ingest (ou pastas da base), mais o que os índices locais tiverem nos metadados
+        names = list_administradoras(settings.INGEST_MANIFEST_FILE)
+        for index in (self.lexical_index, self.local_index):
+            if index is not None and len(index):
+                names.extend(index.values("administradora"))
+        return list(dict.fromkeys(names))
+
+    def _use_version(self, version: str):
+        """
+        Ingest publicou outra versão: troca os índices locais (vetorial e BM25) e a lista de
+        administradoras. Se a versão nova não carregar, segue com a antiga e tenta na próxima checagem.
+        """
+        if version == self._loaded_version:
+            return
+        try:
+            local_index = shared_local_index(version) if self.local_index is not None else None
+            lexical_index = shared_lexical_index(version)
+        except Exception as e:
+            logger.error(f"❌ Índices da versão {version} não carregaram; mantendo a versão {self._loaded_version}: {e}")
+            return
+        self.local_index, self.lexical_index = local_index, lexical_index
+        self._loaded_version = version
+        self._administradoras = self._known_administradoras()
+        logger.info(f"♻️ Índices locais recarregados (versão {version}): {len(lexical_index)} trechos no BM25")
+
+    def _check_index_version(self):
+        # Lê o arquivo de versão no máximo a cada INDEX_VERSION_CHECK_SECONDS
+        now = time.monotonic()
+        if now - self._version_checked_at >= settings.INDEX_VERSION_CHECK_SECONDS:
+            self._version_checked_at = now
+            self._use_version(read_index_version())
+
+    @property
+    def administradoras(self) -> List[str]:
+        """Administradoras que viram filtro; relidas junto com os índices quando sai outra versão."""
+        self._check_index_version()
+        return self._administradoras
+
+    def scope(self, query: str, filters: Optional[dict] = None) -> Optional[dict]:
+        """Filtros da busca: os do chamador ou, sem eles, a administradora/subcategoria citadas na pergunta."""
+        if filters or not settings.RAG_ENTITY_FILTERS:
+            return filters
+        return analyze_query(query, self.administradoras).filters() or None
+
+    async def _embed(self, query: str) -> List[float]:
+        if self.cache is None:
+            return await self.embeddings.aembed_query(query)
+        vector = await self.cache.get_embedding(query)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(query)
+            await self.cache.set_embedding(query, vector)
+        return vector
+
+    async def embed_query(self, query: str) -> List[float]:
+        """Embedding da pergunta (com cache), para quem precisa do vetor fora da busca."""
+        return await self._embed(query)
+
+    async def index_version(self) -> str:
+        """Versão da base publicada pelo último ingest (entra na chave dos caches de resposta)."""
+        if self.cache is not None:
+            return await self.cache.current_index_version()
+        return read_index_version()
+
+    async def _query_index(self, vector: List[float], k: int, filters: Optional[dict]) -> List["Document"]:
+        if self.local_index is not None:
+            # Microssegundos: não compensa mandar para uma thread
+            results = self.local_index.search(vector, k=k, filters=filters)
+        else:
+            results = await asyncio.to_thread(
+                self.vectorstore.similarity_search_by_vector_with_score,
+                vector, k=k, filter=_pinecone_filter(filters)
+            )
+        return [doc for doc, _score in results]
+
+    async def _retrieve(self, query: str, vector: List[float], k: int, filters: Optional[dict]) -> List["Document"]:
+        """
+        Candidatos vetoriais e BM25 para cada nível de filtro (com e sem subcategoria), fundidos por RRF.
+        Sem índice BM25 e sem subcategoria, é a busca vetorial de sempre.
+        """
+        levels = filter_levels(filters or {})
+        hybrid = len(self.lexical_index) > 0
+        if not hybrid and len(levels) == 1:
+            with span("rag_query"):
+                return await self._query_index(vector, k, levels[0])
+
+        n = max(k, settings.RAG_HYBRID_CANDIDATES)
+        with span("rag_query"):
+            rankings = list(await asyncio.gather(*(self._query_index(vector, n, level) for level in levels)))
+        if hybrid:
+            with span("rag_lexical"):
+                for level in levels:
+                    rankings.append([doc for doc, _score in self.lexical_index.search(query, k=n, filters=level)])
+        return reciprocal_rank_fusion(rankings, k, settings.RAG_RRF_K)
+
+    async def asearch(self, query: str, k: int = None, filters: Optional[dict] = None) -> List["Document"]:
+        """
+        Busca assíncrona: o embedding usa o cliente async da OpenAI e a consulta ao
+        Pinecone (cliente síncrono) roda numa thread, sem travar o event loop do worker.
+        `filters` filtra por metadados (administradora/categoria/subcategoria); sem ele, valem as
+        entidades citadas na pergunta.
+        """
+        k = k or settings.RAG_TOP_K
+        # Mesma versão que entra na chave do cache de resultados: índice e cache nunca ficam desencontrados
+        self._use_version(await self.index_version())
+        if self.cache is not None:
+            cached = await self.cache.get_results(query, k, filters)
+            if cached is not None:
+                return cached
+
+        scoped = self.scope(query, filters)
+        with span("rag_embed"):
+            vector = await self._embed(query)
+        docs = await self._retrieve(query, vector, k, scoped)
+        if not docs and scoped and not filters:
+            # Entidade citada sem trecho correspondente no índice: busca sem filtro em vez de voltar vazio
+            docs = await self._retrieve(query, vector, k, None)
+
+        if self.cache is not None:
+            await self.cache.set_results(query, k, docs, filters)
+        return docs
+
+    def search(self, query: str, k: int = None, filters: Optional[dict] = None) -> List["Document"]:
+        # Versão síncrona para scripts (ex.: test_rag.py)
+        k = k or settings.RAG_TOP_K
+        self._check_index_version()
+        if self.local_index is not None:
+            vector = self.embeddings.embed_query(query)
+            return [doc for doc, _score in self.local_index.search(vector, k=k, filters=filters)]
+        return self.vectorstore.similarity_search(query, k=k, filter=_pinecone_filter(filters))
+
+    async def warm_up(self):
+        """Abre a conexão com o índice antes da primeira pergunta real."""
+        if self.local_index is not None:
+            # Traz as páginas do mmap para o page cache antes da primeira busca
+            if len(self.local_index):
+                self.local_index.vectors.sum()
+            return
+        await asyncio.to_thread(self.vectorstore._index.describe_index_stats)
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats() if self.cache is not None else {"enabled": False}
+
+    async def close(self):
+        if self.cache is not None:
+            await self.cache.close()
+
+
+_retriever: Optional[KnowledgeBaseRetriever] = None
+
+
+def init_retriever(http_client=None, http_async_client=None) -> KnowledgeBaseRetriever:
+    """Chamado pelo EngineRegistry no startup, com os pools HTTP do worker."""
+    global _retriever
+    _retriever = KnowledgeBaseRetriever(http_client=http_client, http_async_client=http_async_client)
+    return _retriever
+
+
+def get_retriever() -> KnowledgeBaseRetriever:
+    # Fallback preguiçoso para quem usa a ferramenta fora da API (scripts, testes)
+    global _retriever
+    if _retriever is None:
+        _retriever = KnowledgeBaseRetriever()
+    return _retriever
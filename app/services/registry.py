@@ -0,0 +1,211 @@
+# app/services/registry.py
+import asyncio
+import importlib
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.crm import crm_service
+from app.services.intents import IntentRouter, build_intent_router
+from app.services.llm.engine import LLM_STACK_MODULES, LLMEngine
+from app.services.llm.tools import get_agent_tools, get_price_store
+from app.services.memory import ConversationMemory, build_session_store
+from app.services.orchestrator import ConversationOrchestrator
+from app.services.rag.vectorstore import VECTOR_STACK_MODULES, init_retriever, preload_indexes
+
+# Sem o SDK/driver do LEADS_BACKEND a API sobe sem gravar leads (o writer só descarta)
+from app.services.database.writer import lead_writer
+
+logger = logging.getLogger(__name__)
+
+OPENAI_DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+
+class EngineRegistry:
+    """
+    Guarda os objetos caros de cada worker (clientes HTTP, LLM, AgentExecutor).
+    É criado uma vez no startup (lifespan do FastAPI) e compartilhado por todas as rotas,
+    então nenhuma chamada de voz paga a construção do agente antes do primeiro token.
+    """
+
+    def __init__(self):
+        self.http_client: Optional[httpx.Client] = None
+        self.http_async_client: Optional[httpx.AsyncClient] = None
+        self.orchestrator: Optional[ConversationOrchestrator] = None
+        self.retriever = None
+        self.memory: Optional[ConversationMemory] = None
+        self.answer_cache: Optional[SemanticAnswerCache] = None
+        # Só leitura, igual em todos os workers: pode ser montado antes do fork (preload)
+        self.intent_router: Optional[IntentRouter] = None
+        self.preload_seconds: Optional[Dict[str, float]] = None
+        self.ready = False
+        self.warmup_error: Optional[str] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+
+    def _build_http_clients(self):
+        limits = httpx.Limits(
+            max_connections=settings.OPENAI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=settings.OPENAI_HTTP_KEEPALIVE_SECONDS,
+        )
+        timeout = httpx.Timeout(60.0, connect=5.0)
+        self.http_client = httpx.Client(limits=limits, timeout=timeout)
+        self.http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    def preload(self) -> Dict[str, float]:
+        """
+        Estado só de leitura montado uma vez no master do gunicorn (preload_app), antes do fork:
+        stack do LangChain, ferramentas e seus schemas, prompt fixo já contado, tabelas de preços,
+        índices locais (vetorial/BM25) e o roteador de intents. Os workers herdam tudo copy-on-write;
+        clientes HTTP, event loop e conexões continuam sendo abertos por worker, no build().
+        Devolve quanto cada etapa levou (segundos).
+        """
+        # Só aqui e no LLMEngine: o prompt_builder puxa langchain_core.messages/function_calling
+        from app.services.llm.prompt_builder import get_prompt_builder
+
+        timings: Dict[str, float] = {}
+
+        def timed(stage: str, fn: Callable):
+            started = time.perf_counter()
+            result = fn()
+            timings[stage] = round(time.perf_counter() - started, 3)
+            return result
+
+        timed("imports", lambda: [importlib.import_module(name) for name in dict.fromkeys(LLM_STACK_MODULES + VECTOR_STACK_MODULES)])
+        tools = timed("tools", get_agent_tools)
+        timed("prompt", lambda: get_prompt_builder().set_tools(tools))
+        timed("price_tables", get_price_store)
+        indexes = timed("indexes", preload_indexes)
+        if settings.INTENT_ROUTER_ENABLED:
+            self.intent_router = timed("intents", build_intent_router)
+
+        self.preload_seconds = timings
+        logger.info(f"📦 Preload concluído em {sum(timings.values()):.2f}s {timings} | índices: {indexes}")
+        return timings
+
+    def _get_intent_router(self) -> Optional[IntentRouter]:
+        if self.intent_router is None and settings.INTENT_ROUTER_ENABLED:
+            self.intent_router = build_intent_router()
+        return self.intent_router
+
+    def build(self) -> ConversationOrchestrator:
+        """Monta (uma única vez) os clientes HTTP, o LLMEngine e o orquestrador."""
+        if self.orchestrator is None:
+            if self.http_async_client is None:
+                self._build_http_clients()
+            self.retriever = init_retriever(
+                http_client=self.http_client,
+                http_async_client=self.http_async_client,
+            )
+            engine = LLMEngine(
+                http_client=self.http_client,
+                http_async_client=self.http_async_client,
+            )
+            # Memória por ligação: Redis se houver (compartilhada entre workers), senão no processo
+            self.memory = ConversationMemory(
+                store=build_session_store(),
+                summarizer=engine.summarize if settings.MEMORY_SUMMARIZE else None,
+            )
+            if settings.ANSWER_CACHE_ENABLED:
+                # Reusa o embedding (e o cache de embeddings) do retriever
+                self.answer_cache = SemanticAnswerCache(
+                    embed=self.retriever.embed_query,
+                    index_version=self.retriever.index_version,
+                    administradoras=lambda: self.retriever.administradoras,
+                    standalone_answer=engine.standalone_reply,
+                )
+            self.orchestrator = ConversationOrchestrator(
+                llm_engine=engine,
+                memory=self.memory,
+                intent_router=self._get_intent_router(),
+                answer_cache=self.answer_cache,
+            )
+            logger.info("🧠 LLMEngine/AgentExecutor construídos para este worker.")
+        return self.orchestrator
+
+    def get_orchestrator(self) -> ConversationOrchestrator:
+        # Fallback: se alguém usar a rota sem lifespan (ex.: scripts), monta na hora
+        return self.orchestrator or self.build()
+
+    async def _warm_up(self):
+        """Abre as conexões TLS com a OpenAI antes da primeira ligação de verdade."""
+        base_url = (settings.OPENAI_BASE_URL or OPENAI_DEFAULT_BASE_URL).rstrip("/")
+        headers = {"Authorization": f"Bearer {settings.OPENAI_API_KEY}"}
+
+        attempt = 0
+        while not self.ready:
+            attempt += 1
+            try:
+                # GET /models não consome tokens, só estabelece a conexão do pool
+                response = await self.http_async_client.get(f"{base_url}/models", headers=headers)
+                response.raise_for_status()
+                # Handshake com o índice vetorial também sai do caminho da 1ª pergunta
+                await self.retriever.warm_up()
+                self.ready = True
+                self.warmup_error = None
+                logger.info("🔥 Warm-up concluído: OpenAI e índice vetorial aquecidos.")
+            except Exception as e:
+                # Continua tentando: o readiness só fica verde depois do warm-up
+                self.warmup_error = str(e)
+                logger.warning(f"⚠️ Warm-up falhou (tentativa {attempt}): {e}")
+                await asyncio.sleep(min(2 ** attempt, 30))
+
+    async def startup(self):
+        self.build()
+        # Gravador de leads do worker: cliente do Table Storage aberto uma vez só
+        if lead_writer is not None:
+            await lead_writer.start()
+        # Outbox do CRM: alertas gravados antes de um restart saem assim que o dispatcher sobe
+        await crm_service.start()
+        if settings.WARMUP_ON_STARTUP:
+            # Roda em segundo plano para não atrasar o boot do worker
+            self._warmup_task = asyncio.create_task(self._warm_up())
+        else:
+            self.ready = True
+
+    async def shutdown(self):
+        if self._warmup_task and not self._warmup_task.done():
+            self._warmup_task.cancel()
+        self.ready = False
+        if self.retriever is not None:
+            await self.retriever.close()
+        if self.memory is not None:
+            await self.memory.close()
+        if self.answer_cache is not None:
+            await self.answer_cache.close()
+        # Outbox antes dos leads: com os dois no Postgres, o pool é fechado pelo repositório de leads
+        await crm_service.close()
+        # Grava o que ainda está na fila antes do worker sair
+        if lead_writer is not None:
+            await lead_writer.close()
+        if self.http_async_client is not None:
+            await self.http_async_client.aclose()
+        if self.http_client is not None:
+            self.http_client.close()
+        self.http_client = None
+        self.http_async_client = None
+        self.orchestrator = None
+        self.retriever = None
+        self.memory = None
+        self.answer_cache = None
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "engine_loaded": self.orchestrator is not None,
+            "preloaded": self.preload_seconds is not None,
+            "warmup_error": self.warmup_error,
+            "rag_cache": self.retriever.cache_stats() if self.retriever is not None else None,
+            "lead_writer": lead_writer.stats() if lead_writer is not None else None,
+            "outbox": crm_service.stats(),
+            "answer_cache": self.answer_cache.stats() if self.answer_cache is not None else None,
+            "prompt": self.orchestrator.llm_engine.prompt_builder.stats() if self.orchestrator is not None else None,
+        }
+
+
+# Instância única por processo (cada worker do gunicorn tem a sua)
+engine_registry = EngineRegistry()
@@ -0,0 +1,47 @@
+# gunicorn.conf.py
+"""
+Configuração do gunicorn da API (Dockerfile / docker-compose):
+
+    gunicorn app.main:app -c gunicorn.conf.py
+
+Com GUNICORN_PRELOAD=true (padrão) o app é importado no master e o estado só de leitura
+(stack do LangChain, ferramentas, prompt, tabelas de preços, índices locais, intents) é montado
+uma vez antes do fork: os workers sobem sem refazer esse trabalho e dividem as páginas com o
+master (copy-on-write). O gc.freeze() tira esses objetos das coletas do GC, que senão
+escreveriam nos cabeçalhos deles e copiariam as páginas em cada worker.
+Clientes HTTP, event loop e conexões continuam por worker (lifespan do FastAPI).
+"""
+import gc
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+
+
+def when_ready(server):
+    # Roda no master depois do import do app e antes do primeiro fork
+    if not preload_app:
+        return
+    from app.services.registry import engine_registry
+
+    try:
+        engine_registry.preload()
+    except Exception as e:
+        # Sem preload os workers montam tudo sozinhos no startup, como antes
+        server.log.warning(f"⚠️ Preload falhou, cada worker vai montar o próprio estado: {e}")
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"🧊 gc.freeze: {gc.get_freeze_count()} objetos compartilhados com os workers")
+
+
+def child_exit(server, worker):
+    # Métricas do Prometheus em modo multiprocess: descarta os gauges do worker que saiu
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        try:
+            from prometheus_client import multiprocess
+        except ImportError:
+            return
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,317 @@
+# scripts/bench/loadtest.py
+"""
+Benchmark de carga do webhook da Vapi: reproduz ligações gravadas (um payload por turno, como a
+Vapi manda) com concorrência controlada e mede latência do turno, tempo até o primeiro token (TTFT)
+e requisições/s por worker.
+
+Contra um app já rodando:
+    python scripts/bench/loadtest.py --url http://127.0.0.1:8000 --workers 2 --concurrency 8 --calls 40
+
+Subindo tudo sozinho (mocks de OpenAI/Pinecone + gunicorn apontado para eles):
+    python scripts/bench/loadtest.py --spawn --workers 2 --concurrency 8 --calls 40
+
+Pegar regressão antes do deploy:
+    python scripts/bench/loadtest.py --spawn --output bench_baseline.json          (no main)
+    python scripts/bench/loadtest.py --spawn --baseline bench_baseline.json        (na branch; sai com 1 se piorou)
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT_DIR)
+
+from app.api.v1.openai_compat import FALLBACK_MESSAGE
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PAYLOADS = os.path.join(BENCH_DIR, "payloads.jsonl")
+DEFAULT_ASSISTANT = os.path.join(ROOT_DIR, "tina.json")
+WEBHOOK_PATH = "/api/v1/webhook/vapi/chat/completions"
+
+# Métricas comparadas com o baseline: (grupo, chave, maior é pior?)
+REGRESSION_CHECKS = [
+    ("latency_ms", "p95", True),
+    ("latency_ms", "p99", True),
+    ("ttft_ms", "p95", True),
+    ("throughput", "rps_per_worker", False),
+]
+
+
+@dataclass
+class TurnResult:
+    latency: float
+    ttft: Optional[float]
+    ok: bool
+    fallback: bool = False
+
+
+def load_system_prompt(path: str) -> Optional[str]:
+    """Prompt de sistema do assistente exportado da Vapi (a Vapi manda ele em todo turno)."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        # O export às vezes vem com lixo depois do objeto: lê só o primeiro JSON
+        assistant, _end = json.JSONDecoder().raw_decode(f.read().lstrip())
+    for message in (assistant.get("model") or {}).get("messages") or []:
+        if message.get("role") == "system":
+            return message.get("content")
+    return None
+
+
+def load_conversations(path: str, system_prompt: Optional[str]) -> List[List[dict]]:
+    """Agrupa os payloads gravados por call.id, na ordem em que aparecem no arquivo."""
+    calls: "OrderedDict[str, List[dict]]" = OrderedDict()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            payload = json.loads(line)
+            if system_prompt and not any(m.get("role") == "system" for m in payload.get("messages", [])):
+                payload["messages"] = [{"role": "system", "content": system_prompt}] + payload["messages"]
+            call_id = (payload.get("call") or {}).get("id") or f"call-{len(calls)}"
+            calls.setdefault(call_id, []).append(payload)
+    return list(calls.values())
+
+
+def _with_call_id(payload: dict, call_id: str, stream: Optional[bool]) -> dict:
+    payload = dict(payload)
+    payload["call"] = {**(payload.get("call") or {}), "id": call_id}
+    if stream is not None:
+        payload["stream"] = stream
+    return payload
+
+
+async def run_turn(client: httpx.AsyncClient, url: str, payload: dict) -> TurnResult:
+    started = time.perf_counter()
+    ttft, text = None, []
+    try:
+        if payload.get("stream"):
+            async with client.stream("POST", url, json=payload) as response:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: ") or line == "data: [DONE]":
+                        continue
+                    delta = json.loads(line[6:])["choices"][0].get("delta") or {}
+                    if delta.get("content"):
+                        if ttft is None:
+                            ttft = time.perf_counter() - started
+                        text.append(delta["content"])
+                status = response.status_code
+        else:
+            response = await client.post(url, json=payload)
+            status = response.status_code
+            if status == 200:
+                text.append(response.json()["choices"][0]["message"]["content"] or "")
+            ttft = time.perf_counter() - started
+    except (httpx.HTTPError, ValueError, KeyError, IndexError):
+        return TurnResult(time.perf_counter() - started, None, ok=False)
+    reply = "".join(text)
+    return TurnResult(time.perf_counter() - started, ttft, ok=status == 200 and bool(reply),
+                      fallback=reply == FALLBACK_MESSAGE)
+
+
+async def run_load(args, conversations: List[List[dict]]) -> Dict:
+    url = args.url.rstrip("/") + args.path
+    stream = {"on": True, "off": False}.get(args.stream)
+    results: List[TurnResult] = []
+    counter = itertools.count()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        async def replay(n: int, record: bool):
+            conversation = conversations[n % len(conversations)]
+            # call.id único por replay: cada ligação tem a própria memória no app
+            call_id = f"{(conversation[0].get('call') or {}).get('id', 'bench')}-{args.run_id}-{n}"
+            for turn in conversation:
+                result = await run_turn(client, url, _with_call_id(turn, call_id, stream))
+                if record:
+                    results.append(result)
+                if args.think_ms:
+                    await asyncio.sleep(args.think_ms / 1000)
+
+        # Aquecimento: conexões, caches e o primeiro turno de cada worker ficam fora da medição
+        await asyncio.gather(*(replay(n, record=False) for n in range(args.warmup_calls)))
+
+        async def caller():
+            while True:
+                n = next(counter)
+                if n >= args.calls:
+                    return
+                await replay(n, record=True)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(caller() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - started
+
+    return build_report(results, wall, args)
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    array = np.asarray(values) * 1000
+    p50, p95, p99 = np.percentile(array, [50, 95, 99])
+    return {"p50": round(float(p50), 1), "p95": round(float(p95), 1), "p99": round(float(p99), 1),
+            "max": round(float(array.max()), 1)}
+
+
+def build_report(results: List[TurnResult], wall: float, args) -> Dict:
+    ok = [r for r in results if r.ok]
+    rps = len(ok) / wall if wall else 0.0
+    return {
+        "config": {"concurrency": args.concurrency, "calls": args.calls, "workers": args.workers,
+                   "stream": args.stream, "url": args.url},
+        "turns": len(results),
+        "errors": len(results) - len(ok),
+        "fallbacks": sum(1 for r in results if r.fallback),
+        "wall_seconds": round(wall, 2),
+        "latency_ms": _percentiles([r.latency for r in ok]),
+        "ttft_ms": _percentiles([r.ttft for r in ok if r.ttft is not None]),
+        "throughput": {"rps": round(rps, 2), "rps_per_worker": round(rps / max(args.workers, 1), 2)},
+    }
+
+
+def print_report(report: Dict):
+    print("\n--- 📊 BENCHMARK DO WEBHOOK ---")
+    print(f"Turnos: {report['turns']} | Erros: {report['errors']} | Fallbacks: {report['fallbacks']} "
+          f"| Duração: {report['wall_seconds']}s")
+    for title, key in (("Latência do turno", "latency_ms"), ("Primeiro token", "ttft_ms")):
+        p = report[key]
+        print(f"{title:<18} p50={p['p50']}ms  p95={p['p95']}ms  p99={p['p99']}ms  max={p['max']}ms")
+    print(f"Vazão: {report['throughput']['rps']} req/s ({report['throughput']['rps_per_worker']} req/s por worker)")
+
+
+def compare_with_baseline(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Lista o que piorou além da tolerância (ex.: 0.15 = 15%) em relação ao baseline."""
+    regressions = []
+    for group, key, higher_is_worse in REGRESSION_CHECKS:
+        old, new = (baseline.get(group) or {}).get(key), (report.get(group) or {}).get(key)
+        if not old or new is None:
+            continue
+        limit = old * (1 + tolerance) if higher_is_worse else old * (1 - tolerance)
+        if (new > limit) if higher_is_worse else (new < limit):
+            regressions.append(f"{group}.{key}: {old} -> {new} (limite {limit:.1f})")
+    if report["errors"] > baseline.get("errors", 0):
+        regressions.append(f"errors: {baseline.get('errors', 0)} -> {report['errors']}")
+    return regressions
+
+
+def _wait_ready(url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} não ficou pronto em {timeout:.0f}s")
+
+
+def spawn_stack(args) -> List[subprocess.Popen]:
+    """Sobe os mocks e o gunicorn (mesmo comando de produção) apontado para eles."""
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    mock_cmd = [sys.executable, os.path.join(BENCH_DIR, "mock_upstreams.py"), "--port", str(args.mock_port),
+                "--ttft-ms", str(args.mock_ttft_ms), "--token-ms", str(args.mock_token_ms),
+                "--tool-rate", str(args.mock_tool_rate)]
+    env = {
+        **os.environ,
+        "PYTHONPATH": ROOT_DIR,
+        "OPENAI_API_KEY": "sk-bench",
+        "PINECONE_API_KEY": "bench",
+        "VAPI_API_KEY": os.environ.get("VAPI_API_KEY", "bench"),
+        "OPENAI_BASE_URL": f"{mock_url}/v1",
+        "PINECONE_CONTROLLER_HOST": mock_url,
+        "VECTOR_BACKEND": "pinecone",
+        "PROMETHEUS_MULTIPROC_DIR": tempfile.mkdtemp(prefix="bench-prom-"),
+    }
+    app_cmd = ["gunicorn", "app.main:app", "-c", "gunicorn.conf.py",
+               "--workers", str(args.workers), "--bind", f"127.0.0.1:{args.app_port}", "--log-level", "warning"]
+
+    processes = [subprocess.Popen(mock_cmd, cwd=ROOT_DIR)]
+    try:
+        _wait_ready(f"{mock_url}/indexes/{os.environ.get('PINECONE_INDEX_NAME', 'barcelona-index')}", 30)
+        output = None if args.app_logs else subprocess.DEVNULL
+        processes.append(subprocess.Popen(app_cmd, cwd=ROOT_DIR, env=env, stdout=output, stderr=output))
+        args.url = f"http://127.0.0.1:{args.app_port}"
+        _wait_ready(f"{args.url}/health/ready", 120)
+    except BaseException:
+        stop_stack(processes)
+        raise
+    return processes
+
+
+def stop_stack(processes: List[subprocess.Popen]):
+    for process in reversed(processes):
+        process.terminate()
+    for process in processes:
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de latência e vazão do webhook da Vapi")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", default=WEBHOOK_PATH)
+    parser.add_argument("--payloads", default=DEFAULT_PAYLOADS, help="JSONL com um payload da Vapi por turno")
+    parser.add_argument("--assistant", default=DEFAULT_ASSISTANT, help="export do assistente (prompt de sistema)")
+    parser.add_argument("--concurrency", type=int, default=8, help="ligações simultâneas")
+    parser.add_argument("--calls", type=int, default=40, help="ligações reproduzidas (em ciclo sobre as gravadas)")
+    parser.add_argument("--warmup-calls", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=2, help="workers do gunicorn (para req/s por worker)")
+    parser.add_argument("--stream", choices=["on", "off", "recorded"], default="recorded",
+                        help="força stream=true/false ou usa o que veio gravado")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pausa entre os turnos de uma ligação")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="grava o relatório em JSON (serve de baseline)")
+    parser.add_argument("--baseline", help="relatório anterior para comparar")
+    parser.add_argument("--max-regression", type=float, default=0.15, help="piora tolerada (0.15 = 15%%)")
+    parser.add_argument("--spawn", action="store_true", help="sobe mocks + gunicorn antes de medir")
+    parser.add_argument("--app-port", type=int, default=8010)
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--mock-ttft-ms", type=float, default=350.0)
+    parser.add_argument("--mock-token-ms", type=float, default=20.0)
+    parser.add_argument("--mock-tool-rate", type=float, default=0.5)
+    parser.add_argument("--app-logs", action="store_true", help="mostra os logs do gunicorn no --spawn")
+    args = parser.parse_args()
+    args.run_id = int(time.time())
+
+    conversations = load_conversations(args.payloads, load_system_prompt(args.assistant))
+    if not conversations:
+        sys.exit(f"❌ Nenhum payload em {args.payloads}")
+
+    processes = spawn_stack(args) if args.spawn else []
+    try:
+        report = asyncio.run(run_load(args, conversations))
+    finally:
+        stop_stack(processes)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Relatório salvo em {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_with_baseline(report, json.load(f), args.max_regression)
+        if regressions:
+            print("❌ Regressão em relação ao baseline:")
+            for line in regressions:
+                print(f"   - {line}")
+            sys.exit(1)
+        print("✅ Dentro da tolerância do baseline.")
+
+
+if __name__ == "__main__":
+    main()
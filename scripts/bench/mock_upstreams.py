@@ -0,0 +1,263 @@
+# scripts/bench/mock_upstreams.py
+"""
+Servidor local que imita a OpenAI (chat completions + embeddings) e o Pinecone
+(describe_index + query) para medir o app sem rede, sem custo e sem a variação das APIs reais.
+
+Uso:
+    python scripts/bench/mock_upstreams.py --port 9100 --ttft-ms 350 --token-ms 20 --tool-rate 0.5
+
+No app (o scripts/bench/loadtest.py --spawn já faz isso):
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1
+    PINECONE_CONTROLLER_HOST=http://127.0.0.1:9100
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import time
+import uuid
+import zlib
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MANUAL_FILE = os.path.join(ROOT_DIR, "base_conhecimento", "manual_barcelona.txt")
+
+REPLY_TEXT = (
+    "Entendi. No consórcio não existe juros, só a taxa de administração diluída no prazo, "
+    "e você ainda pode usar lance embutido para não tirar dinheiro do caixa. "
+    "A Fernanda te mostra os números certinhos na reunião. Fica melhor amanhã às 10h ou às 14h?"
+)
+
+
+@dataclass
+class MockConfig:
+    ttft_ms: float = 350.0  # chat: até o primeiro token (ou até a resposta inteira, sem stream)
+    token_ms: float = 20.0  # chat: intervalo entre tokens no stream
+    embed_ms: float = 60.0
+    query_ms: float = 40.0
+    jitter: float = 0.25  # desvio do lognormal: cauda longa como a das APIs reais
+    tool_rate: float = 0.5  # fração das perguntas em que o "modelo" chama a search_knowledge_base
+    dimension: int = 1536
+    seed: int = 42
+
+
+config = MockConfig()
+app = FastAPI(title="Barcelona bench mocks")
+
+
+async def _sleep(ms: float):
+    if ms > 0:
+        await asyncio.sleep(ms / 1000 * random.lognormvariate(0, config.jitter))
+
+
+def _vector(key: str) -> np.ndarray:
+    # Embedding determinístico: mesmo texto -> mesmo vetor (o cache do app funciona como no real)
+    rng = np.random.default_rng(zlib.crc32(key.encode("utf-8")))
+    vector = rng.standard_normal(config.dimension).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _load_corpus() -> List[str]:
+    try:
+        with open(MANUAL_FILE, "r", encoding="utf-8") as f:
+            blocks = [block.strip() for block in f.read().split("\n\n")]
+    except OSError:
+        blocks = []
+    return [block for block in blocks if block] or [REPLY_TEXT]
+
+
+CORPUS = _load_corpus()
+CORPUS_MATRIX = None  # montada no primeiro /query (depende do --dimension)
+
+
+# --- OpenAI: chat completions ---
+
+def _message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def _tool_call(body: dict):
+    """Chama a ferramenta só no plano (última mensagem do usuário), numa fração fixa das perguntas."""
+    names = [tool["function"]["name"] for tool in body.get("tools") or []]
+    messages = body.get("messages") or []
+    if "search_knowledge_base" not in names or not messages or messages[-1].get("role") != "user":
+        return None
+    question = _message_text(messages[-1])
+    # Mesma pergunta -> mesma decisão (replays comparáveis entre execuções)
+    if random.Random(zlib.crc32(question.encode("utf-8")) ^ config.seed).random() >= config.tool_rate:
+        return None
+    return {
+        "id": f"call_{uuid.uuid4().hex[:24]}",
+        "type": "function",
+        "function": {"name": "search_knowledge_base", "arguments": json.dumps({"query": question}, ensure_ascii=False)},
+    }
+
+
+def _usage(body: dict, completion_tokens: int) -> dict:
+    prompt_tokens = sum(len(_message_text(m)) // 4 + 4 for m in body.get("messages") or [])
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    payload = {
+        "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def _stream_chat(body: dict, completion_id: str, tool_call):
+    model = body.get("model", "gpt-4o-mini")
+    await _sleep(config.ttft_ms)
+    if tool_call is not None:
+        yield _chunk(completion_id, model, {"role": "assistant", "content": None, "tool_calls": [{"index": 0, **tool_call}]})
+        yield _chunk(completion_id, model, {}, finish_reason="tool_calls")
+        completion_tokens = 20
+    else:
+        tokens = REPLY_TEXT.split(" ")
+        yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+        for i, token in enumerate(tokens):
+            if i:
+                await _sleep(config.token_ms)
+            yield _chunk(completion_id, model, {"content": token if i == 0 else " " + token})
+        yield _chunk(completion_id, model, {}, finish_reason="stop")
+        completion_tokens = len(tokens)
+    if (body.get("stream_options") or {}).get("include_usage"):
+        payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                   "model": model, "choices": [], "usage": _usage(body, completion_tokens)}
+        yield f"data: {json.dumps(payload)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    tool_call = _tool_call(body)
+    if body.get("stream"):
+        return StreamingResponse(_stream_chat(body, completion_id, tool_call), media_type="text/event-stream")
+
+    # Sem stream: o tempo da geração inteira vem de uma vez
+    tokens = REPLY_TEXT.split(" ")
+    await _sleep(config.ttft_ms + (0 if tool_call else config.token_ms * (len(tokens) - 1)))
+    message = {"role": "assistant", "content": None if tool_call else REPLY_TEXT}
+    if tool_call is not None:
+        message["tool_calls"] = [tool_call]
+    return {
+        "id": completion_id, "object": "chat.completion", "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+        "choices": [{"index": 0, "message": message, "logprobs": None,
+                     "finish_reason": "tool_calls" if tool_call else "stop"}],
+        "usage": _usage(body, 20 if tool_call else len(tokens)),
+    }
+
+
+@app.get("/v1/models")
+async def models():
+    # O warm-up do EngineRegistry abre a conexão com um GET /models
+    return {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model", "owned_by": "bench"}]}
+
+
+# --- OpenAI: embeddings ---
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body.get("input")
+    # Aceita texto, lista de textos ou tokens (o langchain manda tokens quando tem tiktoken)
+    if isinstance(inputs, str) or (isinstance(inputs, list) and inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+    await _sleep(config.embed_ms)
+    data = []
+    for i, item in enumerate(inputs or []):
+        vector = _vector(item if isinstance(item, str) else json.dumps(item))
+        if body.get("encoding_format") == "base64":
+            embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+        else:
+            embedding = vector.tolist()
+        data.append({"object": "embedding", "index": i, "embedding": embedding})
+    tokens = sum(len(item) // 4 if isinstance(item, str) else len(item) for item in inputs or [])
+    return {"object": "list", "data": data, "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+
+# --- Pinecone: control plane + data plane no mesmo servidor ---
+
+@app.get("/indexes/{name}")
+async def describe_index(name: str, request: Request):
+    return {
+        "name": name,
+        "dimension": config.dimension,
+        "metric": "cosine",
+        "host": str(request.base_url).rstrip("/"),
+        "deletion_protection": "disabled",
+        "spec": {"serverless": {"cloud": "aws", "region": "us-east-1"}},
+        "status": {"ready": True, "state": "Ready"},
+    }
+
+
+@app.api_route("/describe_index_stats", methods=["GET", "POST"])
+async def describe_index_stats():
+    return {"namespaces": {"": {"vectorCount": len(CORPUS)}}, "dimension": config.dimension,
+            "indexFullness": 0.0, "totalVectorCount": len(CORPUS)}
+
+
+@app.post("/query")
+async def query(request: Request):
+    global CORPUS_MATRIX
+    body = await request.json()
+    if CORPUS_MATRIX is None:
+        CORPUS_MATRIX = np.stack([_vector(text) for text in CORPUS])
+    await _sleep(config.query_ms)
+    vector = np.asarray(body.get("vector") or _vector(""), dtype=np.float32)
+    scores = CORPUS_MATRIX @ vector[: config.dimension]
+    top_k = min(int(body.get("topK", 3)), len(CORPUS))
+    best = np.argsort(-scores)[:top_k]
+    matches = [
+        {
+            "id": f"manual-{i}",
+            "score": float(scores[i]),
+            "values": [],
+            "metadata": {"text": CORPUS[i], "administradora": "Geral", "categoria": "Manual",
+                         "source": "manual_barcelona.txt"},
+        }
+        for i in best
+    ]
+    return JSONResponse({"matches": matches, "namespace": body.get("namespace", ""),
+                         "usage": {"readUnits": 1}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mocks locais de OpenAI e Pinecone para benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=config.ttft_ms)
+    parser.add_argument("--token-ms", type=float, default=config.token_ms)
+    parser.add_argument("--embed-ms", type=float, default=config.embed_ms)
+    parser.add_argument("--query-ms", type=float, default=config.query_ms)
+    parser.add_argument("--jitter", type=float, default=config.jitter)
+    parser.add_argument("--tool-rate", type=float, default=config.tool_rate)
+    parser.add_argument("--dimension", type=int, default=config.dimension)
+    parser.add_argument("--seed", type=int, default=config.seed)
+    args = parser.parse_args()
+
+    for field in ("ttft_ms", "token_ms", "embed_ms", "query_ms", "jitter", "tool_rate", "dimension", "seed"):
+        setattr(config, field, getattr(args, field))
+    random.seed(config.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
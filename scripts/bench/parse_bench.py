@@ -0,0 +1,112 @@
+# scripts/bench/parse_bench.py
+"""
+Compara o custo de decodificar um turno da Vapi no caminho antigo e no atual, com payloads grandes
+(histórico longo + objeto `call` completo, como a Vapi manda a cada turno).
+
+    python scripts/bench/parse_bench.py --messages 20 60 120 --repeat 2000
+
+Caminho antigo: json.loads + modelo pydantic do payload inteiro (o ChatCompletionsRequest que
+ficava no app/main.py) + histórico montado em todo turno + resposta via json.dumps.
+Caminho atual: VapiTurn (orjson, só os campos usados, histórico sob demanda) + completion_response.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT_DIR)
+
+from app.api.v1.openai_compat import build_completion, completion_response
+from app.api.v1.schemas import VapiTurn
+from app.core.json_codec import orjson
+from app.services.memory import history_from_openai_messages
+from loadtest import DEFAULT_ASSISTANT, load_system_prompt
+
+
+class LegacyChatMessage(BaseModel):
+    role: Literal["system", "user", "assistant", "tool"]
+    content: Optional[str] = None
+    tool_calls: Optional[List[Any]] = None
+
+
+class LegacyChatCompletionsRequest(BaseModel):
+    model: str
+    messages: List[LegacyChatMessage]
+    temperature: Optional[float] = 0.2
+    stream: Optional[bool] = False
+    call: Optional[Dict[str, Any]] = None
+
+
+def build_payload(n_messages: int, system_prompt: str) -> bytes:
+    """Turno sintético no formato da Vapi: prompt de sistema, `n_messages` falas e um `call` pesado."""
+    messages = [{"role": "system", "content": system_prompt}]
+    for i in range(n_messages):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"Fala {i} da ligação sobre consórcio de imóveis e lances com FGTS. " * 3})
+    call = {
+        "id": "bench-call-parse",
+        "orgId": "org-bench",
+        "type": "outboundPhoneCall",
+        "status": "in-progress",
+        "customer": {"number": "+5511990000000", "name": "Cliente Bench"},
+        "phoneNumber": {"id": "pn-1", "number": "+551130000000", "provider": "twilio"},
+        "assistant": {"name": "Tina", "model": {"provider": "custom-llm", "messages": messages[:1]},
+                      "voice": {"provider": "deepgram", "voiceId": "luna"}},
+        "transcriber": {"provider": "deepgram", "model": "nova-2", "language": "pt-BR"},
+        "artifact": {"messages": [{"role": m["role"], "message": m["content"], "time": 1_700_000_000 + i}
+                                  for i, m in enumerate(messages[1:])]},
+    }
+    payload = {"model": "gpt-4.1-mini", "stream": False, "temperature": 0.2, "messages": messages, "call": call}
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def legacy_path(body: bytes) -> bytes:
+    payload = LegacyChatCompletionsRequest(**json.loads(body))
+    user_messages = [m for m in payload.messages if m.role == "user"]
+    _last_input = user_messages[-1].content if user_messages else ""
+    _call_id = (payload.call or {}).get("id") or "vapi_call"
+    _transcript = history_from_openai_messages([m.model_dump() for m in payload.messages])
+    completion = build_completion("Resposta da consultora.", payload.model)
+    return json.dumps(completion).encode("utf-8")
+
+
+def current_path(body: bytes) -> bytes:
+    turn = VapiTurn.from_bytes(body)
+    _last_input, _call_id, _phone = turn.user_message, turn.call_id, turn.customer_phone
+    # Sessão já existe na memória na maioria dos turnos: o histórico não é montado
+    return completion_response("Resposta da consultora.", turn.model).body
+
+
+def measure(fn, body: bytes, repeat: int) -> float:
+    for _ in range(min(repeat, 50)):
+        fn(body)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(body)
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do parse do payload da Vapi (antigo x atual)")
+    parser.add_argument("--messages", type=int, nargs="+", default=[20, 60, 120])
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--assistant", default=DEFAULT_ASSISTANT)
+    args = parser.parse_args()
+
+    system_prompt = load_system_prompt(args.assistant) or "Você é a Tina, consultora da Barcelona Partners."
+    print(f"\n--- ⏱️ PARSE DO PAYLOAD DA VAPI (orjson {'ativo' if orjson is not None else 'ausente: usando json'}) ---")
+    print(f"{'mensagens':>10} {'tamanho':>10} {'antigo (µs)':>12} {'atual (µs)':>12} {'ganho':>7}")
+    for n_messages in args.messages:
+        body = build_payload(n_messages, system_prompt)
+        legacy = measure(legacy_path, body, args.repeat)
+        current = measure(current_path, body, args.repeat)
+        print(f"{n_messages:>10} {len(body) / 1024:>8.1f}KB {legacy:>12.1f} {current:>12.1f} {legacy / current:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
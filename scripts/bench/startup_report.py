@@ -0,0 +1,256 @@
+# scripts/bench/startup_report.py
+"""
+Relatório de boot da API: tempo de import por pacote, tempo/RSS de cada etapa do startup de um
+worker e, com --gunicorn, boot e memória por worker com e sem o preload (gunicorn.conf.py).
+
+Etapas em um processo novo (import do app -> preload -> build do agente):
+    python scripts/bench/startup_report.py
+Gunicorn de verdade (mocks de OpenAI/Pinecone), preload ligado x desligado:
+    python scripts/bench/startup_report.py --gunicorn --workers 4 --output data/bench/startup.json
+
+Memória por processo vem do /proc/<pid>/smaps_rollup (Linux): RSS conta as páginas divididas com o
+master em todos os workers; PSS divide cada página compartilhada entre quem a usa (soma = RAM real).
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT_DIR)
+
+from loadtest import _wait_ready, stop_stack
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)")
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+STARTUP_LINE = "Application startup complete"
+
+
+def bench_env(mock_port: int) -> Dict[str, str]:
+    # Mesmo ambiente do loadtest --spawn: nada sai da máquina
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    return {
+        **os.environ,
+        "PYTHONPATH": ROOT_DIR,
+        "OPENAI_API_KEY": "sk-bench",
+        "PINECONE_API_KEY": "bench",
+        "VAPI_API_KEY": os.environ.get("VAPI_API_KEY", "bench"),
+        "OPENAI_BASE_URL": f"{mock_url}/v1",
+        "PINECONE_CONTROLLER_HOST": mock_url,
+    }
+
+
+def memory_mb(pid: str = "self") -> Dict[str, float]:
+    """Campos do smaps_rollup em MB (Shared/Private somando clean + dirty)."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in SMAPS_FIELDS:
+                values[name] = int(rest.split()[0]) / 1024
+    return {
+        "rss": round(values.get("Rss", 0.0), 1),
+        "pss": round(values.get("Pss", 0.0), 1),
+        "shared": round(values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0), 1),
+        "private": round(values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0), 1),
+    }
+
+
+def child_pids(parent: int) -> List[int]:
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # O nome do processo vem entre parênteses e pode ter espaços: o ppid vem depois do ")"
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (FileNotFoundError, ProcessLookupError, IndexError):
+            continue
+        if int(fields[1]) == parent:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def import_report(env: Dict[str, str], top: int) -> dict:
+    """`python -X importtime -c "import app.main"`: total e os pacotes que mais pesam (tempo próprio somado)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True,
+    )
+    by_package: Dict[str, int] = defaultdict(int)
+    total_us = 0
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = int(match[1]), int(match[2]), match[3], match[4]
+        by_package[module.split(".")[0]] += self_us
+        if module == "app.main":
+            total_us = cumulative_us
+    ranked = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "total_ms": round(total_us / 1000, 1),
+        "packages_ms": {name: round(us / 1000, 1) for name, us in ranked},
+    }
+
+
+def run_phases():
+    """Roda dentro do processo filho (--phases-child): mede cada etapa do startup e imprime JSON."""
+    phases = {}
+
+    def mark(name: str, started: float, **extra):
+        phases[name] = {"seconds": round(time.perf_counter() - started, 3), **memory_mb(), **extra}
+
+    started = time.perf_counter()
+    import app.main  # noqa: F401
+    mark("import", started)
+
+    from app.services.registry import engine_registry
+
+    started = time.perf_counter()
+    stages = engine_registry.preload()
+    mark("preload", started, stages=stages)
+
+    started = time.perf_counter()
+    try:
+        engine_registry.build()
+        mark("build", started)
+    except Exception as e:
+        mark("build", started, error=str(e))
+    print(json.dumps(phases))
+
+
+def phases_report(env: Dict[str, str]) -> dict:
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--phases-child"],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "falhou")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def gunicorn_report(env: Dict[str, str], workers: int, port: int, preload: bool, timeout: float) -> dict:
+    """Sobe o gunicorn com o gunicorn.conf.py e mede até todos os workers terminarem o startup."""
+    env = {
+        **env,
+        "WEB_CONCURRENCY": str(workers),
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "GUNICORN_PRELOAD": "true" if preload else "false",
+        "PROMETHEUS_MULTIPROC_DIR": tempfile.mkdtemp(prefix="bench-prom-"),
+    }
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        ["gunicorn", "app.main:app", "-c", "gunicorn.conf.py", "--log-level", "info"],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    booted = threading.Event()
+    boot_times: List[float] = []
+
+    def read_logs():
+        for line in process.stderr:
+            if STARTUP_LINE in line:
+                boot_times.append(time.perf_counter() - started)
+                if len(boot_times) >= workers:
+                    booted.set()
+
+    threading.Thread(target=read_logs, daemon=True).start()
+    try:
+        if not booted.wait(timeout):
+            raise RuntimeError(f"{len(boot_times)}/{workers} workers subiram em {timeout:.0f}s")
+        _wait_ready(f"http://127.0.0.1:{port}/", 30)
+        master = memory_mb(str(process.pid))
+        per_worker = [memory_mb(str(pid)) for pid in child_pids(process.pid)]
+    finally:
+        stop_stack([process])
+
+    def mean(field: str) -> float:
+        return round(sum(w[field] for w in per_worker) / max(len(per_worker), 1), 1)
+
+    return {
+        "preload": preload,
+        "workers": len(per_worker),
+        "first_worker_s": round(boot_times[0], 2),
+        "all_workers_s": round(boot_times[-1], 2),
+        "master_mb": master,
+        "worker_mb": {field: mean(field) for field in ("rss", "pss", "shared", "private")},
+        "total_pss_mb": round(master["pss"] + sum(w["pss"] for w in per_worker), 1),
+    }
+
+
+def print_report(report: dict):
+    imports = report["imports"]
+    print(f"\n--- 🚀 BOOT DA API ---")
+    print(f"import app.main: {imports['total_ms']:.0f} ms | pacotes que mais pesam (tempo próprio):")
+    for name, ms in imports["packages_ms"].items():
+        print(f"   {name:<28} {ms:>8.1f} ms")
+
+    print(f"\n{'etapa':<10} {'s':>7} {'RSS MB':>8} {'PSS MB':>8}")
+    for name, phase in report["phases"].items():
+        note = f"  ⚠️ {phase['error']}" if phase.get("error") else ""
+        print(f"{name:<10} {phase['seconds']:>7.3f} {phase['rss']:>8.1f} {phase['pss']:>8.1f}{note}")
+    stages = report["phases"].get("preload", {}).get("stages")
+    if stages:
+        print(f"   preload: {stages}")
+
+    if report.get("gunicorn"):
+        print(f"\n{'preload':<8} {'workers':>7} {'1º s':>6} {'todos s':>8} {'RSS/w':>7} {'PSS/w':>7} "
+              f"{'priv/w':>7} {'master PSS':>11} {'PSS total':>10}")
+        for row in report["gunicorn"]:
+            w = row["worker_mb"]
+            print(f"{'sim' if row['preload'] else 'não':<8} {row['workers']:>7} {row['first_worker_s']:>6.2f} "
+                  f"{row['all_workers_s']:>8.2f} {w['rss']:>7.1f} {w['pss']:>7.1f} {w['private']:>7.1f} "
+                  f"{row['master_mb']['pss']:>11.1f} {row['total_pss_mb']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de import, boot e memória por worker da API")
+    parser.add_argument("--gunicorn", action="store_true", help="mede também o gunicorn com e sem preload")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--app-port", type=int, default=8020)
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--top", type=int, default=15, help="pacotes listados no tempo de import")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="grava o relatório em JSON")
+    parser.add_argument("--phases-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phases_child:
+        run_phases()
+        return
+
+    env = bench_env(args.mock_port)
+    mock = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "mock_upstreams.py"), "--port", str(args.mock_port)],
+        cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_ready(f"http://127.0.0.1:{args.mock_port}/v1/models", 30)
+        report = {"imports": import_report(env, args.top), "phases": phases_report(env)}
+        if args.gunicorn:
+            report["gunicorn"] = [
+                gunicorn_report(env, args.workers, args.app_port, preload, args.timeout)
+                for preload in (False, True)
+            ]
+    finally:
+        stop_stack([mock])
+
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Relatório salvo em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
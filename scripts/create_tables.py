@@ -1,10 +1,39 @@
-from app.db.session import engine
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+from app.db.session import dispose_engine, get_engine
 from app.models.lead import Base
+import app.models.outbox  # noqa: F401  (registra a tabela outbox_events no Base)
+
+# O create_all só cria o que não existe: numa tabela `leads` antiga, coluna, valor do enum e
+# índices novos do modelo Lead entram por aqui (idempotente, pode rodar a cada deploy)
+LEADS_UPGRADES = (
+    "ALTER TABLE leads ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITHOUT TIME ZONE",
+    # Linhas antigas sem updated_at ficariam fora da paginação por keyset (updated_at, id)
+    "UPDATE leads SET updated_at = COALESCE(created_at, now() AT TIME ZONE 'utc') WHERE updated_at IS NULL",
+    # O Enum do SQLAlchemy grava o nome do membro (EM_ATENDIMENTO), não o valor
+    "ALTER TYPE leadstatus ADD VALUE IF NOT EXISTS 'EM_ATENDIMENTO'",
+    "CREATE INDEX IF NOT EXISTS ix_leads_status_updated_at_id ON leads (status, updated_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_leads_updated_at_id ON leads (updated_at, id)",
+)
 
-def init_db():
+async def init_db():
     print("Criando tabelas no banco de dados...")
-    Base.metadata.create_all(bind=engine)
+    engine = get_engine()
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    # Autocommit: ALTER TYPE ... ADD VALUE não roda dentro de transação antes do Postgres 12
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for statement in LEADS_UPGRADES:
+            await conn.execute(text(statement))
+    await dispose_engine()
     print("Tabelas criadas com sucesso!")
 
 if __name__ == "__main__":
-    init_db()
+    asyncio.run(init_db())
@@ -0,0 +1,229 @@
+# scripts/eval/retrieval_eval.py
+"""
+Avaliação offline da busca na base de conhecimento: recall@k, MRR e latência da consulta para
+várias configurações de chunking, k e backend, com o custo por busca (tokens de contexto no prompt).
+
+    # 1ª vez (ou depois de mudar PDFs/perguntas): embeda o que falta no cache em disco
+    python scripts/eval/retrieval_eval.py --fill
+    # Daqui em diante roda sem rede, só com os embeddings em cache
+    python scripts/eval/retrieval_eval.py --chunk-sizes 600 1000 1500 --overlaps 100 150 --k 1 3 5 \\
+        --output data/eval/retrieval.json
+
+Backends:
+  local     LocalVectorIndex montado em memória para cada configuração de chunking (sem rede)
+  filtered  o mesmo índice, com a administradora/subcategoria citadas na pergunta como filtro
+  hybrid    filtered + BM25 dos mesmos trechos, fundidos por RRF (o que a API usa por padrão)
+  pinecone  índice publicado pelo scripts/ingest.py, como está (só o chunking atual; a consulta
+            vai ao Pinecone, o embedding da pergunta continua vindo do cache)
+
+Perguntas rotuladas em scripts/eval/questions.jsonl, uma por linha:
+    {"id": "tab-01", "question": "...", "administradora": "Ademicon", "categoria": "Tabela de Preços",
+     "subcategoria": "Pesados", "source": "TPF", "contains": ["1,2% de taxa de administracao"]}
+Um trecho conta como relevante se bate com os metadados e o `source` (parte do caminho do PDF)
+informados e contém todos os termos de `contains` (comparação sem acento/pontuação).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT_DIR)
+
+from app.core.config import settings
+from app.services.llm.tokens import count_tokens
+from app.services.rag.evaluation import (
+    ChunkedCorpus,
+    EmbeddingCache,
+    evaluate,
+    hybrid_search,
+    load_questions,
+    local_search,
+    rank_rows,
+)
+from app.services.rag.ingestion import BASE_DIR, CHUNK_OVERLAP, CHUNK_SIZE, count_tokens as count_embedding_tokens
+from app.services.rag.ingestion import discover_pdfs, load_pages
+
+DEFAULT_QUESTIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.jsonl")
+DEFAULT_CACHE_DIR = "data/eval_embeddings"
+LOCAL_BACKENDS = {"local", "filtered", "hybrid"}
+
+# US$ por 1M de tokens (text-embedding-3-small e entrada do gpt-4o-mini); ajuste com --*-price
+EMBEDDING_PRICE = 0.02
+LLM_INPUT_PRICE = 0.15
+
+
+def load_corpus_pages(workers: int) -> Dict[str, list]:
+    files = discover_pdfs(BASE_DIR)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pages = list(pool.map(load_pages, files.keys(), files.values()))
+    return dict(zip(files.keys(), pages))
+
+
+def openai_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(
+        api_key=settings.OPENAI_API_KEY,
+        model=settings.EMBEDDING_MODEL,
+        base_url=settings.OPENAI_BASE_URL,
+        check_embedding_ctx_length=False,
+    )
+
+
+def fill_cache(cache: EmbeddingCache, texts: List[str], batch_size: int):
+    """Embeda (OpenAI) só os textos que faltam no cache, salvando a cada lote."""
+    embeddings = openai_embeddings()
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        cache.add(batch, embeddings.embed_documents(batch))
+        cache.save()
+        print(f"🧮 {min(start + batch_size, len(texts))}/{len(texts)} embeddings no cache")
+
+
+def pinecone_search(query_vectors: Dict[str, np.ndarray]):
+    from langchain_pinecone import PineconeVectorStore
+
+    store = PineconeVectorStore(
+        index_name=settings.PINECONE_INDEX_NAME,
+        # Exigido pelo construtor; as consultas usam os vetores do cache
+        embedding=openai_embeddings(),
+        pinecone_api_key=settings.PINECONE_API_KEY,
+    )
+
+    def search(question, k):
+        results = store.similarity_search_by_vector_with_score(query_vectors[question.qid].tolist(), k=k)
+        return [doc for doc, _score in results]
+    return search
+
+
+def with_costs(row: dict, query_tokens: float, args) -> dict:
+    # Custo por busca: embedding da pergunta + trechos que entram no prompt do agente
+    per_lookup = (query_tokens * args.embedding_price + row["context_tokens"] * args.llm_price) / 1_000_000
+    row["usd_per_1k_lookups"] = round(per_lookup * 1000, 4)
+    return row
+
+
+def print_report(rows: List[dict], n_questions: int):
+    print(f"\n--- 🎯 AVALIAÇÃO DA BUSCA ({n_questions} perguntas) ---")
+    header = f"{'backend':<9} {'chunk':>9} {'k':>3} {'recall':>7} {'MRR':>6} {'p50 ms':>8} {'p95 ms':>8} {'ctx tok':>8} {'US$/1k':>7} {'chunks':>7} {'respondíveis':>13}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['backend']:<9} {row['chunking']:>9} {row['k']:>3} {row['recall']:>7.2f} {row['mrr']:>6.2f} "
+            f"{row['latency_ms']['p50']:>8.3f} {row['latency_ms']['p95']:>8.3f} {row['context_tokens']:>8.0f} "
+            f"{row['usd_per_1k_lookups']:>7.3f} {row['chunks']:>7} {row['answerable']:>13}"
+        )
+
+    best = rows[0]
+    print(f"\n🏆 Melhor: {best['backend']} chunk {best['chunking']} k={best['k']} — recall@k por administradora/categoria:")
+    for group, stats in best["groups"].items():
+        print(f"   {group:<40} n={stats['n']:<3} recall={stats['recall']:.2f} MRR={stats['mrr']:.2f}")
+    if best["misses"]:
+        print(f"   Sem trecho relevante no top-{best['k']}: {', '.join(best['misses'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avaliação offline da busca (recall@k, MRR, latência, custo)")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[600, CHUNK_SIZE, 1500])
+    parser.add_argument("--overlaps", type=int, nargs="+", default=[CHUNK_OVERLAP])
+    parser.add_argument("--k", type=int, nargs="+", default=[1, settings.RAG_TOP_K, 5])
+    parser.add_argument("--backends", nargs="+", choices=["local", "filtered", "hybrid", "pinecone"],
+                        default=["local", "hybrid"])
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Onde ficam os embeddings em cache.")
+    parser.add_argument("--fill", action="store_true", help="Embeda (com rede) o que faltar no cache antes de avaliar.")
+    parser.add_argument("--batch-size", type=int, default=settings.INGEST_EMBED_BATCH_SIZE)
+    parser.add_argument("--repeat", type=int, default=20, help="Repetições de cada consulta para a latência.")
+    parser.add_argument("--workers", type=int, default=None, help="Processos para ler os PDFs.")
+    parser.add_argument("--embedding-price", type=float, default=EMBEDDING_PRICE, help="US$ por 1M tokens de embedding.")
+    parser.add_argument("--llm-price", type=float, default=LLM_INPUT_PRICE, help="US$ por 1M tokens de entrada do LLM.")
+    parser.add_argument("--output", help="Grava o relatório completo em JSON.")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    started = time.perf_counter()
+    pages = load_corpus_pages(args.workers or os.cpu_count() or 1)
+    corpora = [
+        ChunkedCorpus(pages, chunk_size, overlap)
+        for chunk_size in args.chunk_sizes
+        for overlap in args.overlaps
+        if overlap < chunk_size
+    ]
+    print(f"📚 {len(pages)} PDFs | {len(corpora)} configurações de chunking | {time.perf_counter() - started:.1f}s")
+
+    # 1. Embeddings: tudo vem do cache; sem --fill, falta de embedding é erro (a avaliação não vai à rede)
+    cache = EmbeddingCache(args.cache_dir, settings.EMBEDDING_MODEL)
+    needed = [q.question for q in questions]
+    if LOCAL_BACKENDS & set(args.backends):
+        needed += [text for corpus in corpora for text in corpus.texts]
+    missing = cache.missing(needed)
+    if missing and not args.fill:
+        tokens = count_embedding_tokens(missing)
+        print(f"❌ {len(missing)} textos sem embedding em {cache.directory} (~{tokens:,} tokens, "
+              f"~US$ {tokens * args.embedding_price / 1_000_000:.4f}). Rode com --fill uma vez.")
+        sys.exit(1)
+    if missing:
+        fill_cache(cache, missing, args.batch_size)
+
+    query_vectors = {q.qid: cache.matrix([q.question])[0] for q in questions}
+    query_tokens = count_embedding_tokens([q.question for q in questions]) / max(len(questions), 1)
+
+    def context_tokens(text: str) -> int:
+        return count_tokens(text, settings.OPENAI_MODEL)
+
+    # 2. Cada configuração x backend x k
+    rows = []
+    for corpus in corpora if LOCAL_BACKENDS & set(args.backends) else []:
+        index = corpus.build_index(cache)
+        searches = {
+            "local": lambda: local_search(index, query_vectors),
+            "filtered": lambda: hybrid_search(index, query_vectors, None, settings.RAG_HYBRID_CANDIDATES, settings.RAG_RRF_K),
+            "hybrid": lambda: hybrid_search(index, query_vectors, corpus.build_lexical_index(),
+                                            settings.RAG_HYBRID_CANDIDATES, settings.RAG_RRF_K),
+        }
+        info = {
+            "chunking": corpus.label,
+            "chunks": len(corpus.ids),
+            "answerable": sum(corpus.answerable(q) for q in questions),
+            "ingest_embedding_tokens": corpus.embedding_tokens(),
+            "index_mb": round(index.vectors.nbytes / 1024 / 1024, 2),
+        }
+        for backend in (name for name in searches if name in args.backends):
+            for row in evaluate(questions, searches[backend](), args.k, context_tokens,
+                                normalized=corpus.normalized, repeat=args.repeat):
+                rows.append(with_costs({"backend": backend, **info, **row}, query_tokens, args))
+
+    if "pinecone" in args.backends:
+        try:
+            search = pinecone_search(query_vectors)
+            info = {"backend": "pinecone", "chunking": f"{CHUNK_SIZE}/{CHUNK_OVERLAP}", "chunks": "-",
+                    "answerable": "-", "ingest_embedding_tokens": None, "index_mb": None}
+            # Consulta de rede: poucas repetições bastam para a latência
+            for row in evaluate(questions, search, args.k, context_tokens, repeat=min(args.repeat, 3)):
+                rows.append(with_costs({**info, **row}, query_tokens, args))
+        except Exception as e:
+            print(f"⚠️ Pinecone indisponível, backend ignorado: {e}")
+
+    if not rows:
+        print("❌ Nenhum backend avaliado.")
+        sys.exit(1)
+
+    rows = rank_rows(rows)
+    print_report(rows, len(questions))
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"questions": len(questions), "embedding_model": settings.EMBEDDING_MODEL, "rows": rows},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Relatório salvo em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,75 +1,310 @@
+import argparse
+import asyncio
 import os
+import random
 import sys
-# O import correto para a versão nova:
-from langchain_pinecone import PineconeVectorStore 
-from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Adiciona a raiz do projeto ao path (antes de importar o pacote app)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openai
 from langchain_openai import OpenAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter # <-- ADICIONE ESTA LINHA
 from langchain_pinecone import PineconeVectorStore
 from app.core.config import settings
+from app.services.rag.cache import publish_index_version
+from app.services.rag.ingestion import BASE_DIR, IngestionManifest, discover_pdfs, load_and_split, parse_pdf_task
+from app.services.rag.lexical_index import POSTINGS_FILE, BM25Index
+from app.services.rag.local_index import LocalVectorIndex, current_version_dir
+from app.services.rag.price_tables import PLANS_FILE, TABLE_CATEGORY, PriceTableStore, parse_price_table
 
-# Adiciona a raiz do projeto ao path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Erros transitórios da OpenAI que valem nova tentativa (429, timeout, 5xx)
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
 
-def ingest_hierarchical_knowledge():
-    print("🚀 Iniciando ingestão hierárquica por Administradora...")
-    os.environ["PINECONE_API_KEY"] = settings.PINECONE_API_KEY
-    
-    # Caminho raiz: \base_conhecimento\Administradoras
-    base_dir = "base_conhecimento/Administradoras"
-    all_chunks = []
-
-    # 1. Percorre as pastas das Administradoras (Ademicon, Porto Seguro, etc.)
-    for admin_name in os.listdir(base_dir):
-        admin_path = os.path.join(base_dir, admin_name)
-        
-        if os.path.isdir(admin_path):
-            print(f"📁 Processando Administradora: {admin_name}")
-            
-            # 2. Carrega arquivos da RAIZ da pasta (Institucional)
-            # Usamos glob="*" para pegar arquivos direto na pasta da admin
-            root_loader = DirectoryLoader(admin_path, glob="./*.pdf", loader_cls=PyPDFLoader)
-            root_docs = root_loader.load()
-            
-            for doc in root_docs:
-                doc.metadata["administradora"] = admin_name
-                doc.metadata["categoria"] = "Institucional"
-            
-            # 3. Carrega arquivos da pasta TABELAS
-            tables_path = os.path.join(admin_path, "Tabelas")
-            if os.path.exists(tables_path):
-                print(f"   📊 Carregando tabelas de {admin_name}...")
-                tables_loader = DirectoryLoader(tables_path, glob="**/*.pdf", loader_cls=PyPDFLoader)
-                table_docs = tables_loader.load()
-                
-                for doc in table_docs:
-                    doc.metadata["administradora"] = admin_name
-                    doc.metadata["categoria"] = "Tabela de Preços"
-                    # Captura se é Imóvel, Automóvel, etc (pela subpasta de Tabelas)
-                    subcat = os.path.basename(os.path.dirname(doc.metadata.get("source", "")))
-                    doc.metadata["subcategoria"] = subcat if subcat != "Tabelas" else "Geral"
-
-                root_docs.extend(table_docs)
-
-            # 4. Quebrar em Chunks e adicionar ao lote final
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=150)
-            chunks = text_splitter.split_documents(root_docs)
-            all_chunks.extend(chunks)
-
-    # 5. Enviar para o Pinecone
-    if all_chunks:
-        
-        embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            api_key=settings.OPENAI_API_KEY
+UPSERT_BATCH_SIZE = 100
+
+
+class PineconeSink:
+    """Destino Pinecone: upsert em lote por ID (idempotente) com vetores já calculados."""
+
+    def __init__(self, embeddings):
+        self.store = PineconeVectorStore(
+            index_name=settings.PINECONE_INDEX_NAME,
+            embedding=embeddings,
+            pinecone_api_key=settings.PINECONE_API_KEY
         )
-        print(f"📡 Enviando {len(all_chunks)} blocos para o Pinecone...")
-        PineconeVectorStore.from_documents(
-            all_chunks, 
-            embeddings, 
-            index_name="barcelona-index"
+
+    def upsert(self, ids, vectors, chunks):
+        # Mesmo formato que o PineconeVectorStore grava (texto no metadado `text`)
+        records = [
+            {"id": doc_id, "values": vector, "metadata": {**chunk.metadata, self.store._text_key: chunk.page_content}}
+            for doc_id, vector, chunk in zip(ids, vectors, chunks)
+        ]
+        for start in range(0, len(records), UPSERT_BATCH_SIZE):
+            self.store._index.upsert(vectors=records[start:start + UPSERT_BATCH_SIZE])
+
+    def delete(self, ids):
+        for start in range(0, len(ids), 1000):
+            self.store.delete(ids=ids[start:start + 1000])
+
+    def commit(self):
+        pass
+
+
+class LocalSink:
+    """Destino local: atualiza o LocalVectorIndex em memória e grava no disco no final."""
+
+    def __init__(self, embeddings):
+        self.index = LocalVectorIndex.load(settings.LOCAL_INDEX_DIR, mmap=False)
+        # Os lotes chegam de várias threads do pipeline ao mesmo tempo
+        self._lock = threading.Lock()
+
+    def upsert(self, ids, vectors, chunks):
+        with self._lock:
+            self.index = self.index.upsert(ids, vectors, chunks)
+
+    def delete(self, ids):
+        self.index = self.index.delete(ids)
+
+    def commit(self):
+        self.index.save(settings.LOCAL_INDEX_DIR)
+
+
+class ThroughputReport:
+    """Acompanha o progresso e a vazão do pipeline (páginas/s, chunks/s, tokens/s)."""
+
+    def __init__(self, total_files: int):
+        self.total_files = total_files
+        self.files = 0
+        self.pages = 0
+        self.chunks = 0
+        self.tokens = 0
+        self.embedded = 0
+        self.retries = 0
+        self.started = time.perf_counter()
+
+    def _rate(self, value: int) -> float:
+        return value / max(time.perf_counter() - self.started, 1e-6)
+
+    def parsed(self, result: dict):
+        self.files += 1
+        self.pages += result["pages"]
+        self.chunks += len(result["chunks"])
+        self.tokens += result["tokens"]
+
+    def line(self) -> str:
+        return (
+            f"📈 {self.files}/{self.total_files} arquivos | "
+            f"{self._rate(self.pages):.1f} págs/s | "
+            f"{self._rate(self.embedded):.1f} chunks/s embedados | "
+            f"{self._rate(self.tokens):,.0f} tokens/s"
+        )
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        return (
+            f"⏱️ {elapsed:.1f}s | {self.pages} páginas | {self.chunks} chunks | "
+            f"{self.tokens:,} tokens | {self.retries} retentativas\n{self.line()}"
         )
-        print("✅ Base de conhecimento atualizada com sucesso!")
+
+
+class IngestionPipeline:
+    """
+    Pipeline em três estágios que se sobrepõem:
+      1. Pool de processos lê e quebra os PDFs (CPU, um núcleo por PDF)
+      2. Embedding assíncrono em lotes, com concorrência limitada e retry com backoff
+      3. Upsert em lote no índice assim que cada lote volta da OpenAI
+    """
+
+    def __init__(self, sink, embeddings, workers: int, batch_size: int, concurrency: int, max_retries: int):
+        self.sink = sink
+        self.embeddings = embeddings
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def _embed_with_retry(self, texts, report: ThroughputReport):
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.semaphore:
+                    return await self.embeddings.aembed_documents(texts)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                report.retries += 1
+                # Respeita o Retry-After do 429 quando vier; senão backoff exponencial com jitter
+                retry_after = None
+                response = getattr(e, "response", None)
+                if response is not None:
+                    retry_after = response.headers.get("retry-after")
+                delay = float(retry_after) if retry_after else min(2 ** attempt, 30) + random.random()
+                print(f"⏳ {type(e).__name__}: nova tentativa em {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+
+    async def _embed_and_upsert(self, result: dict, report: ThroughputReport):
+        ids, chunks = result["ids"], result["chunks"]
+
+        async def one_batch(start: int):
+            batch_chunks = chunks[start:start + self.batch_size]
+            vectors = await self._embed_with_retry([chunk.page_content for chunk in batch_chunks], report)
+            # O cliente do Pinecone é síncrono: o upsert vai para uma thread e não para o embedding
+            await asyncio.to_thread(self.sink.upsert, ids[start:start + self.batch_size], vectors, batch_chunks)
+            report.embedded += len(batch_chunks)
+
+        await asyncio.gather(*(one_batch(start) for start in range(0, len(chunks), self.batch_size)))
+
+    async def run(self, files: dict, manifest: IngestionManifest, report: ThroughputReport) -> list:
+        """Processa os arquivos e devolve os IDs antigos que precisam ser apagados."""
+        loop = asyncio.get_running_loop()
+        stale_ids = []
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            parse_jobs = [loop.run_in_executor(pool, parse_pdf_task, path, meta) for path, meta in files.items()]
+            upload_jobs = []
+
+            async def upload(result: dict):
+                if result["chunks"]:
+                    await self._embed_and_upsert(result, report)
+                # Só registra no manifesto depois que todos os lotes do arquivo subiram
+                stale_ids.extend(set(manifest.chunk_ids(result["path"])) - set(result["ids"]))
+                manifest.record(result["path"], result["ids"])
+                print(f"📄 {result['path']} ({len(result['chunks'])} chunks)\n{report.line()}")
+
+            for job in asyncio.as_completed(parse_jobs):
+                result = await job
+                report.parsed(result)
+                upload_jobs.append(asyncio.create_task(upload(result)))
+
+            await asyncio.gather(*upload_jobs)
+        return stale_ids
+
+
+def build_price_tables(current: dict, workers: int):
+    """Extrai a grade crédito x prazo -> parcela de todos os PDFs de Tabelas para o lookup exato."""
+    table_files = {path: meta for path, meta in current.items() if meta.get("categoria") == TABLE_CATEGORY}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        tables = list(pool.map(parse_price_table, table_files.keys(), table_files.values()))
+
+    for path, table in zip(table_files, tables):
+        if table is None:
+            print(f"⚠️ Sem grade de preços reconhecível: {path}")
+    store = PriceTableStore.from_tables([table for table in tables if table is not None])
+    store.save(settings.PRICE_TABLES_DIR)
+    print(f"💲 Tabelas de preço: {len(store)} linhas (cota x prazo) em {settings.PRICE_TABLES_DIR}")
+
+
+def build_lexical_index(current: dict, workers: int):
+    """
+    Refaz o índice BM25 com todos os trechos da base (mesmo chunking e mesmos IDs do índice vetorial).
+    Só CPU, sem embedding: é reconstruído inteiro porque o idf depende do corpus todo.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(load_and_split, current.keys(), current.values()))
+
+    ids = [doc_id for file_ids, _chunks in results for doc_id in file_ids]
+    chunks = [chunk for _ids, file_chunks in results for chunk in file_chunks]
+    index = BM25Index.build(ids, chunks)
+    index.save(settings.LEXICAL_INDEX_DIR)
+    print(f"🔤 Índice BM25: {len(index)} trechos, {len(index.vocab):,} termos em {settings.LEXICAL_INDEX_DIR}")
+
+
+def ingest_hierarchical_knowledge(
+    full: bool = False,
+    workers: int = None,
+    batch_size: int = None,
+    concurrency: int = None,
+    max_retries: int = 6,
+):
+    print("🚀 Iniciando ingestão incremental por Administradora...")
+    os.environ["PINECONE_API_KEY"] = settings.PINECONE_API_KEY
+
+    # 1. Descobre os PDFs (Institucional + Tabelas) e compara com o manifesto
+    current = discover_pdfs(BASE_DIR)
+    manifest = IngestionManifest.load(settings.INGEST_MANIFEST_FILE, settings.VECTOR_BACKEND)
+    changed, unchanged, removed = manifest.plan(current)
+    if full:
+        # Reprocessa tudo, mas continua usando o manifesto para apagar os vetores antigos
+        changed, unchanged = changed + unchanged, []
+
+    print(f"📋 {len(changed)} novos/alterados | {len(unchanged)} sem mudança | {len(removed)} removidos")
+    workers = workers or os.cpu_count() or 1
+
+    # Tabelas de preço estruturadas: refaz quando algum PDF de Tabelas mudou ou ainda não existem
+    # (arquivos removidos não estão mais em `current`: reconhece pela pasta Tabelas/)
+    tables_touched = any(current[path]["categoria"] == TABLE_CATEGORY for path in changed) or any(
+        f"{os.sep}Tabelas{os.sep}" in path for path in removed
+    )
+    if tables_touched or not os.path.exists(os.path.join(settings.PRICE_TABLES_DIR, PLANS_FILE)):
+        build_price_tables(current, workers)
+
+    # Índice lexical da busca híbrida: refeito quando algo mudou na base ou se ainda não existe
+    lexical_missing = not os.path.exists(os.path.join(current_version_dir(settings.LEXICAL_INDEX_DIR), POSTINGS_FILE))
+    lexical_built = settings.RAG_HYBRID_ENABLED and bool(changed or removed or lexical_missing)
+    if lexical_built:
+        build_lexical_index(current, workers)
+
+    if not changed and not removed:
+        manifest.save()
+        if lexical_built:
+            # Só o BM25 foi criado: os caches de busca da API precisam ver a nova versão
+            publish_index_version()
+        print("✅ Nada para atualizar. Base de conhecimento já está em dia.")
+        return
+
+    embeddings = OpenAIEmbeddings(
+        model=settings.EMBEDDING_MODEL,
+        api_key=settings.OPENAI_API_KEY
+    )
+    sink = LocalSink(embeddings) if settings.VECTOR_BACKEND == "local" else PineconeSink(embeddings)
+
+    # 2. Só os PDFs novos/alterados passam pelo pipeline (parse -> embedding -> upsert)
+    pipeline = IngestionPipeline(
+        sink,
+        embeddings,
+        workers=workers,
+        batch_size=batch_size or settings.INGEST_EMBED_BATCH_SIZE,
+        concurrency=concurrency or settings.INGEST_EMBED_CONCURRENCY,
+        max_retries=max_retries,
+    )
+    report = ThroughputReport(total_files=len(changed))
+    stale_ids = asyncio.run(pipeline.run({path: current[path] for path in changed}, manifest, report))
+
+    # 3. Arquivos apagados da pasta: remove os vetores deles do índice
+    for path in removed:
+        print(f"🗑️ Removendo vetores de {path}")
+        stale_ids.extend(manifest.forget(path))
+
+    if stale_ids:
+        sink.delete(stale_ids)
+    sink.commit()
+    manifest.save()
+    print(report.summary())
+
+    # 4. Publica a nova versão do índice: os caches de busca da API são invalidados
+    version = publish_index_version()
+    print(f"✅ Base de conhecimento atualizada com sucesso! (versão do índice: {version})")
+
 
 if __name__ == "__main__":
-    ingest_hierarchical_knowledge()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ingestão da base de conhecimento das administradoras.")
+    parser.add_argument("--full", action="store_true", help="Reprocessa todos os PDFs, ignorando o manifesto.")
+    parser.add_argument("--workers", type=int, default=None, help="Processos para ler os PDFs (padrão: núcleos da CPU).")
+    parser.add_argument("--batch-size", type=int, default=None, help="Chunks por chamada de embedding.")
+    parser.add_argument("--concurrency", type=int, default=None, help="Chamadas de embedding simultâneas.")
+    parser.add_argument("--max-retries", type=int, default=6, help="Tentativas em caso de rate limit/timeout.")
+    args = parser.parse_args()
+    ingest_hierarchical_knowledge(
+        full=args.full,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        max_retries=args.max_retries,
+    )
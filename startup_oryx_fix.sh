@@ -21,6 +21,10 @@ WORKERS="${WEB_CONCURRENCY:-2}"
 # Aumentamos o timeout para 600 para evitar que o Azure mate o worker durante o cold start
 TIMEOUT="${GUNICORN_TIMEOUT:-600}"
 
+# Métricas do Prometheus compartilhadas entre os workers (limpa as do boot anterior)
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 # 4. Seleção de Módulo Fixa (Arquitetura Enterprise)
 # Em vez de IFs, definimos o padrão. Se você usa a estrutura do setup_full_project.py, 
 # o ponto de entrada é SEMPRE app.main:app
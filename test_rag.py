@@ -1,4 +1,5 @@
 # test_rag.py
+import asyncio
 import os
 import sys
 
@@ -22,8 +23,8 @@ def test_tina_knowledge():
         try:
             # Chama a ferramenta exatamente como a Tina faz
             #resposta = search_knowledge_base(pergunta)
-            # Use .invoke para passar o dicionário de argumentos que a ferramenta espera
-            resposta = search_knowledge_base.invoke({"query": pergunta})
+            # A ferramenta agora é assíncrona: use .ainvoke com o dicionário de argumentos
+            resposta = asyncio.run(search_knowledge_base.ainvoke({"query": pergunta}))
             print("\n--- RETORNO DO PINECONE ---")
             print(resposta)
             print("--------------------------")